@@ -4,21 +4,35 @@
 import os
 import numpy as np
 import pandas as pd
-import json
-import re
+import sys
+from pathlib import Path
+
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from CalibrationFile import load_calibration
+from SpectrumSet import SpectrumSet
+from BandIntegration import BandIntegrator
 # --- Parámetros configurables ---
 od_folder = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\Datos19mayo\RC6\OD_resultados'
-rango_min, rango_max = 649, 705
-# Leer los parámetros de calibración desde un archivo JSON
-with open('parametros_calibracion.json', 'r') as f:
-    parametros = json.load(f)
+# Leer los parámetros de calibración (.rccal, o el JSON anterior si no existe)
+archivo_calibracion = 'parametros_calibracion.rccal'
+if not os.path.isfile(archivo_calibracion):
+    archivo_calibracion = 'parametros_calibracion.json'
+calibracion = load_calibration(archivo_calibracion)
+parametros = calibracion.as_dict()
+
+# Ventana de integración usada en la calibración (metadatos del .rccal o campos
+# x_min/x_max del JSON anterior); 649-705 nm solo si el archivo no la guarda
+rango_min = calibracion.metadata.get('x_min', parametros.get('x_min', 649))
+rango_max = calibracion.metadata.get('x_max', parametros.get('x_max', 705))
 
 slope_int = parametros['slope']
 intercept_int = parametros['intercept']
-slope_err = parametros['std_err']
+slope_err = parametros['slope_err']
 intercept_err = parametros['intercept_err']
 # Mostrar los parámetros de calibración
-print(f"📈 Usando calibración: dosis = {slope_int:.4f} * área + {intercept_int:.4f}")
+print(f"📈 Usando calibración: área = {slope_int:.4f} * dosis + {intercept_int:.4f}")
+print(f"📏 Ventana de integración: {rango_min:g}-{rango_max:g} nm")
        # pendiente de la recta (inversa del coeficiente)
 
 
@@ -27,97 +41,41 @@ resultados = []
 
 
 
-def orden_natural(texto):
-    return [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', texto)]
-
-
-
 # --- Procesamiento de archivos ---
-for archivo in sorted((f for f in os.listdir(od_folder) if f.endswith('.txt')), key=orden_natural):
-    if not archivo.endswith('.txt'):
-        continue
-
-    ruta_archivo = os.path.join(od_folder, archivo)
-
-    try:
-        df = pd.read_csv(
-            ruta_archivo,
-            sep=r'\s+',
-            engine='python',
-            header=None,
-            skiprows=19,
-            nrows=1000, 
-            usecols=(0, 1),
-            comment='#'
-        )
-    except Exception as e:
-        print(f"❌ Error al leer {archivo}: {e}")
-        continue
-
-    if df.shape[1] < 2:
-        print(f"⚠️ Archivo {archivo} no tiene suficientes columnas.")
-        continue
-
-    try:
-        x = df[0].astype(float).values
-        y = df[1].astype(float).values
-    except ValueError as e:
-        print(f"⚠️ Error de conversión en {archivo}: {e}")
-        continue
-
-    # Filtrar el rango de interés
-    mascara = (x >= rango_min) & (x <= rango_max)
-    x_filtrado = x[mascara]
-    y_filtrado = y[mascara]
-
-    if len(x_filtrado) < 2:
-        print(f"⚠️ Muy pocos datos en el rango {rango_min}-{rango_max} nm en {archivo}")
-        continue
-
-    # Integración y cálculo de dosis
-    area = np.trapezoid(y_filtrado, x_filtrado)
-    # Suponiendo x_filtrado es tu array de abscisas:
-    x = x_filtrado
-    n = len(x)
-    w = np.empty(n)
-
-    # Peso en el primer punto
-    w[0] = (x[1] - x[0]) / 2
-    # Pesos en los puntos intermedios
-    w[1:-1] = (x[2:] - x[:-2]) / 2
-    # Peso en el último punto
-    w[-1] = (x[-1] - x[-2]) / 2
-
-    # Ahora puedes calcular area_err (si sigma_y = 0.01 constante)
-    area_err = 0.01 * np.sqrt(np.sum(w**2))
-    # Calcular la dosis usando la regresión lineal
-    if slope_int == 0:
-        print(f"⚠️ Error: pendiente de la recta de calibración es cero en {archivo}. No se puede calcular la dosis.")
-        continue
-    dosis = 1 / slope_int * area + intercept_int / slope_int
-                # Para y = m*x, la inversa es x = y/m
-                # Derivada parcial
+# Todos los espectros en una matriz; áreas y sus errores en una sola llamada
+espectros = SpectrumSet.from_folder(od_folder)
+banda = BandIntegrator(espectros.wavelength, [(rango_min, rango_max)])
+areas = banda(espectros.values)[:, 0]
+# Error del área si sigma_y = 0.01 constante: 0.01 * sqrt(sum(w**2)), w pesos del trapecio
+areas_err = banda.errors(0.01)[0]
+
+if not banda.valid[0]:
+    print(f"⚠️ Muy pocos datos en el rango {rango_min}-{rango_max} nm")
+elif slope_int == 0:
+    print("⚠️ Error: pendiente de la recta de calibración es cero. No se puede calcular la dosis.")
+else:
+    # Recta área = m·dosis + b  →  dosis = (área - b) / m
+    dosis = (areas - intercept_int) / slope_int
     # derivadas parciales
-    d_d_m = -area/(slope_int**2)
-    d_d_area = 1/slope_int
-    d_d_b = -1/slope_int
-    area_err = 0.01 * np.sqrt(np.sum(w**2))
+    d_d_m = -(areas - intercept_int) / slope_int**2
+    d_d_area = 1 / slope_int
+    d_d_b = -1 / slope_int
 
     # propagación combinada
     error = np.sqrt(
-    (d_d_m   * slope_err)**2 +
-    (d_d_area* area_err )**2 +
-    (d_d_b   * intercept_err)**2
+        (d_d_m    * slope_err)**2 +
+        (d_d_area * areas_err)**2 +
+        (d_d_b    * intercept_err)**2
     )
 
-
-    print(f"✅ {archivo}: dosis = {dosis:.3f} Gy, error = {error:.3f} Gy")
-    resultados.append({
-        'Archivo': archivo,
-        'Integrado_OD': area,
-        'Dosis': dosis,
-        'Error': error,
-    })
+    for archivo, area, d, e in zip(espectros.names, areas, dosis, error):
+        print(f"✅ {archivo}: dosis = {d:.3f} Gy, error = {e:.3f} Gy")
+        resultados.append({
+            'Archivo': archivo,
+            'Integrado_OD': area,
+            'Dosis': d,
+            'Error': e,
+        })
 
 # --- Guardar resultados ---
 if resultados:
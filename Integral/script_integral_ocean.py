@@ -4,13 +4,18 @@ Este script integra el área bajo la curva de espectros radiocrómicos en un ran
 y ajusta una recta a (Dosis, Área). Produce figura con barras de error y estilo científico.
 """
 
-import os
-import re
-import json
+import sys
+from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
 
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from CalibrationFile import CalibrationFile
+from SpectrumSet import SpectrumSet
+from BandIntegration import scan_windows, best_window
+
 # ---------- CONFIGURACIÓN ----------
 x_min = 649
 x_max = 705
@@ -19,42 +24,27 @@ carpeta = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\Integral\2025_04_28
 # Si conoces la dosis de cada archivo (orden natural), ponla aquí:
 valores_x = [0.1, 0.3, 0.5, 0.7, 1, 2, 4, 6, 8, 10, 12, 14, 16, 18, 20]
 
+# Búsqueda de la ventana de integración: se informa siempre de la mejor
+# ventana en 400-800 nm; con usar_ventana_optima se integra en ella en lugar
+# de [x_min, x_max]. criterio_ventana: "r2" o "dose_sigma" (incertidumbre en dosis)
+usar_ventana_optima = False
+criterio_ventana = "dose_sigma"
+ancho_minimo = 5.0  # nm
+
 # Si tienes incertidumbres por punto (misma longitud que valores_x) ponlas aquí (opcional):
 areas_err = None  # ejemplo: [0.01, 0.01, ...]  # o deja en None
 
 # ---------- UTILIDADES ----------
-def orden_natural(texto):
-    """Orden tipo humano: archivo2.txt < archivo10.txt."""
-    return [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', texto)]
-
 def leer_archivos_txt(carpeta):
-    """Lee todos los .txt de la carpeta, ordenados de forma natural."""
-    archivos = sorted((f for f in os.listdir(carpeta) if f.lower().endswith('.txt')),
-                      key=orden_natural)
-    datos = {}
-    for archivo in archivos:
-        ruta = os.path.join(carpeta, archivo)
-        try:
-            # Ajusta skiprows / max_rows si tu formato cambia
-            data = np.loadtxt(ruta, skiprows=19, max_rows=1000, usecols=(0, 1))
-            if data.ndim == 1:  # por seguridad, re-forma a Nx2
-                data = data.reshape(-1, 2)
-            datos[archivo] = data
-        except Exception as e:
-            print(f"Error al leer {archivo}: {e}")
-    return datos
-
-def integrar_area(data, x_min, x_max):
-    """Integra el área por trapecios en [x_min, x_max]."""
-    x = data[:, 0]
-    y = data[:, 1]
-    mask = (x >= x_min) & (x <= x_max)
-    x_rango = x[mask]
-    y_rango = y[mask]
-    if x_rango.size < 2:
+    """Lee todos los .txt de la carpeta en un SpectrumSet, en orden natural."""
+    return SpectrumSet.from_folder(carpeta)
+
+def integrar_area(datos, x_min, x_max):
+    """Áreas por trapecios en [x_min, x_max] de todos los espectros a la vez (NaN si no hay puntos)."""
+    areas = datos.integrate((x_min, x_max))
+    if np.isnan(areas).all():
         print("⚠️ Muy pocos puntos para integrar en el rango.")
-        return None
-    return np.trapezoid(y_rango, x_rango)
+    return areas
 
 def graficar_espectros(datos):
     """Grafica todos los espectros con estilo LaTeX."""
@@ -65,9 +55,8 @@ def graficar_espectros(datos):
         "axes.spines.right": False,
     })
     fig, ax = plt.subplots(figsize=(6.6, 4.4), dpi=120)
-    for archivo, data in datos.items():
-        if data.ndim == 2 and data.shape[1] >= 2:
-            ax.plot(data[:, 0], data[:, 1], lw=1.0, label=archivo)
+    for wl, od, info in datos:
+        ax.plot(wl, od, lw=1.0, label=info['name'])
     ax.set_xlabel(r'Longitud de onda (nm)')
     ax.set_ylabel(r'Densidad óptica (OD)')
     ax.tick_params(direction='in', which='both')
@@ -81,22 +70,39 @@ def graficar_espectros(datos):
 datos = leer_archivos_txt(carpeta)
 
 # Reporte rápido
-if not datos:
+if not len(datos):
     raise RuntimeError("No se encontraron archivos .txt legibles en la carpeta especificada.")
 
 # Integra cada archivo (orden natural) y asocia a valores_x
-archivos_ordenados = sorted(datos.keys(), key=orden_natural)
+archivos_ordenados = datos.names
 
 if len(valores_x) != len(archivos_ordenados):
     print(f"⚠️ Atención: número de dosis ({len(valores_x)}) ≠ número de archivos ({len(archivos_ordenados)}).")
     print("   Se tomarán solo los primeros min(n_archivos, n_dosis) pares en orden natural.")
 N = min(len(valores_x), len(archivos_ordenados))
 
+# ---------- VENTANA DE INTEGRACIÓN ----------
+# Todas las ventanas [x_i, x_j] a la vez, con integrales acumuladas (O(1) por ventana)
+# Es solo informativo: si falla (menos de 3 espectros, ninguna ventana válida)
+# se avisa y se sigue con la ventana fija [x_min, x_max]
+try:
+    barrido = scan_windows(datos.wavelength, datos.values[:N], valores_x[:N], (400, 800), ancho_minimo)
+    for criterio, nombre in (("r2", "máximo R²"), ("dose_sigma", "mínima incertidumbre en dosis")):
+        v = best_window(barrido, criterio)
+        print(f"🔎 Ventana de {nombre}: {v['x_min']:.1f}-{v['x_max']:.1f} nm "
+              f"(R² = {v['r2']:.5f}, σ_D = {v['dose_sigma']:.3f} Gy)")
+    if usar_ventana_optima:
+        v = best_window(barrido, criterio_ventana)
+        x_min, x_max = v['x_min'], v['x_max']
+        print(f"   Se integra en {x_min:.1f}-{x_max:.1f} nm")
+except ValueError as e:
+    print(f"⚠️ No se pudo buscar la ventana óptima ({e}); se integra en {x_min}-{x_max} nm")
+
 areas = []
+areas_todas = integrar_area(datos, x_min, x_max)  # una sola llamada para todos los espectros
 for i in range(N):
     archivo = archivos_ordenados[i]
-    data = datos[archivo]
-    area = integrar_area(data, x_min, x_max)
+    area = None if np.isnan(areas_todas[i]) else float(areas_todas[i])
     areas.append((archivo, area))
     if area is not None:
         print(f"→ {archivo}: Área = {area:.6f}")
@@ -151,18 +157,14 @@ else:
     yerr_plot = np.full_like(areas_filtradas, rmse)
 
 # ---------- GUARDAR RESULTADOS ----------
-# JSON con parámetros
-parametros = {
-    'slope': float(slope),
-    'intercept': float(intercept),
-    'slope_err': float(slope_err),
-    'intercept_err': float(intercept_err),
-    'r2': float(r_value**2),
-    'x_min': float(x_min),
-    'x_max': float(x_max),
-}
-with open('parametros_calibracion.json', 'w', encoding='utf-8') as f:
-    json.dump(parametros, f, ensure_ascii=False, indent=2)
+# Calibración (.rccal) con parámetros, errores y la ventana de integración
+calibracion = CalibrationFile(
+    "linear", [[slope, intercept]], [np.diag([slope_err**2, intercept_err**2])],
+    channels=["area"], stats={'r2': float(r_value**2)},
+    metadata={'x_min': float(x_min), 'x_max': float(x_max)},
+    arrays={'dosis': valores_filtrados, 'areas': areas_filtradas},
+)
+calibracion.save('parametros_calibracion.rccal')
 
 # CSV con áreas por archivo
 with open('areas_integradas.csv', 'w', encoding='utf-8') as f:
@@ -174,7 +176,7 @@ with open('areas_integradas.csv', 'w', encoding='utf-8') as f:
         val = "" if area is None else f"{area:.8f}"
         f.write(f"{archivo},{dosis},{val}\n")
 
-print("\nArchivos guardados: parametros_calibracion.json, areas_integradas.csv")
+print("\nArchivos guardados: parametros_calibracion.rccal, areas_integradas.csv")
 
 # ---------- GRÁFICAS ----------
 # (1) Espectros (opcional)
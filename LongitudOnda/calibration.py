@@ -1,26 +1,16 @@
 import os
 import re
+import sys
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
-def read_spectrophotometer_file(filepath, header_lines=19):
-    wavelengths, optical_densities = [], []
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        lines = f.readlines()[header_lines:]
-    for line in lines:
-        parts = line.strip().replace(',', '.').split()
-        if len(parts) < 2: 
-            continue
-        try:
-            wl = float(parts[0])
-            od = float(parts[1])
-        except ValueError:
-            continue
-        wavelengths.append(wl)
-        optical_densities.append(od)
-    return np.array(wavelengths), np.array(optical_densities)
+# Registro de modelos de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from CalibrationModels import select_model, MODELS
+from SpectrumIO import read_folder
+from CalibrationFile import CalibrationFile
 
 def extract_dose_from_filename(filename):
     # Busca #dosis# o la primera cifra
@@ -41,14 +31,9 @@ def process_calibration_data(data_dir, params_output):
     doses = []
     counts663 = []
     
-    # 1) Recorre todos los archivos .txt
-    for fname in os.listdir(data_dir):
-        if not fname.lower().endswith('.txt'):
-            continue
-        fullpath = os.path.join(data_dir, fname)
-        
-        # 2) Lee espectro y extrae OD a 663 nm
-        wl, od = read_spectrophotometer_file(fullpath)
+    # 1) Recorre todos los archivos .txt (con caché por carpeta)
+    for fname, (wl, od, _) in read_folder(data_dir).items():
+        # 2) Extrae OD a 663 nm
         c663 = find_counts_at_wavelength(wl, od)
         if c663 is None:
             print(f"  ⚠️ No encontré 663 nm en {fname}")
@@ -111,15 +96,33 @@ def process_calibration_data(data_dir, params_output):
     dof = n_puntos - n_parametros # Grados de libertad
     ser = np.sqrt(ss_res / dof) if dof > 0 else 0
 
-    # 6) Guarda los resultados en el archivo de texto
+    # 6) Guarda los resultados en el archivo de calibración (.rccal)
     # ------------------------------------------------------------------
-    with open(params_output, 'w', encoding='utf-8') as f:
-        f.write(f"a = {a:.6e} ± {sigma_a:.6e}\n")
-        f.write(f"b = {b:.6e} ± {sigma_b:.6e}\n")
-        f.write(f"c = {c:.6e} ± {sigma_c:.6e}\n")
-        f.write(f"R2 = {r2:.8f}\n")
-        f.write(f"SER = {ser:.6e}\n") # Error Estándar del Residuo
-    print(f"\n✅ Parámetros guardados en '{params_output}'")
+    calib = CalibrationFile(
+        "exponential", [popt], [pcov], channels=["OD663"],
+        stats={"R2": float(r2), "SER": float(ser), "n_points": n_puntos},
+        metadata={"source": os.path.basename(str(data_dir))},
+        arrays={"doses": doses, "od663": counts663},
+    )
+    params_output = calib.save(str(params_output))
+    print(f"\n✅ Calibración guardada en '{params_output}'")
+    print(f"   a = {a:.6e} ± {sigma_a:.6e}\n   b = {b:.6e} ± {sigma_b:.6e}\n   c = {c:.6e} ± {sigma_c:.6e}")
+    print(f"   R2 = {r2:.8f}, SER = {ser:.6e}")
+
+    # Comparación con las demás familias de modelos (AIC/BIC, en paralelo)
+    # Las familias en netOD necesitan la OD de la película sin irradiar (0 Gy)
+    unirradiated = doses == 0
+    reference = counts663[unirradiated].mean() if unirradiated.any() else None
+    best, fits = select_model(counts663, doses, reference=reference, kind="od")
+    print("\nComparación de modelos (dosis frente a OD a 663 nm):")
+    if reference is None:
+        print("  (sin espectro a 0 Gy: no se comparan las familias en netOD)")
+    for fit in fits[0]:
+        if "error" in fit:
+            print(f"  {MODELS[fit['model']].label}: error ({fit['error']})")
+        else:
+            print(f"  {MODELS[fit['model']].label}: AIC = {fit['aic']:.2f}, BIC = {fit['bic']:.2f}")
+    print(f"  → Mejor modelo: {MODELS[best[0]['model']].label}")
 
     # 7) Gráfica final (sin cambios en esta parte)
     # ------------------------------------------------------------------
@@ -170,7 +173,7 @@ if __name__ == '__main__':
     data_dir = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\LongitudOnda\2025_03_18_radiocromic_ocean_espectrometro\suavizados'
     # Carpeta del script
     script_dir = Path(__file__).resolve().parent
-    params_file = script_dir / 'calibration_params.txt'
+    params_file = script_dir / 'calibration_params.rccal'
     
     try:
         process_calibration_data(data_dir, params_file)
@@ -1,48 +1,25 @@
-import os
 import re
+import sys
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from SpectrumIO import read_folder
+from CalibrationFile import load_calibration
+
 def read_calibration_params(filepath):
     """
-    Lee un txt con líneas de la forma
-      a = <valor> ± <incertidumbre>
-      b = ...
-      c = ...
-    y devuelve floats: (a, sigma_a, b, sigma_b, c, sigma_c).
+    Lee la calibración exponencial (calibration_params.rccal, o el txt
+    anterior con líneas 'a = <valor> ± <incertidumbre>') y devuelve
+    (popt, pcov) con la covarianza completa de (a, b, c).
     """
-    params = {}
-    pattern = re.compile(r'([abc])\s*=\s*([+-]?[0-9.]+(?:e[+-]?\d+)?)\s*±\s*([0-9.]+(?:e[+-]?\d+)?)')
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
-            m = pattern.search(line)
-            if m:
-                key = m.group(1)
-                val = float(m.group(2))
-                err = float(m.group(3))
-                params[key] = (val, err)
-    a, sa = params['a']
-    b, sb = params['b']
-    c, sc = params['c']
-    return a, sa, b, sb, c, sc
-
-def read_spectrophotometer_file(filepath, header_lines=19):
-    wavelengths, optical_densities = [], []
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-        raw_lines = file.readlines()[header_lines:]
-    for line in raw_lines:
-        parts = line.strip().replace(',', '.').split()
-        if len(parts) < 2:
-            continue
-        try:
-            wl = float(parts[0])
-            od = float(parts[1])
-        except ValueError:
-            continue
-        wavelengths.append(wl)
-        optical_densities.append(od)
-    return np.array(wavelengths), np.array(optical_densities)
+    calib = load_calibration(str(filepath))
+    if calib.family != "exponential":
+        raise ValueError(f"{filepath}: se esperaba una calibración exponencial, no '{calib.family}'")
+    pcov = calib.cov[0] if calib.cov is not None else np.zeros((3, 3))
+    return np.array(calib.params[0]), np.array(pcov)
 
 def find_counts_at_wavelength(wl, counts, target=663.0, tol=0.0005):
     """
@@ -99,26 +76,19 @@ def extract_dose_from_filename(filename):
 if __name__ == '__main__':
     # --- Ajusta esta ruta a tus datos ---
     data_dir = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\LongitudOnda\2025_03_18_radiocromic_ocean_espectrometro\suavizados'
-    params_file = Path(__file__).resolve().parent / 'calibration_params.txt'
+    params_file = Path(__file__).resolve().parent / 'calibration_params.rccal'
 
     # 1) Leer parámetros de calibración
-    a, sa, b, sb, c, sc = read_calibration_params(params_file)
-    pcov = np.array([
-        [sa**2, 0, 0],
-        [0, sb**2, 0],
-        [0, 0, sc**2]
-    ])
+    (a, b, c), pcov = read_calibration_params(params_file)
+    sa, sb, sc = np.sqrt(np.diag(pcov))
     print(f"Parámetros cargados:\n"
           f"  a = {a:.6e} ± {sa:.6e}\n"
           f"  b = {b:.6e} ± {sb:.6e}\n"
           f"  c = {c:.6e} ± {sc:.6e}\n")
 
     # 2) Procesar cada espectro y calcular dosis ± incertidumbre
-    for fname in sorted(os.listdir(data_dir)):
-        if not fname.lower().endswith('.txt'):
-            continue
-        fp = os.path.join(data_dir, fname)
-        wl, od = read_spectrophotometer_file(fp)
+    spectra = read_folder(data_dir)
+    for fname, (wl, od, _) in spectra.items():
         y_mean, y_std = find_counts_at_wavelength(wl, od)
         if y_mean is None:
             print(f"{fname}: no hay datos cerca de 663 nm → SKIP")
@@ -135,13 +105,7 @@ if __name__ == '__main__':
                   f"  dosis  = {x_val:.3f} ± {sigma_x_val:.3f}\n")
 
     # (Opcional) gráfico de todos los espectros
-    spectra = []
-    for fname in sorted(os.listdir(data_dir)):
-        if not fname.lower().endswith('.txt'):
-            continue
-        wl, od = read_spectrophotometer_file(os.path.join(data_dir, fname))
-        if wl.size:
-            spectra.append((fname, wl, od))
+    spectra = [(fname, wl, od) for fname, (wl, od, _) in spectra.items() if wl.size]
     if spectra:
         plt.figure(figsize=(9, 6), dpi=100)
         for fname, wl, od in spectra:
@@ -1,22 +1,12 @@
 import numpy as np
-import re
+import sys
 from pathlib import Path
 import matplotlib.pyplot as plt # Solo si quieres visualizar algo
 
-def read_spectrophotometer_file(filepath, header_lines=19):
-    # (Misma función que en tu script de calibración)
-    wavelengths, optical_densities = [], []
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        lines = f.readlines()[header_lines:]
-    for line in lines:
-        parts = line.strip().replace(',', '.').split()
-        if len(parts) < 2: continue
-        try:
-            wl, od = float(parts[0]), float(parts[1])
-            wavelengths.append(wl)
-            optical_densities.append(od)
-        except ValueError: continue
-    return np.array(wavelengths), np.array(optical_densities)
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from SpectrumIO import read_folder
+from CalibrationFile import load_calibration
 
 def find_od_at_wavelength(wavelengths, ods, target=663.0, tol=0.5):
     # (Misma función, pero ahora devuelve OD y su desviación estándar como error)
@@ -25,36 +15,6 @@ def find_od_at_wavelength(wavelengths, ods, target=663.0, tol=0.5):
         # El error de la OD es la desviación estándar de las mediciones cercanas
         return np.mean(ods[mask]), np.std(ods[mask])
     return None, None
-def parse_params_file(params_filepath):
-    """Lee el archivo de parámetros y devuelve los valores y sus errores."""
-    params = {}
-    with open(params_filepath, 'r', encoding='utf-8') as f:  # fuerza UTF-8
-        for line in f:
-            if '=' in line:
-                key, val_str = line.split('=')
-                key = key.strip()
-                if '±' in val_str or 'Â±' in val_str:   # contempla ambas
-                    val_str = val_str.replace('Â', '')  # limpia caracteres raros
-                    val, err = val_str.split('±')
-                    # Limpieza por seguridad
-                    val = re.sub(r'[^\d\.\-+eE]', '', val).strip()
-                    err = re.sub(r'[^\d\.\-+eE]', '', err).strip()
-                    params[key] = float(val)
-                    params[f"sigma_{key}"] = float(err)
-                else:
-                    # Caso sin error asociado (ej. R2)
-                    try:
-                        params[key] = float(val_str.strip())
-                    except ValueError:
-                        pass  # ignora si no es numérico
-    # Crea la matriz de covarianza (asumiendo no correlación por simplicidad)
-    pcov = np.diag([
-        params.get("sigma_a", 0)**2,
-        params.get("sigma_b", 0)**2,
-        params.get("sigma_c", 0)**2
-    ])
-    return params, pcov
-
 def calculate_dose_from_od(od_value, params):
     """Invierte el modelo exponencial para encontrar la dosis."""
     a = params['a']
@@ -94,35 +54,16 @@ def propagate_error_dose(od_value, sigma_od, params, pcov):
 
 
 def parse_params_file(params_filepath):
-    """Lee el archivo de parámetros y devuelve los valores y el SER."""
-    params = {}
-    with open(params_filepath, 'r', encoding='utf-8') as f:  # fuerza UTF-8
-        for line in f:
-            if '=' in line:
-                key, val_str = line.split('=')
-                key = key.strip()
-                
-                # Elimina caracteres raros tipo Â
-                val_str = val_str.replace('Â', '')
-                
-                if '±' in val_str:
-                    val, err = val_str.split('±')
-                    # Limpieza de caracteres no numéricos
-                    val = re.sub(r'[^\d\.\-+eE]', '', val).strip()
-                    err = re.sub(r'[^\d\.\-+eE]', '', err).strip()
-                    params[key] = float(val)
-                    params[f"sigma_{key}"] = float(err)
-                else:
-                    val_str = re.sub(r'[^\d\.\-+eE]', '', val_str).strip()
-                    params[key] = float(val_str)
+    """
+    Lee la calibración (.rccal o el txt 'a = x ± y' anterior) y devuelve un
+    dict con a, b, c, sigma_a, sigma_b, sigma_c y los estadísticos (R2, SER).
+    """
+    calib = load_calibration(str(params_filepath))
+    values = calib.as_dict()
+    params = {k: v for k, v in values.items() if not k.endswith('_err')}
+    params.update({f"sigma_{k[:-4]}": v for k, v in values.items() if k.endswith('_err')})
     return params
 
-def calculate_dose_from_od(od_value, params):
-    # ... (esta función se mantiene igual) ...
-    a, b, c = params['a'], params['b'], params['c']
-    if (od_value - c) / a <= 0: return np.nan
-    return (1/b) * np.log((od_value - c) / a)
-
 def propagate_error_stable(od_value, sigma_od, params):
     """Propaga el error de forma estable usando el SER."""
     a, b, c = params['a'], params['b'], params['c']
@@ -152,7 +93,7 @@ def propagate_error_stable(od_value, sigma_od, params):
 if __name__ == '__main__':
     # Carpeta con archivos a procesar
     folder_with_files = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\LongitudOnda\2025_04_28_RC#15del_2025_03_25\suavizados'
-    params_file = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\LongitudOnda\calibration_params.txt'
+    params_file = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\LongitudOnda\calibration_params.rccal'
     UNCERTAINTY_IN_OD_MEASUREMENT = 0.0001
 
     try:
@@ -161,13 +102,12 @@ if __name__ == '__main__':
 
         # 2. Iterar sobre todos los .txt de la carpeta
         folder = Path(folder_with_files)
-        txt_files = list(folder.glob("*.txt"))
+        spectra = read_folder(folder)
 
-        if not txt_files:
+        if not spectra:
             print("No se encontraron archivos .txt en la carpeta.")
         else:
-            for filepath in txt_files:
-                wl, od = read_spectrophotometer_file(filepath)
+            for name, (wl, od, _) in spectra.items():
                 od_663, sigma_od_local = find_od_at_wavelength(wl, od)
                 sigma_od_final = max(sigma_od_local, UNCERTAINTY_IN_OD_MEASUREMENT)
 
@@ -178,7 +118,7 @@ if __name__ == '__main__':
                 error_in_dose = propagate_error_stable(od_663, sigma_od_final, params)
 
                 # --- RESULTADOS ---
-                print(f"\nArchivo: {filepath.name}")
+                print(f"\nArchivo: {name}")
                 print(f"  OD@663 = {od_663:.4f} ± {sigma_od_final:.4f}")
                 print(f"  Dosis  = {dose_calculated:.3f} ± {error_in_dose:.3f} Gy")
 
@@ -1,11 +1,14 @@
-import os, re
+import os, re, sys
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 
-def read_OD663(path, header=19, target=663, tol=0.5):
-    wl, od = np.loadtxt(path, skiprows=header, usecols=[0,1],
-                        delimiter=None, unpack=True, dtype=float)
+# Lector de espectros compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from SpectrumIO import read_spectrum
+
+def read_OD663(path, target=663, tol=0.5):
+    wl, od, _ = read_spectrum(path)
     mask = np.abs(wl-target) <= tol
     if mask.any():
         vals = od[mask]
@@ -1,9 +1,13 @@
-import os, re
+import re, sys
 import numpy as np
 from pathlib import Path
 from scipy.optimize import curve_fit
 import matplotlib.pyplot as plt
 
+# Lector de espectros compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from SpectrumSet import SpectrumSet
+
 def extract_dose(filename):
     """
     Devuelve la primera dosis numérica que encuentre en `filename`.
@@ -21,31 +25,24 @@ def extract_dose(filename):
 
 
 
-def read_OD663_from_folder(folder, header=19, target=663, tol=0.5):
-    doses, ods = [], []
-    for fn in os.listdir(folder):
-        if not fn.lower().endswith('.txt'):
-            continue
-
-        dose = extract_dose(fn)
-        if dose is None:
-            print(f"⚠️  No se pudo extraer la dosis de '{fn}', se omite.")
-            continue
-
-        # lee columnas (ajusta si tu formato es distinto)
-        wl, od = np.loadtxt(Path(folder)/fn,
-                            skiprows=header, usecols=[0,1], unpack=True,
-                            delimiter=None, dtype=float)
-
-        mask = np.abs(wl - target) <= tol
-        if not mask.any():
-            print(f"⚠️  '{fn}' no tiene puntos en {target} ± {tol} nm, se omite.")
-            continue
+def read_OD663_from_folder(folder, target=663, tol=0.5):
+    """
+    Devuelve (dosis, OD a target nm, espectros); espectros es el SpectrumSet
+    de los archivos usados, en el mismo orden que las dosis, para graficarlos
+    sin volver a leer la carpeta.
+    """
+    spectra = SpectrumSet.from_folder(folder, dose_parser=extract_dose)
+    for name in np.array(spectra.names)[np.isnan(spectra.doses)]:
+        print(f"⚠️  No se pudo extraer la dosis de '{name}', se omite.")
+    spectra = spectra.with_dose()
 
-        doses.append(dose)
-        ods.append(np.mean(od[mask]))
+    # OD en target ± tol de todos los espectros a la vez
+    ods, _ = spectra.at(target, tol)
+    for name in np.array(spectra.names)[np.isnan(ods)]:
+        print(f"⚠️  '{name}' no tiene puntos en {target} ± {tol} nm, se omite.")
+    spectra = spectra.subset(~np.isnan(ods))
 
-    return np.array(doses), np.array(ods)
+    return spectra.doses, ods[~np.isnan(ods)], spectra
 
 def linear(x, m, n):
     return m*x + n
@@ -56,7 +53,7 @@ if __name__ == "__main__":
     out_params = script_dir / "linear_params.txt"
     out_cov    = script_dir / "linear_cov.txt"
 
-    x, y = read_OD663_from_folder(data_dir)
+    x, y, spectra = read_OD663_from_folder(data_dir)
     popt, pcov  = curve_fit(linear, x, y)        # m, n  (+ covarianza)
     m, n = popt
     r2 = 1 - np.sum((y - linear(x, *popt))**2) / np.sum((y - np.mean(y))**2)
@@ -79,11 +76,8 @@ if __name__ == "__main__":
 
     # Gráfico de espectros con línea vertical
     plt.figure(figsize=(6, 4))
-    for dose, (wl, od) in sorted(zip(x, zip(*[np.loadtxt(Path(data_dir)/fn, skiprows=19, usecols=[0,1], unpack=True, delimiter=None, dtype=float) for fn in os.listdir(data_dir) if fn.lower().endswith('.txt')]))):
-        if not np.any(np.abs(wl - 663) <= 0.5):
-            print(f"⚠️  No se encontraron puntos en 663 nm para la dosis {dose}, se omite.")
-            continue
-        plt.plot(wl, od, label=f'{dose}')
+    for wl, od, info in spectra.sort_by_dose():
+        plt.plot(wl, od, label=f'{info["dose"]}')
     plt.axvline(663, linestyle='--', linewidth=1.2, color='red', label='λ = 663 nm')
     plt.xlabel('Longitud de onda (nm)')
     plt.ylabel('Absorbancia')
@@ -2,22 +2,22 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 import os
+import sys
+from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog
 
+# Lector de espectros compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from SpectrumIO import read_spectrum
+from LorentzModel import multi_lorentzian_height, multi_lorentzian_height_jac
+
 # Función para definir un pico lorentziano
 def lorentzian(x, amp, center, width):
     return amp * width**2 / ((x - center)**2 + width**2)
 
-# Función para definir el modelo completo (suma de 5 lorentzianos)
-def five_lorentzians(x, *params):
-    y = np.zeros_like(x)
-    for i in range(0, len(params), 3):
-        amp = params[i]
-        center = params[i+1]
-        width = params[i+2]
-        y = y + lorentzian(x, amp, center, width)
-    return y
+# Modelo completo (suma de 5 lorentzianos), vectorizado y con Jacobiano analítico
+five_lorentzians = multi_lorentzian_height
 
 # Función para seleccionar el archivo
 def seleccionar_archivo():
@@ -34,18 +34,14 @@ def analizar_espectro(ruta_archivo=None):
             print("No se seleccionó ningún archivo.")
             return
     
-    # Leer el archivo, saltando las primeras 19 líneas
+    # Leer el archivo: longitud de onda (x) y densidad óptica (y)
     try:
-        datos = np.loadtxt(ruta_archivo, skiprows=19,max_rows=1040)
+        longitud_onda, densidad_optica, _ = read_spectrum(ruta_archivo)
         print(f"Archivo cargado exitosamente: {ruta_archivo}")
     except Exception as e:
         print(f"Error al cargar el archivo: {e}")
         return
     
-    # Extraer longitud de onda (x) y densidad óptica (y)
-    longitud_onda = datos[:, 0]
-    densidad_optica = datos[:, 1]
-    
     # Definir el rango de interés
     rango_min = 650
     rango_max = 710
@@ -72,8 +68,8 @@ def analizar_espectro(ruta_archivo=None):
     try:
         # Ajustar los picos lorentzianos
         print("Ajustando picos lorentzianos...")
-        params, _ = curve_fit(five_lorentzians, x_rango, y_rango, p0=p0, 
-                             bounds=(bounds_lower, bounds_upper), maxfev=10000)
+        params, _ = curve_fit(five_lorentzians, x_rango, y_rango, p0=p0, jac=multi_lorentzian_height_jac,
+                             bounds=(bounds_lower, bounds_upper), max_nfev=10000)
         print("Ajuste completado con éxito.")
     except Exception as e:
         print(f"Error en el ajuste: {e}")
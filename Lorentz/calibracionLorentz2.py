@@ -6,53 +6,34 @@ Calibración completa con propagación de errores
 • Ajusta n picos Lorentz a cada espectro.
 • Calcula suma S y su σ_S por propagación (gradᵀ·pcov·grad).
 • Ajuste lineal S = m·cal + b con σ_m y σ_b.
-• Guarda diccionario {'slope', 'intercept', 'slope_err',
-                      'intercept_err', 'r2'} en un .pkl.
+• Guarda slope, intercept, sus errores y r2 en un archivo .rccal
+  (ver SoftwareLecturaRadiocromica/CalibrationFile.py).
 Autor: ChatGPT (o3) — 2025-06-09
 """
 
-import os, re, glob, pickle
+import os, re, sys
+from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 
-# ---------- Modelo Lorentziano ---------- #
-def lorentzian(x, amp, cen, wid):
-    return (2*amp/np.pi) * (wid / (4*(x-cen)**2 + wid**2))
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from CalibrationFile import CalibrationFile
+from SpectrumIO import read_folder
+from LorentzModel import multi_lorentzian, initial_guess, lorentz_sum, fit_series, fit_global, \
+                         fit_lorentzians as fit_peaks
 
-def multiple_lorentzians(x, *p):
-    n = len(p)//3
-    out = np.zeros_like(x)
-    for i in range(n):
-        a, c, w = p[3*i:3*i+3]
-        out += lorentzian(x, a, c, w)
-    return out
+# ---------- Modelo Lorentziano ---------- #
+# Suma de Lorentzianas vectorizada con Jacobiano analítico (LorentzModel)
+multiple_lorentzians = multi_lorentzian
 
 # ---------- Lectura de espectro ---------- #
-HEADER_LINES = 19
-X_MIN, X_MAX = 650.0, 710.0   # rango a conservar
-
-def read_spectrum(path):
-    wl, od = [], []
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        for ln in f.readlines()[HEADER_LINES:]:
-            ln = ln.strip()
-            if not ln or ln.startswith('#'):
-                continue
-            parts = ln.replace(',', '.').split()
-            if len(parts) < 2:
-                continue
-            try:
-                x, y = float(parts[0]), float(parts[1])
-            except ValueError:
-                continue
-            if X_MIN <= x <= X_MAX:
-                wl.append(x)
-                od.append(y)
-    return np.array(wl), np.array(od)
+X_MIN, X_MAX = 650.0, 710.0   # rango a conservar (read_folder, con caché por carpeta)
 
 # ---------- Valor de calibración del nombre ---------- #
 def extract_cal_value(fname):
+    # Solo el nombre del archivo: en un .zip la ruta interna lleva fechas (2025_03_18...)
+    fname = fname.replace('\\', '/').rsplit('/', 1)[-1]
     m = re.search(r'#(\d+\.?\d*)#', fname)
     if m:
         return float(m.group(1))
@@ -60,51 +41,63 @@ def extract_cal_value(fname):
     return float(m2.group(1)) if m2 else None
 
 # ---------- Ajuste de Lorentzianas y error de la suma ---------- #
-def fit_lorentzians(wl, od, n_peaks=5, maxfev=500000):
-    # estimaciones iniciales sencillas
-    amp0 = od.max()/n_peaks
-    c0s  = np.linspace(wl.min(), wl.max(), n_peaks+2)[1:-1]
-    w0   = (wl.max()-wl.min())/(4*n_peaks)
-    p0 = np.ravel([[amp0, c, w0] for c in c0s])
-    popt, pcov = curve_fit(multiple_lorentzians, wl, od,
-                           p0=p0, maxfev=maxfev)
-    return popt, pcov
-
-def lorentz_sum_and_error(wl, popt, pcov, eps=1e-6):
+def fit_lorentzians(wl, od, n_peaks=5, max_nfev=None):
+    # estimaciones iniciales sencillas; amplitudes y anchuras positivas,
+    # centros en la ventana (ver LorentzModel.lorentz_bounds)
+    p0 = initial_guess(wl, od, n_peaks)
+    return fit_peaks(wl, od, p0=p0, max_nfev=max_nfev)
+
+def lorentz_sum_and_error(wl, popt, pcov):
     """
-    Devuelve (S, σ_S) donde S = Σ_i L(wl_i; popt)
+    Devuelve (S, σ_S) donde S = Σ_i L(wl_i; popt); el gradiente de S es
+    analítico (suma del Jacobiano del modelo, ver LorentzModel.lorentz_sum)
     """
-    y_hat = multiple_lorentzians(wl, *popt)
-    S = y_hat.sum()
-
-    # gradiente numérico de S respecto a cada parámetro
-    grad = np.zeros_like(popt)
-    for i in range(len(popt)):
-        dp = np.zeros_like(popt); dp[i] = eps
-        S_plus  = multiple_lorentzians(wl, *(popt+dp)).sum()
-        S_minus = multiple_lorentzians(wl, *(popt-dp)).sum()
-        grad[i] = (S_plus - S_minus)/(2*eps)
-
-    var_S = grad @ pcov @ grad
-    sigma_S = np.sqrt(var_S) if var_S > 0 else np.nan
+    S, sigma_S, _ = lorentz_sum(wl, popt, pcov)
     return S, sigma_S
 
 # ---------- Calibración global ---------- #
-def process_folder(folder, n_peaks=2, sigma_y=0.01):
-    spectra = []
-    sums, sums_err, cals = [], [], []
-
-    plt.figure(figsize=(12,7))
-    for fp in sorted(glob.glob(os.path.join(folder, "*.txt"))):
-        wl, od = read_spectrum(fp)
+def process_folder(folder, n_peaks=2, sigma_y=0.01, warm_start=True, joint=False):
+    """
+    Con warm_start los espectros se ajustan en orden de dosis y cada ajuste
+    parte de la solución del anterior (LorentzModel.fit_series); si falla,
+    se repite desde la estimación inicial sencilla.
+    Con joint todos los espectros se ajustan a la vez con centros y anchuras
+    comunes y amplitudes propias (LorentzModel.fit_global); si ese ajuste no
+    converge se vuelve a los ajustes por separado.
+    """
+    series = []   # (fname, wl, od, cal)
+    for fname, (wl, od, _) in read_folder(folder, x_min=X_MIN, x_max=X_MAX).items():
         if wl.size == 0:
             continue
-        cal = extract_cal_value(os.path.basename(fp))
+        cal = extract_cal_value(fname)
         if cal is None:
             continue
+        series.append((fname, wl, od, cal))
+    series.sort(key=lambda item: item[3])
+
+    curves = [(wl, od) for _, wl, od, _ in series]
+    fits = None
+    if joint:
+        try:
+            fits = fit_global(curves, n_peaks)
+        except (RuntimeError, ValueError, np.linalg.LinAlgError) as e:
+            print(f"⚠️ Ajuste conjunto fallido ({e}); se ajusta cada espectro por separado")
+            joint = False
+    if fits is None and warm_start:
+        fits = fit_series(curves, n_peaks, keys=[cal for *_, cal in series])
+    elif fits is None:
+        fits = [dict(zip(("popt", "pcov"), fit_lorentzians(wl, od, n_peaks))) for wl, od in curves]
+
+    spectra = []
+    sums, sums_err, cals = [], [], []
 
-        popt, pcov = fit_lorentzians(wl, od, n_peaks)
-        S, S_err   = lorentz_sum_and_error(wl, popt, pcov)
+    plt.figure(figsize=(12,7))
+    for (fname, wl, od, cal), fit in zip(series, fits):
+        if fit is None:
+            print(f"⚠️ {fname}: el ajuste no converge, se omite")
+            continue
+        fp = os.path.join(folder, fname)
+        S, S_err = lorentz_sum_and_error(wl, fit["popt"], fit["pcov"])
 
         spectra.append((wl, od, fp))
         cals.append(cal)
@@ -114,6 +107,14 @@ def process_folder(folder, n_peaks=2, sigma_y=0.01):
         plt.plot(wl, od, alpha=.6,
                  label=f"{os.path.basename(fp)}  (cal={cal})")
 
+    if joint and fits:
+        print(f"Ajuste conjunto: {2*n_peaks + n_peaks*len(fits)} parámetros "
+              f"(frente a {3*n_peaks*len(fits)} por separado), {fits[0]['nfev']} evaluaciones")
+    elif warm_start:
+        n_warm = sum(1 for fit in fits if fit is not None and fit["warm"])
+        print(f"Ajustes encadenados: {n_warm}/{len(fits)}, "
+              f"{sum(fit['nfev'] for fit in fits if fit is not None)} evaluaciones en total")
+
     plt.axvline(663, color='k', ls='--')
     plt.title("Espectros de calibración")
     plt.xlabel("λ (nm)"); plt.ylabel("OD")
@@ -199,16 +200,21 @@ def linear_regression(x, y):
 
 # ---------- Guardar modelo ---------- #
 def save_model(path, cal_dict):
-    with open(path, 'wb') as f:
-        pickle.dump(cal_dict, f)
+    calib = CalibrationFile(
+        "linear", [[cal_dict['slope'], cal_dict['intercept']]],
+        [np.diag([cal_dict['slope_err']**2, cal_dict['intercept_err']**2])],
+        channels=["suma_lorentz"], stats={'r2': float(cal_dict['r2'])},
+    )
+    path = calib.save(path)
     print(f"\nModelo guardado en: {path}")
 
 # ---------- MAIN ---------- #
 def main():
     data_dir = r"C:\Users\luis-\Downloads\TFM\DatosEspectrometria\Lorentz\2025_03_18_radiocromic_ocean_espectrometro\suavizados"      # <-- adapta tu carpeta
-    out_file = "calibration_model.pkl"
+    out_file = "calibration_model.rccal"
+    ajuste_conjunto = False   # centros y anchuras comunes a todos los espectros
 
-    cals, sums, sums_err = process_folder(data_dir, n_peaks=2)
+    cals, sums, sums_err = process_folder(data_dir, n_peaks=2, joint=ajuste_conjunto)
 
     m, b, m_err, b_err, r2 = linear_regression(cals, sums)
 
@@ -1,90 +1,54 @@
-import os, glob, pickle, re
+import os, re, sys
+from pathlib import Path
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+
+# Archivo de calibración compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'SoftwareLecturaRadiocromica'))
+from CalibrationFile import load_calibration
+from SpectrumIO import read_folder
+from LorentzModel import multi_lorentzian, initial_guess, lorentz_sum, fit_lorentzians as fit_peaks
 
 # ──────────────────────────────────────────────────────────
 #  Configuración global
 # ──────────────────────────────────────────────────────────
 x_min, x_max   = 650.0, 710.0   # rango útil
 n_peaks        = 5              # nº de picos Lorentz a ajustar
-eps_grad       = 1e-6           # paso para gradiente numérico (σS)
-cal_model_file = "calibration_model.pkl"
+cal_model_file = "calibration_model.rccal"
+old_model_file = "calibration_model.pkl"  # formato anterior
 out_csv        = "dose_results.csv"
 
 # ──────────────────────────────────────────────────────────
 #  Funciones de modelo
 # ──────────────────────────────────────────────────────────
-def lorentzian(x, amp, cen, wid):
-    return (2*amp/np.pi) * (wid / (4*(x-cen)**2 + wid**2))
-
-def multiple_lorentzians(x, *p):
-    res = np.zeros_like(x)
-    for i in range(len(p)//3):
-        a, c, w = p[3*i:3*i+3]
-        res += lorentzian(x, a, c, w)
-    return res
-
-# ──────────────────────────────────────────────────────────
-#  Lectura de espectro
-# ──────────────────────────────────────────────────────────
-def read_spectrum(fp, skip=19):
-    wl, od = [], []
-    with open(fp, 'r', encoding='utf-8', errors='ignore') as f:
-        for ln in f.readlines()[skip:]:
-            ln = ln.strip()
-            if not ln or ln.startswith('#'):     # línea vacía o comentario
-                continue
-            parts = ln.replace(',', '.').split()
-            if len(parts) < 2:
-                continue
-            try:
-                x, y = float(parts[0]), float(parts[1])
-            except ValueError:
-                continue
-            if x_min <= x <= x_max:
-                wl.append(x); od.append(y)
-    return np.array(wl), np.array(od)
+# Suma de Lorentzianas vectorizada con Jacobiano analítico (LorentzModel)
+multiple_lorentzians = multi_lorentzian
 
 # ──────────────────────────────────────────────────────────
 #  Ajuste de Lorentzianas y σS
 # ──────────────────────────────────────────────────────────
-def init_guess(wl, od, n):
-    a0   = od.max()/n
-    c0   = np.linspace(wl.min(), wl.max(), n+2)[1:-1]
-    w0   = (wl.max()-wl.min())/(4*n)
-    return np.ravel([[a0, c, w0] for c in c0])
+init_guess = initial_guess
 
 def fit_lorentzians(wl, od, n):
-    p0 = init_guess(wl, od, n)
-    popt, pcov = curve_fit(multiple_lorentzians, wl, od, p0=p0, maxfev=500000)
-    return popt, pcov
+    # Parámetros acotados: amplitudes y anchuras positivas, centros en la ventana
+    return fit_peaks(wl, od, p0=init_guess(wl, od, n))
 
 def lorentz_sum_and_error(wl, popt, pcov):
     """
-    Devuelve S = Σ modelo y σS propagado (gradᵀ pcov grad).
+    Devuelve S = Σ modelo y σS propagado (gradᵀ pcov grad), con el
+    gradiente analítico de S (LorentzModel.lorentz_sum).
     """
-    S = multiple_lorentzians(wl, *popt).sum()
-
-    # gradiente numérico de S respecto a cada parámetro
-    grad = np.zeros_like(popt)
-    for i in range(len(popt)):
-        dp = np.zeros_like(popt); dp[i] = eps_grad
-        S_plus  = multiple_lorentzians(wl, *(popt+dp)).sum()
-        S_minus = multiple_lorentzians(wl, *(popt-dp)).sum()
-        grad[i] = (S_plus - S_minus)/(2*eps_grad)
-
-    var_S = grad @ pcov @ grad
-    sigma_S = np.sqrt(var_S) if var_S > 0 else np.nan
+    S, sigma_S, _ = lorentz_sum(wl, popt, pcov)
     return S, sigma_S
 
 # ──────────────────────────────────────────────────────────
 #  Carga del modelo de calibración
 # ──────────────────────────────────────────────────────────
 def load_calibration_model(path=cal_model_file):
-    with open(path, 'rb') as f:
-        d = pickle.load(f)
+    if not os.path.isfile(path) and os.path.isfile(old_model_file):
+        path = old_model_file
+    d = load_calibration(path).as_dict()
     print(f"Modelo → {path}")
     for k in ("slope", "slope_err", "intercept", "intercept_err", "r2"):
         print(f"  {k}: {d[k]}")
@@ -114,16 +78,14 @@ def dose_and_error(S, sigma_S, model):
 #  Procesamiento de una carpeta
 # ──────────────────────────────────────────────────────────
 def process_folder(folder, model):
-    txts = sorted(glob.glob(os.path.join(folder, "*.txt")))
-    if not txts:
+    spectra = read_folder(folder, x_min=x_min, x_max=x_max)
+    if not spectra:
         print("⚠  No se encontraron .txt en", folder); return []
 
     results = []
     plt.figure(figsize=(12,8))
 
-    for fp in txts:
-        fn = os.path.basename(fp)
-        wl, od = read_spectrum(fp)
+    for fn, (wl, od, _) in spectra.items():
         if wl.size == 0:
             continue
 
@@ -0,0 +1,176 @@
+import numpy as np
+
+
+# Integración por trapecios de muchos espectros en muchas bandas a la vez.
+#
+# Para una rejilla fija x, la integral por trapecios de y en los puntos de
+# [x_min, x_max] es lineal en y: área = w · y, con w los pesos
+#   w[lo] = (x[lo+1] - x[lo]) / 2,  w[i] = (x[i+1] - x[i-1]) / 2,  w[hi] = (x[hi] - x[hi-1]) / 2
+# (lo mismo que np.trapezoid sobre los puntos enmascarados). Con una fila de
+# pesos por banda se forma una matriz dispersa W (bandas, m) y las áreas de
+# todos los espectros son values @ W.T: un producto disperso por matriz.
+# Si las bandas cubren buena parte de la rejilla (muchas bandas anchas
+# solapadas) W se guarda densa y el producto lo hace BLAS, que es más rápido.
+
+# Fracción de elementos no nulos a partir de la cual W se usa densa
+DENSE_FRACTION = 0.1
+
+
+def _window_bounds(wavelength, windows):
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    lo = np.searchsorted(wavelength, windows[:, 0], side="left")
+    hi = np.searchsorted(wavelength, windows[:, 1], side="right")
+    return windows, lo, hi
+
+
+def trapezoid_weights(wavelength, windows):
+    """
+    Matriz dispersa (CSR) de pesos de trapecio, una fila por banda (x_min, x_max).
+    wavelength debe ser creciente. Las bandas con menos de dos puntos dan
+    una fila vacía (ver BandIntegrator.valid).
+    """
+    from scipy import sparse
+
+    x = np.asarray(wavelength, dtype=float)
+    windows, lo, hi = _window_bounds(x, windows)
+    counts = np.where(hi - lo >= 2, hi - lo, 0)
+
+    # Índices de columna de todas las bandas concatenadas
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    starts = np.repeat(lo, counts)
+    cols = starts + np.arange(indptr[-1]) - np.repeat(indptr[:-1], counts)
+
+    # Semidistancia a los vecinos dentro de la banda (en los extremos, solo uno)
+    first = np.zeros(indptr[-1], bool)
+    last = np.zeros(indptr[-1], bool)
+    first[indptr[:-1][counts > 0]] = True
+    last[indptr[1:][counts > 0] - 1] = True
+    left = np.where(first, cols, cols - 1)
+    right = np.where(last, cols, cols + 1)
+    data = (x[right] - x[left]) / 2
+
+    return sparse.csr_matrix((data, cols, indptr), shape=(len(windows), len(x)))
+
+
+class BandIntegrator:
+    """
+    Pesos de trapecio precalculados para una rejilla y un conjunto de bandas
+    (pueden solaparse). Se construye una vez y se aplica a cualquier número
+    de espectros sobre esa rejilla.
+    """
+    def __init__(self, wavelength, windows):
+        self.wavelength = np.asarray(wavelength, dtype=float)
+        self.windows, lo, hi = _window_bounds(self.wavelength, windows)
+        self.valid = hi - lo >= 2
+        self.weights = trapezoid_weights(self.wavelength, self.windows)
+        size = self.weights.shape[0] * self.weights.shape[1]
+        self._dense = self.weights.toarray() if self.weights.nnz > DENSE_FRACTION * size else None
+
+    def __call__(self, values):
+        """Áreas (n_espectros, n_bandas); NaN en las bandas sin puntos suficientes"""
+        values = np.asarray(values)
+        single = values.ndim == 1
+        values = np.atleast_2d(values).astype(float, copy=False)
+        if self._dense is not None:
+            areas = values @ self._dense.T
+        else:
+            areas = np.asarray((self.weights @ values.T).T)
+        areas[:, ~self.valid] = np.nan
+        return areas[0] if single else areas
+
+    def errors(self, sigma):
+        """
+        Incertidumbre de cada área para un ruido σ por punto (independiente):
+        σ_área = σ · sqrt(Σ w²). σ escalar o (n_espectros,) da (n_espectros, n_bandas).
+        """
+        norm = np.sqrt(np.asarray(self.weights.multiply(self.weights).sum(axis=1)).ravel())
+        norm = np.where(self.valid, norm, np.nan)
+        return np.multiply.outer(np.asarray(sigma, dtype=float), norm)
+
+
+def integrate_bands(wavelength, values, windows):
+    """Atajo: áreas de `values` (n, m) en las bandas `windows` (k, 2) → (n, k)"""
+    return BandIntegrator(wavelength, windows)(values)
+
+
+# ----------------------------------------------------------------------
+# Búsqueda de la ventana de integración
+# ----------------------------------------------------------------------
+def prefix_integrals(wavelength, values):
+    """
+    Integral acumulada por trapecios C[:, j] = ∫ de x[0] a x[j] (n, m); el
+    área en los puntos i..j es C[:, j] - C[:, i], igual que np.trapezoid.
+    """
+    x = np.asarray(wavelength, dtype=float)
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    steps = (y[:, 1:] + y[:, :-1]) * (np.diff(x) / 2)
+    return np.concatenate((np.zeros((len(y), 1)), np.cumsum(steps, axis=1)), axis=1)
+
+
+def scan_windows(wavelength, values, doses, x_range=(400.0, 800.0), min_width=5.0):
+    """
+    Ajusta la recta área = m·dosis + b para todas las ventanas [x_i, x_j] de
+    la rejilla dentro de x_range (ancho >= min_width nm).
+
+    Con las integrales acumuladas C, las sumas que necesita el ajuste por
+    mínimos cuadrados de cada ventana salen en O(1):
+      Σ_k A_k       = s[j] - s[i]               (s = Σ_k C_k)
+      Σ_k dc_k A_k  = t[j] - t[i]               (t = dc · C, dc dosis centradas)
+      Σ_k A_k²      = G[j, j] + G[i, i] - 2 G[i, j]   (G = Cᵀ C)
+
+    Devuelve un dict con x_min, x_max (m,), y matrices (m, m), indexadas
+    [i, j], con r2, slope, intercept y dose_sigma = s_res / |m| (dispersión
+    en dosis de los puntos de calibración); NaN en las ventanas no válidas.
+    """
+    x = np.asarray(wavelength, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+    keep = (x >= x_range[0]) & (x <= x_range[1])
+    x = x[keep]
+    C = prefix_integrals(x, np.asarray(values)[:, keep])
+    n = len(doses)
+    if n < 3:
+        raise ValueError("Se necesitan al menos 3 espectros con dosis para ajustar una recta")
+
+    dc = doses - doses.mean()
+    sxx = dc @ dc
+    s = C.sum(axis=0)
+    t = dc @ C
+    G = C.T @ C
+    q = np.diag(G)
+
+    sum_a = s[None, :] - s[:, None]
+    sxy = t[None, :] - t[:, None]
+    sum_a2 = q[None, :] + q[:, None] - 2 * G
+    syy = sum_a2 - sum_a ** 2 / n
+
+    valid = (x[None, :] - x[:, None]) >= max(min_width, 0.0)
+    valid &= np.triu(np.ones_like(valid), k=1).astype(bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        intercept = sum_a / n - slope * doses.mean()
+        ss_res = np.maximum(syy - slope * sxy, 0.0)
+        r2 = np.where(syy > 0, 1 - ss_res / syy, np.nan)
+        dose_sigma = np.sqrt(ss_res / (n - 2)) / np.abs(slope)
+
+    for arr in (r2, slope, intercept, dose_sigma):
+        arr[~valid] = np.nan
+    return {"x_min": x, "x_max": x, "r2": r2, "slope": slope,
+            "intercept": intercept, "dose_sigma": dose_sigma}
+
+
+def best_window(scan, criterion="r2"):
+    """
+    Mejor ventana de scan_windows: máximo R² (criterion="r2") o mínima
+    incertidumbre en dosis (criterion="dose_sigma"). Devuelve un dict con
+    x_min, x_max, r2, slope, intercept y dose_sigma de esa ventana.
+    """
+    score = scan[criterion]
+    if np.isnan(score).all():
+        raise ValueError("Ninguna ventana válida en el rango")
+    flat = np.nanargmax(score) if criterion == "r2" else np.nanargmin(score)
+    i, j = np.unravel_index(flat, score.shape)
+    result = {"x_min": float(scan["x_min"][i]), "x_max": float(scan["x_max"][j])}
+    for key in ("r2", "slope", "intercept", "dose_sigma"):
+        result[key] = float(scan[key][i, j])
+    return result
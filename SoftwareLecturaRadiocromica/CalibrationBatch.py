@@ -0,0 +1,258 @@
+import os
+import re
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ImageCache import ImageCache, IMAGE_CACHE
+
+
+# Carga por lotes de imágenes de calibración: una carpeta de escaneos y las
+# dosis de un CSV (archivo, dosis) o del nombre de cada archivo.
+
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg')
+
+
+def dose_from_filename(filename):
+    """Busca #dosis# o la primera cifra del nombre (como en los scripts de espectros)"""
+    name = os.path.basename(filename)
+    m = re.search(r'#(\d+\.?\d*)#', name)
+    if m:
+        return float(m.group(1))
+    m2 = re.search(r'(\d+\.?\d*)', name)
+    return float(m2.group(1)) if m2 else None
+
+
+def read_manifest(path):
+    """
+    Lee un CSV de dosis y devuelve {nombre de archivo: dosis}.
+    Acepta ',' o ';' como separador y una cabecera opcional; se usan las
+    columnas cuyo nombre contiene "arch"/"file"/"imag" y "dos", o las dos
+    primeras si no hay cabecera.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(2048)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        rows = [row for row in csv.reader(f, dialect) if row]
+
+    if not rows:
+        return {}
+
+    file_col, dose_col = 0, 1
+    header = [h.strip().lower() for h in rows[0]]
+    try:
+        float(rows[0][1].replace(',', '.'))
+    except (ValueError, IndexError):
+        # Primera fila = cabecera
+        for i, h in enumerate(header):
+            if any(k in h for k in ('arch', 'file', 'imag')):
+                file_col = i
+            elif 'dos' in h:
+                dose_col = i
+        rows = rows[1:]
+
+    doses = {}
+    for row in rows:
+        try:
+            doses[os.path.basename(row[file_col].strip())] = float(row[dose_col].replace(',', '.'))
+        except (ValueError, IndexError):
+            print(f"Fila ignorada en {os.path.basename(path)}: {row}")
+    return doses
+
+
+def locate_film(img, width, height, min_contrast=10):
+    """
+    Localiza la radiocromica (zona más oscura que el fondo del escáner) y
+    devuelve un recorte (x, y, ancho, alto) centrado en ella. Si no se
+    encuentra, se centra en la imagen.
+    """
+    h, w = img.shape[:2]
+    gray = img[..., :3].mean(axis=-1) if img.ndim == 3 else img
+
+    # Umbral a medio camino entre la película (oscura) y el fondo del escáner
+    dark, light = np.percentile(gray, [2, 98])
+    film = gray < (dark + light) / 2 if light - dark >= min_contrast else np.zeros(gray.shape, bool)
+
+    # Filas/columnas con al menos la mitad de píxeles de película que la más cubierta
+    rows = film.sum(axis=1)
+    cols = film.sum(axis=0)
+    if rows.max() > 0:
+        ys = np.flatnonzero(rows >= 0.5 * rows.max())
+        xs = np.flatnonzero(cols >= 0.5 * cols.max())
+        cy, cx = (ys[0] + ys[-1]) // 2, (xs[0] + xs[-1]) // 2
+    else:
+        cy, cx = h // 2, w // 2
+
+    width, height = min(width, w), min(height, h)
+    x = int(np.clip(cx - width // 2, 0, w - width))
+    y = int(np.clip(cy - height // 2, 0, h - height))
+    return (x, y, width, height)
+
+
+def _window_sums(sat, width, height):
+    """Suma de cada ventana width x height a partir de una tabla de sumas acumuladas"""
+    return sat[height:, width:] - sat[:-height, width:] - sat[height:, :-width] + sat[:-height, :-width]
+
+
+def _summed_area(a):
+    sat = np.zeros((a.shape[0] + 1, a.shape[1] + 1))
+    np.cumsum(a, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def find_uniform_regions(img, width, height, min_contrast=10, max_pixels=2_000_000):
+    """
+    Busca en cada película de la imagen la ventana width x height más uniforme.
+
+    Las películas son las zonas conexas más oscuras que el fondo (mismo umbral
+    que locate_film) en las que cabe la ventana. Con tablas de sumas
+    acumuladas de la máscara, x y x² se obtienen las posiciones válidas y su
+    media y varianza a la vez para todas las películas (O(píxeles), sin
+    importar cuántas manchas haya); se elige la de menor varianza (suma de
+    los canales) que queda entera dentro de la película. Las imágenes con más
+    de `max_pixels` se reducen antes por bloques.
+
+    Devuelve una lista de recortes (x, y, ancho, alto), de arriba abajo y de
+    izquierda a derecha.
+    """
+    from scipy import ndimage
+
+    img = np.asarray(img, dtype=float)
+    if img.ndim == 2:
+        img = img[..., None]
+    img = img[..., :3]
+
+    # Reducción por bloques para escaneos muy grandes
+    f = max(1, int(np.ceil(np.sqrt(img.shape[0] * img.shape[1] / max_pixels))))
+    if f > 1:
+        h, w = img.shape[0] // f * f, img.shape[1] // f * f
+        img = img[:h, :w].reshape(h // f, f, w // f, f, -1).mean(axis=(1, 3))
+    win_w, win_h = max(1, width // f), max(1, height // f)
+    rows, cols = img.shape[:2]
+    if win_w > cols or win_h > rows:
+        return []
+
+    gray = img.mean(axis=-1)
+    dark, light = np.percentile(gray, [2, 98])
+    if light - dark < min_contrast:
+        return []
+    film = gray < (dark + light) / 2
+    labels, _ = ndimage.label(film)
+
+    # Posiciones con la ventana entera dentro de alguna película. Una ventana
+    # sin fondo es conexa, así que todos sus píxeles tienen la misma etiqueta
+    # (la de su esquina): basta una tabla para todas las películas.
+    area = win_w * win_h
+    inside = _window_sums(_summed_area(film), win_w, win_h) >= area - 0.5
+    if not inside.any():
+        return []
+    ys, xs = np.nonzero(inside)
+    owner = labels[ys, xs]
+
+    # Varianza de cada posición válida de la ventana, sumada sobre los canales
+    variance = np.zeros(len(ys))
+    for c in range(img.shape[-1]):
+        mean = _window_sums(_summed_area(img[..., c]), win_w, win_h)[ys, xs] / area
+        variance += _window_sums(_summed_area(img[..., c] ** 2), win_w, win_h)[ys, xs] / area - mean ** 2
+
+    # Posición de menor varianza de cada película (orden estable: en empate, la primera)
+    order = np.lexsort((variance, owner))
+    _, first = np.unique(owner[order], return_index=True)
+    best = order[first]
+    regions = [(int(xs[i] * f), int(ys[i] * f), int(width), int(height)) for i in best]
+
+    regions.sort(key=lambda r: (r[1] // max(height, 1), r[0]))
+    return regions
+
+
+def channel_stats(image_path, width, height, crop_area=None, cache=IMAGE_CACHE):
+    """
+    Medias y desviaciones por canal en el recorte (localizado si no se da).
+    Con un recorte dado solo se decodifica esa zona si la imagen no está en
+    la caché; cache=None lee sin guardar (procesos del lote).
+    """
+    if crop_area is None:
+        if cache is not None:
+            img = cache.get(image_path)
+        else:
+            from PIL import Image
+            img = np.array(Image.open(image_path))
+        # Zona más uniforme de las películas encontradas; si no hay, el centro de la película
+        regions = find_uniform_regions(img, width, height)
+        if regions:
+            crop_area = min(regions, key=lambda r: img[r[1]:r[1]+r[3], r[0]:r[0]+r[2]].astype(float).var())
+        else:
+            crop_area = locate_film(img, width, height)
+        x, y, cw, ch = crop_area
+        cut = img[y:y+ch, x:x+cw]
+    else:
+        cut = (cache if cache is not None else ImageCache()).crop(image_path, crop_area)
+
+    cut = cut.astype(float)
+    means = cut[..., :3].mean(axis=(0, 1))
+    stds = cut[..., :3].std(axis=(0, 1))
+
+    rgb_data = {
+        'red_mean': means[0], 'red_std': stds[0],
+        'green_mean': means[1], 'green_std': stds[1],
+        'blue_mean': means[2], 'blue_std': stds[2],
+    }
+    return crop_area, rgb_data
+
+
+def list_calibration_images(folder, manifest=None):
+    """
+    Devuelve [(ruta, dosis)] de las imágenes de la carpeta y la lista de
+    archivos sin dosis conocida.
+    """
+    doses = read_manifest(manifest) if manifest else {}
+    images, missing = [], []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        dose = doses.get(name) if manifest else dose_from_filename(name)
+        if dose is None or dose <= 0:
+            missing.append(name)
+            continue
+        images.append((os.path.join(folder, name), dose))
+    return images, missing
+
+
+def process_folder(folder, width, height, manifest=None, max_workers=None, progress=None, cancelled=None):
+    """
+    Procesa todas las imágenes de calibración de una carpeta en paralelo.
+
+    Devuelve (resultados, errores): resultados es una lista de
+    (ruta, dosis, recorte, rgb_data) ordenada por dosis y errores una lista
+    de mensajes. `progress(hechas, total)` se llama al terminar cada imagen;
+    si `cancelled()` devuelve True se descartan las imágenes pendientes.
+    """
+    images, missing = list_calibration_images(folder, manifest)
+    errors = [f"{name}: sin dosis" for name in missing]
+    results = []
+    if not images:
+        return results, errors
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(path, dose, pool.submit(channel_stats, path, width, height, None, None))
+                   for path, dose in images]
+        for done, (path, dose, future) in enumerate(futures, 1):
+            if cancelled is not None and cancelled():
+                pool.shutdown(cancel_futures=True)
+                break
+            try:
+                crop_area, rgb_data = future.result()
+                results.append((path, dose, crop_area, rgb_data))
+            except Exception as e:
+                errors.append(f"{os.path.basename(path)}: {e}")
+            if progress is not None:
+                progress(done, len(images))
+
+    results.sort(key=lambda r: r[1])
+    return results, errors
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import struct
+from datetime import datetime
+
+import numpy as np
+
+
+# Archivo de calibración versionado y autodescriptivo (.rccal), común a
+# DoseAnalyzer, CalibrationRC y los scripts de espectroscopía.
+#
+# Estructura:
+#   8 bytes   firma b"RCCALIB\0"
+#   4 bytes   versión (uint32, little endian)
+#   8 bytes   longitud N de la cabecera JSON (uint64)
+#   N bytes   cabecera JSON (familia, canales, metadatos, tabla de arrays)
+#   ...       arrays float64 contiguos, alineados a 64 bytes
+#
+# Los parámetros, covarianzas, ruido de píxel y demás arrays pequeños se copian
+# a memoria al cargar; solo los arrays opcionales grandes (MEMMAP_MIN_BYTES o
+# más) se abren con np.memmap. Así el archivo no queda mapeado mientras
+# DoseAnalyzer tiene la calibración abierta (en Windows otro proceso no podría
+# reemplazarlo), y save escribe en un temporal que se renombra a su sitio.
+
+CALIBRATION_MAGIC = b"RCCALIB\0"
+CALIBRATION_VERSION = 1
+CALIBRATION_SUFFIX = ".rccal"
+_PREFIX = struct.Struct("<8sIQ")
+_ALIGN = 64
+# Arrays que siempre se copian a memoria, y tamaño a partir del cual los demás se mapean
+_IN_MEMORY = ("params", "cov", "pixel_noise")
+MEMMAP_MIN_BYTES = 1 << 20
+
+
+class CalibrationFile:
+    """
+    Calibración de una o varias señales (canales) con la misma familia de modelo.
+
+    params: (k, p) parámetros de cada canal, en el orden de MODELS[family].
+    cov: (k, p, p) covarianzas (opcional).
+    arrays: otros arrays a guardar (ruido de píxel, puntos de calibración...).
+    """
+    def __init__(self, family, params, cov=None, channels=None, film_lot="", scanner="",
+                 created=None, stats=None, metadata=None, arrays=None):
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        self.family = family
+        self.channels = list(channels or [f"canal{i}" for i in range(len(params))])
+        self.film_lot = film_lot
+        self.scanner = scanner
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.stats = dict(stats or {})
+        self.metadata = dict(metadata or {})
+        self.arrays = {"params": params}
+        if cov is not None:
+            self.arrays["cov"] = np.asarray(cov, dtype=float).reshape(len(params), params.shape[1], -1)
+        for name, value in (arrays or {}).items():
+            self.arrays[name] = np.asarray(value, dtype=float)
+        self.path = None
+
+    # ------------------------------------------------------------------
+    # Acceso
+    # ------------------------------------------------------------------
+    @property
+    def params(self):
+        return self.arrays["params"]
+
+    @property
+    def cov(self):
+        return self.arrays.get("cov")
+
+    @property
+    def model(self):
+        from CalibrationModels import MODELS
+        return MODELS[self.family]
+
+    def channel_index(self, channel):
+        return channel if isinstance(channel, int) else self.channels.index(channel)
+
+    def errors(self):
+        """Incertidumbres típicas de los parámetros (k, p); ceros si no hay covarianza"""
+        if self.cov is None:
+            return np.zeros_like(self.params)
+        return np.sqrt(np.diagonal(self.cov, axis1=1, axis2=2))
+
+    def as_dict(self, channel=0):
+        """Parámetros de un canal como dict {nombre: valor, nombre_err: σ, ...estadísticos}"""
+        i = self.channel_index(channel)
+        names = self.model.param_names
+        values = {name: float(v) for name, v in zip(names, self.params[i])}
+        values.update({f"{name}_err": float(e) for name, e in zip(names, self.errors()[i])})
+        values.update(self.stats)
+        return values
+
+    def dose(self, x, channel=0):
+        """Dosis para un array de respuestas de un canal (vectorizado)"""
+        return self.model.dose(x, self.params[self.channel_index(channel)])
+
+    def response(self, doses, channel=0, x_range=None):
+        """Respuesta esperada para un array de dosis (x_range si el modelo no tiene inversa)"""
+        return self.model.response(doses, self.params[self.channel_index(channel)], x_range)
+
+    # ------------------------------------------------------------------
+    # Lectura y escritura
+    # ------------------------------------------------------------------
+    def save(self, path):
+        """
+        Escribe el archivo .rccal (cabecera JSON + arrays binarios alineados)
+        en un temporal que luego reemplaza al archivo (os.replace)
+        """
+        if not path.endswith(CALIBRATION_SUFFIX):
+            path = os.path.splitext(path)[0] + CALIBRATION_SUFFIX
+
+        table, offset = {}, 0
+        for name, value in self.arrays.items():
+            value = np.ascontiguousarray(value, dtype="<f8")
+            table[name] = {"offset": offset, "shape": list(value.shape)}
+            offset += -(-value.nbytes // _ALIGN) * _ALIGN
+
+        header = {
+            "version": CALIBRATION_VERSION,
+            "family": self.family,
+            "param_names": list(self.model.param_names),
+            "channels": self.channels,
+            "film_lot": self.film_lot,
+            "scanner": self.scanner,
+            "created": self.created,
+            "stats": self.stats,
+            "metadata": self.metadata,
+            "arrays": table,
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False, indent=1).encode("utf-8")
+        data_start = -(-(_PREFIX.size + len(header_bytes)) // _ALIGN) * _ALIGN
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_PREFIX.pack(CALIBRATION_MAGIC, CALIBRATION_VERSION, len(header_bytes)))
+                f.write(header_bytes)
+                for name, value in self.arrays.items():
+                    f.seek(data_start + table[name]["offset"])
+                    f.write(np.ascontiguousarray(value, dtype="<f8").tobytes())
+                f.truncate(data_start + offset)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.path = path
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Abre un .rccal; los arrays pequeños se copian a memoria y los grandes
+        quedan mapeados (solo lectura)
+        """
+        arrays = {}
+        with open(path, "rb") as f:
+            magic, version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != CALIBRATION_MAGIC:
+                raise ValueError(f"{path} no es un archivo de calibración")
+            if version > CALIBRATION_VERSION:
+                raise ValueError(f"Versión de calibración {version} no soportada (máx. {CALIBRATION_VERSION})")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            data_start = -(-(_PREFIX.size + header_len) // _ALIGN) * _ALIGN
+            for name, entry in header["arrays"].items():
+                shape = tuple(entry["shape"])
+                count = int(np.prod(shape))
+                offset = data_start + entry["offset"]
+                if name in _IN_MEMORY or 8 * count < MEMMAP_MIN_BYTES:
+                    f.seek(offset)
+                    arrays[name] = np.fromfile(f, dtype="<f8", count=count).reshape(shape)
+                else:
+                    arrays[name] = np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=shape)
+
+        calib = cls.__new__(cls)
+        calib.family = header["family"]
+        calib.channels = header["channels"]
+        calib.film_lot = header.get("film_lot", "")
+        calib.scanner = header.get("scanner", "")
+        calib.created = header.get("created")
+        calib.stats = header.get("stats", {})
+        calib.metadata = header.get("metadata", {})
+        calib.arrays = arrays
+        calib.path = path
+        return calib
+
+
+# ----------------------------------------------------------------------
+# Formatos anteriores
+# ----------------------------------------------------------------------
+def _from_text(path):
+    """'a = x ± y' (LongitudOnda/calibration.py) o la matriz 3x3 de CalibParameters.txt"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    pattern = re.compile(r'^\s*(\w+)\s*=\s*([+-]?[0-9.]+(?:e[+-]?\d+)?)(?:\s*±\s*([0-9.]+(?:e[+-]?\d+)?))?',
+                         re.MULTILINE | re.IGNORECASE)
+    values = {m.group(1): (float(m.group(2)), float(m.group(3) or 0)) for m in pattern.finditer(text)}
+    if {"a", "b", "c"} <= values.keys():
+        params = [values[k][0] for k in "abc"]
+        cov = np.diag([values[k][1] ** 2 for k in "abc"])
+        stats = {k: v[0] for k, v in values.items() if k not in ("a", "b", "c")}
+        return CalibrationFile("exponential", [params], [cov], channels=["OD663"], stats=stats,
+                               metadata={"source": os.path.basename(path)})
+
+    # Matriz 3x3: filas a, b, c; columnas R, G, B. Covarianzas de CalibCovariance.txt si existe
+    matrix = np.loadtxt(path).reshape(3, 3)
+    cov = None
+    cov_path = os.path.join(os.path.dirname(path), "CalibCovariance.txt")
+    if os.path.isfile(cov_path):
+        cov = np.loadtxt(cov_path).reshape(3, 3, 3)
+    return CalibrationFile("rational", matrix.T, cov, channels=["R", "G", "B"],
+                           metadata={"source": os.path.basename(path)})
+
+
+def _from_mapping(d, source):
+    """dict con slope/intercept (parametros_calibracion.json, calibration_model.pkl)"""
+    params = [d["slope"], d["intercept"]]
+    errs = [d.get("slope_err", d.get("std_err", 0.0)), d.get("intercept_err", 0.0)]
+    stats = {k: v for k, v in d.items()
+             if k not in ("slope", "intercept", "slope_err", "std_err", "intercept_err")
+             and isinstance(v, (int, float))}
+    return CalibrationFile("linear", [params], [np.diag(np.square(errs))], channels=["señal"],
+                           stats=stats, metadata={"source": source})
+
+
+def load_calibration(path):
+    """
+    Carga una calibración en cualquier formato conocido: .rccal o los
+    anteriores (CalibParameters.txt, 'a = x ± y', JSON o pickle con
+    slope/intercept), convertidos a CalibrationFile.
+    """
+    with open(path, "rb") as f:
+        head = f.read(len(CALIBRATION_MAGIC))
+    if head == CALIBRATION_MAGIC:
+        return CalibrationFile.load(path)
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return _from_mapping(json.load(f), os.path.basename(path))
+    if ext == ".pkl":
+        import pickle
+        with open(path, "rb") as f:
+            return _from_mapping(pickle.load(f), os.path.basename(path))
+    return _from_text(path)
@@ -0,0 +1,130 @@
+import numpy as np
+
+
+# Ajuste de la calibración D = a + b / (P - c) de varios canales a la vez.
+# Los tres canales se ajustan en una única llamada a least_squares con un
+# jacobiano analítico diagonal por bloques (canal a canal).
+
+LOSSES = {
+    "linear": "Mínimos cuadrados",
+    "soft_l1": "Robusto (soft L1)",
+    "huber": "Robusto (Huber)",
+}
+
+
+def rational(x, a, b, c):
+    """Modelo de calibración D = a + b / (x - c)"""
+    return a + b / (x - c)
+
+
+def rational_jacobian(x, a, b, c):
+    """Derivadas de D respecto a (a, b, c); devuelve (..., 3)"""
+    inv = 1.0 / (x - c)
+    return np.stack([np.ones_like(inv), inv, b * inv ** 2], axis=-1)
+
+
+def dose_sigma(x, x_std, params, floor=1e-3):
+    """Incertidumbre de la dosis de cada punto a partir de la del píxel: |dD/dx| * std"""
+    a, b, c = params
+    sigma = np.abs(b / (x - c) ** 2) * x_std
+    # Evitar pesos infinitos en recortes sin dispersión
+    positive = sigma[sigma > 0]
+    return np.maximum(sigma, floor * (np.median(positive) if positive.size else 1.0))
+
+
+def initial_guess(x, doses, n_grid=200):
+    """
+    Parámetros iniciales (a, b, c) de D = a + b / (x - c) sin iterar.
+
+    D (x - c) = a x - a c + b es lineal en (a, c, b - a c): D x = a x + c D + k,
+    que se resuelve por mínimos cuadrados. Si el polo c cae dentro del rango
+    de los datos (o la solución no es finita) se busca c en una rejilla a
+    ambos lados del rango, resolviendo (a, b) linealmente para cada c.
+    """
+    x = np.asarray(x, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+
+    design = np.column_stack((x, doses, np.ones_like(x)))
+    (a, c, k), *_ = np.linalg.lstsq(design, doses * x, rcond=None)
+    b = k + a * c
+    if np.all(np.isfinite((a, b, c))) and not (x.min() <= c <= x.max()) and b != 0:
+        return np.array([a, b, c])
+
+    # Rejilla de polos fuera del rango de los datos
+    span = max(x.max() - x.min(), 1e-6)
+    offsets = span * np.logspace(-3, 2, n_grid // 2)
+    cs = np.concatenate((x.min() - offsets, x.max() + offsets))
+
+    # Para cada c: D = a + b * u con u = 1/(x - c), regresión lineal vectorizada
+    u = 1.0 / (x[None, :] - cs[:, None])
+    u_mean = u.mean(axis=1, keepdims=True)
+    d_mean = doses.mean()
+    bs = ((u - u_mean) * (doses - d_mean)).sum(axis=1) / ((u - u_mean) ** 2).sum(axis=1)
+    as_ = d_mean - bs * u_mean[:, 0]
+    sse = ((as_[:, None] + bs[:, None] * u - doses) ** 2).sum(axis=1)
+    best = np.nanargmin(sse)
+    return np.array([as_[best], bs[best], cs[best]])
+
+
+def fit_channels(pixels, doses, p0=None, pixel_std=None, loss="linear", f_scale=1.0):
+    """
+    Ajusta todos los canales en una sola llamada.
+
+    pixels: (n, k) valores de píxel de cada punto y canal.
+    doses: (n,) dosis de referencia.
+    p0: (k, 3) parámetros iniciales (a, b, c) de cada canal; por defecto
+        los de initial_guess.
+    pixel_std: (n, k) desviación de cada recorte; si se da, cada punto se
+        pondera con la incertidumbre de dosis que induce (|dD/dx| * std).
+    loss: "linear", "soft_l1" o "huber" (ver scipy.optimize.least_squares).
+
+    Devuelve (params (k, 3), cov (k, 3, 3), nfev).
+    """
+    from scipy.optimize import least_squares
+
+    pixels = np.asarray(pixels, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+    n, k = pixels.shape
+    if p0 is None:
+        p0 = [initial_guess(pixels[:, j], doses) for j in range(k)]
+
+    def solve(start, sigma):
+        def residuals(theta):
+            a, b, c = theta.reshape(k, 3).T
+            return ((rational(pixels, a, b, c) - doses[:, None]) / sigma).T.ravel()
+
+        def jacobian(theta):
+            a, b, c = theta.reshape(k, 3).T
+            blocks = rational_jacobian(pixels, a, b, c) / sigma[..., None]  # (n, k, 3)
+            jac = np.zeros((k, n, k, 3))
+            jac[np.arange(k), :, np.arange(k), :] = blocks.transpose(1, 0, 2)
+            return jac.reshape(k * n, k * 3)
+
+        result = least_squares(residuals, np.ravel(start), jac=jacobian, loss=loss,
+                               f_scale=f_scale, method="trf")
+        if not result.success:
+            raise RuntimeError(f"El ajuste de calibración no convergió: {result.message}")
+        return result
+
+    # Sin pesos primero; con desviaciones, se repite ponderando con la
+    # incertidumbre de dosis evaluada en esa solución (arranca ya en el óptimo)
+    result = solve(p0, np.ones((n, k)))
+    nfev = result.nfev
+    if pixel_std is not None:
+        pixel_std = np.asarray(pixel_std, dtype=float)
+        start = result.x.reshape(k, 3)
+        sigma = np.stack([dose_sigma(pixels[:, j], pixel_std[:, j], start[j]) for j in range(k)], axis=1)
+        result = solve(start, sigma)
+        nfev += result.nfev
+
+    params = result.x.reshape(k, 3)
+
+    # Covarianza por canal: (J^T J)^-1 escalada con la varianza residual (como curve_fit)
+    res = result.fun.reshape(k, n)
+    jac = result.jac.reshape(k, n, k, 3)[np.arange(k), :, np.arange(k), :]  # (k, n, 3)
+    dof = max(n - 3, 1)
+    cov = np.empty((k, 3, 3))
+    for j in range(k):
+        cov[j] = np.linalg.pinv(jac[j].T @ jac[j]) * (res[j] @ res[j] / dof)
+
+    return params, cov, nfev
@@ -0,0 +1,332 @@
+import numpy as np
+
+from CalibrationFit import rational, rational_jacobian, initial_guess
+
+
+# Registro de familias de modelos de calibración dosis <- respuesta.
+#
+# Todas las familias se expresan en el mismo sentido, D = dose(x, *p), con
+# x la respuesta medida (valor de píxel, OD, netOD...), para que los
+# residuos, y por tanto AIC/BIC, sean comparables entre modelos. Cada
+# familia indica si trabaja sobre la respuesta tal cual ("raw") o sobre la
+# densidad óptica neta ("netod", ver net_od).
+
+class CalibrationFamily:
+    """Familia de modelos: D = dose(x, *p) y su inversa x = response(D, *p)"""
+    def __init__(self, name, label, param_names, dose, initial, response=None,
+                 jacobian=None, slope=None, variable="raw", selectable=True):
+        self.name = name
+        self.label = label
+        self.param_names = param_names
+        self._dose = dose
+        self._response = response
+        self.jacobian = jacobian
+        # dD/dx analítica (opcional; si no, diferencias centradas en dose_slope)
+        self.slope = slope
+        self.initial = initial
+        self.variable = variable
+        # Las familias no seleccionables solo se usan para leer/escribir calibraciones
+        self.selectable = selectable
+
+    @property
+    def n_params(self):
+        return len(self.param_names)
+
+    def dose(self, x, params):
+        """Dosis para un array de respuestas (vectorizado)"""
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            return self._dose(np.asarray(x, dtype=float), *params)
+
+    def dose_slope(self, x, params, rel_step=1e-6):
+        """Derivada dD/dx para un array de respuestas (vectorizado)"""
+        x = np.asarray(x, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            if self.slope is not None:
+                return self.slope(x, *params)
+            h = rel_step * np.maximum(np.abs(x), 1.0)
+            return (self._dose(x + h, *params) - self._dose(x - h, *params)) / (2 * h)
+
+    def response(self, doses, params, x_range=None, n_grid=2048):
+        """
+        Respuesta para un array de dosis. Si la familia no tiene inversa
+        analítica se interpola sobre una tabla de `n_grid` puntos en
+        `x_range` (el modelo debe ser monótono en ese rango).
+        """
+        doses = np.asarray(doses, dtype=float)
+        if self._response is not None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return self._response(doses, *params)
+        if x_range is None:
+            raise ValueError(f"El modelo '{self.name}' necesita x_range para invertirse")
+        grid = np.linspace(*x_range, n_grid)
+        table = self.dose(grid, params)
+        order = np.argsort(table)
+        return np.interp(doses, table[order], grid[order], left=np.nan, right=np.nan)
+
+
+MODELS = {}
+
+
+def register_model(family):
+    """Añade una familia al registro (o reemplaza la del mismo nombre)"""
+    MODELS[family.name] = family
+    return family
+
+
+def net_od(x, reference, kind="pixel"):
+    """
+    Densidad óptica neta respecto a la película sin irradiar.
+    kind="pixel": x son valores de píxel, netOD = log10(ref / x).
+    kind="od": x ya son densidades ópticas (espectros), netOD = x - ref.
+    """
+    x = np.asarray(x, dtype=float)
+    if kind == "pixel":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.log10(reference / x)
+    return x - reference
+
+
+# ----------------------------------------------------------------------
+# Familias incluidas
+# ----------------------------------------------------------------------
+def _rational_response(d, a, b, c):
+    return c + b / (d - a)
+
+
+register_model(CalibrationFamily(
+    "rational", "Racional a + b/(x - c)", ("a", "b", "c"),
+    rational, initial_guess, _rational_response,
+    jacobian=lambda x, a, b, c: rational_jacobian(x, a, b, c),
+    slope=lambda x, a, b, c: -b / (x - c) ** 2,
+))
+
+
+def _exponential_dose(x, a, b, c):
+    # Respuesta x = a exp(b D) + c (como en LongitudOnda/calibration.py)
+    return np.log((x - c) / a) / b
+
+
+def _exponential_response(d, a, b, c):
+    return a * np.exp(b * d) + c
+
+
+def _exponential_jacobian(x, a, b, c):
+    u = np.log((x - c) / a)
+    return np.stack([-1.0 / (a * b) * np.ones_like(x), -u / b ** 2, -1.0 / (b * (x - c))], axis=-1)
+
+
+def _exponential_initial(x, doses, n_grid=200):
+    """Para cada c de una rejilla fuera del rango, ln|x - c| = ln|a| + b D es lineal"""
+    span = max(x.max() - x.min(), 1e-6)
+    offsets = span * np.logspace(-3, 2, n_grid // 2)
+    best, best_sse = None, np.inf
+    for c in np.concatenate((x.min() - offsets, x.max() + offsets)):
+        y = np.log(np.abs(x - c))
+        b, ln_a = np.polyfit(doses, y, 1)
+        if b == 0:
+            continue
+        a = np.sign(x[0] - c) * np.exp(ln_a)
+        sse = np.sum((_exponential_dose(x, a, b, c) - doses) ** 2)
+        if np.isfinite(sse) and sse < best_sse:
+            best, best_sse = np.array([a, b, c]), sse
+    return best
+
+
+register_model(CalibrationFamily(
+    "exponential", "Exponencial x = a·exp(b·D) + c", ("a", "b", "c"),
+    _exponential_dose, _exponential_initial, _exponential_response,
+    jacobian=_exponential_jacobian,
+    slope=lambda x, a, b, c: 1.0 / (b * (x - c)),
+))
+
+
+def _polynomial_family(degree):
+    names = tuple(f"p{i}" for i in range(degree + 1))
+
+    def dose(x, *p):
+        return np.polyval(p[::-1], x)
+
+    def jacobian(x, *p):
+        return np.stack([x ** i for i in range(degree + 1)], axis=-1)
+
+    def slope(x, *p):
+        return np.polyval(np.polyder(p[::-1]), x)
+
+    def initial(x, doses):
+        # Lineal en los parámetros: la solución directa es ya la óptima
+        return np.polyfit(x, doses, degree)[::-1]
+
+    return CalibrationFamily(
+        f"poly{degree}", f"Polinomio de grado {degree} en netOD", names,
+        dose, initial, jacobian=jacobian, slope=slope, variable="netod",
+    )
+
+
+register_model(_polynomial_family(1))
+register_model(_polynomial_family(3))
+
+
+def _devic_dose(x, a, b, n):
+    return a * x + b * np.abs(x) ** n
+
+
+def _devic_jacobian(x, a, b, n):
+    ax = np.abs(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_ax = np.where(ax > 0, np.log(ax), 0.0)
+    return np.stack([x, ax ** n, b * ax ** n * log_ax], axis=-1)
+
+
+def _devic_initial(x, doses):
+    """Rejilla en n; para cada n, (a, b) por mínimos cuadrados lineales"""
+    best, best_sse = None, np.inf
+    for n in np.linspace(1.2, 4.0, 57):
+        design = np.column_stack((x, np.abs(x) ** n))
+        (a, b), *_ = np.linalg.lstsq(design, doses, rcond=None)
+        sse = np.sum((design @ (a, b) - doses) ** 2)
+        if sse < best_sse:
+            best, best_sse = np.array([a, b, n]), sse
+    return best
+
+
+register_model(CalibrationFamily(
+    "devic", "Devic a·netOD + b·netOD^n", ("a", "b", "n"),
+    _devic_dose, _devic_initial, jacobian=_devic_jacobian,
+    slope=lambda x, a, b, n: a + b * n * np.sign(x) * np.abs(x) ** (n - 1), variable="netod",
+))
+
+
+def _linear_dose(x, slope, intercept):
+    # Respuesta x = slope·D + intercept (integrales, sumas de Lorentzianas, OD a 663 nm)
+    return (x - intercept) / slope
+
+
+def _linear_response(d, slope, intercept):
+    return slope * d + intercept
+
+
+def _linear_jacobian(x, slope, intercept):
+    return np.stack([-(x - intercept) / slope ** 2, -np.ones_like(x) / slope], axis=-1)
+
+
+def _linear_initial(x, doses):
+    return np.polyfit(doses, x, 1)
+
+
+# Equivalente a poly1 en la respuesta, pero con los parámetros de los scripts
+# de espectroscopía; no entra en la selección automática para no duplicarla.
+register_model(CalibrationFamily(
+    "linear", "Lineal x = slope·D + intercept", ("slope", "intercept"),
+    _linear_dose, _linear_initial, _linear_response,
+    jacobian=_linear_jacobian, slope=lambda x, slope, intercept: np.ones_like(x) / slope,
+    selectable=False,
+))
+
+
+# ----------------------------------------------------------------------
+# Ajuste y selección de modelo
+# ----------------------------------------------------------------------
+def fit_model(name, x, doses, sigma=None, p0=None):
+    """
+    Ajusta la familia `name` (D frente a x) y devuelve un dict con
+    params, cov, sse (ponderada), aic, bic y n.
+    """
+    from scipy.optimize import least_squares
+
+    family = MODELS[name]
+    x = np.asarray(x, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+    sigma = np.ones_like(doses) if sigma is None else np.asarray(sigma, dtype=float)
+    if p0 is None:
+        p0 = family.initial(x, doses)
+
+    def residuals(p):
+        r = (family.dose(x, p) - doses) / sigma
+        return np.where(np.isfinite(r), r, 1e6)
+
+    def analytic_jac(p):
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            j = family.jacobian(x, *p) / sigma[:, None]
+        return np.where(np.isfinite(j), j, 0.0)
+
+    jac = analytic_jac if family.jacobian is not None else "2-point"
+    result = least_squares(residuals, np.asarray(p0, dtype=float), jac=jac, method="trf")
+
+    n, k = len(doses), family.n_params
+    sse = float(result.fun @ result.fun)
+    dof = max(n - k, 1)
+    cov = np.linalg.pinv(result.jac.T @ result.jac) * (sse / dof)
+    log_term = n * np.log(max(sse, 1e-300) / n)
+    return {
+        "model": name,
+        "params": result.x,
+        "cov": cov,
+        "sse": sse,
+        "aic": log_term + 2 * k,
+        "bic": log_term + k * np.log(n),
+        "n": n,
+        "success": bool(result.success),
+    }
+
+
+def _fit_task(args):
+    name, channel, x, doses, sigma = args
+    try:
+        return channel, fit_model(name, x, doses, sigma)
+    except Exception as e:
+        return channel, {"model": name, "error": str(e), "aic": np.inf, "bic": np.inf}
+
+
+def select_model(x, doses, models=None, sigma=None, reference=None, kind="pixel",
+                 criterion="aic", parallel=True, max_workers=None):
+    """
+    Ajusta todas las familias a todos los canales y elige la mejor por AIC o BIC.
+
+    x: (n,) o (n, k) respuestas medidas; sigma con la misma forma (opcional).
+    reference: respuesta de la película sin irradiar (escalar o una por
+        canal) para las familias en netOD. Sin ella esas familias no se
+        ajustan: medir la netOD desde la menor dosis, que no es 0 Gy, falsea
+        su ranking (sobre todo el de Devic, sin término independiente).
+    kind: "pixel" u "od".
+    Con `parallel` los ajustes (familia x canal) se reparten en un pool de procesos.
+
+    Devuelve (mejores, todos): mejores[canal] es el dict del modelo elegido y
+    todos[canal] la lista de ajustes ordenada por el criterio.
+    """
+    x = np.asarray(x, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    if sigma is not None:
+        sigma = np.asarray(sigma, dtype=float).reshape(x.shape)
+    names = list(models or [name for name, family in MODELS.items() if family.selectable])
+
+    if reference is None:
+        names = [name for name in names if MODELS[name].variable != "netod"]
+        reference = np.full(x.shape[1:], np.nan)
+    reference = np.broadcast_to(np.asarray(reference, dtype=float), x.shape[1:])
+
+    tasks = []
+    for channel in range(x.shape[1]):
+        raw = x[:, channel]
+        netod = net_od(raw, reference[channel], kind)
+        s = None if sigma is None else sigma[:, channel]
+        for name in names:
+            xv = netod if MODELS[name].variable == "netod" else raw
+            tasks.append((name, channel, xv, doses, s))
+
+    if parallel and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_fit_task, tasks))
+    else:
+        results = [_fit_task(t) for t in tasks]
+
+    fits = [[] for _ in range(x.shape[1])]
+    for channel, fit in results:
+        if MODELS[fit["model"]].variable == "netod":
+            fit["reference"] = float(reference[channel])
+        fits[channel].append(fit)
+    for channel_fits in fits:
+        channel_fits.sort(key=lambda f: f[criterion])
+    return [channel_fits[0] for channel_fits in fits], fits
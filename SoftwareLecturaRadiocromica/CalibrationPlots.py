@@ -0,0 +1,460 @@
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+from ImageCache import IMAGE_CACHE
+
+# Canvases de matplotlib usados por CalibrationRC.py. Viven en un módulo aparte
+# para que matplotlib solo se importe cuando se abre la primera gráfica.
+
+class ImageCanvas(FigureCanvas):
+    """Canvas para mostrar y seleccionar áreas en imágenes"""
+    def __init__(self, parent=None, width=8, height=6, dpi=100):
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        self.axes = self.fig.add_subplot(111)
+        
+        # Configurar estilo oscuro
+        self.fig.patch.set_facecolor('#2D2D30')
+        self.axes.set_facecolor('#1E1E1E')
+        self.axes.tick_params(colors='white')
+        
+        super(ImageCanvas, self).__init__(self.fig)
+        self.setParent(parent)
+        
+        self.image = None
+        self.image_array = None
+        self.crop_rect = None
+        self.crop_start = None
+        self.crop_size = (100, 100)
+        self.is_dragging = False
+        
+        # Recortes ya guardados de esta imagen y zonas uniformes propuestas
+        self.regions = []
+        self.region_artists = []
+        
+        self.mpl_connect('button_press_event', self.on_press)
+        self.mpl_connect('button_release_event', self.on_release)
+        self.mpl_connect('motion_notify_event', self.on_motion)
+    
+    def load_image(self, image_path):
+        """Carga una imagen en el canvas"""
+        try:
+            # Misma caché que usan los trabajos de estadísticas de los recortes
+            self.image_array = IMAGE_CACHE.get(image_path)
+            
+            # Limpiar ejes antes de mostrar nueva imagen
+            self.axes.clear()
+            
+            self.image = self.axes.imshow(self.image_array)
+            self.crop_rect = None
+            self.regions = []
+            self.region_artists = []
+            
+            # Ajustar límites de los ejes
+            self.axes.set_xlim(0, self.image_array.shape[1])
+            self.axes.set_ylim(self.image_array.shape[0], 0)
+            
+            self.fig.tight_layout()
+            self.draw_idle()  # Usar draw_idle en lugar de canvas.draw para mejor rendimiento
+            return True
+        except Exception as e:
+            print(f"Error al cargar la imagen: {e}")
+            return False
+    
+    def set_crop_size(self, width, height):
+        """Establece el tamaño del área de recorte"""
+        self.crop_size = (width, height)
+        if self.crop_rect:
+            self.update_crop_rect(self.crop_rect.get_x(), self.crop_rect.get_y())
+    
+    def on_press(self, event):
+        """Maneja el evento de presionar el botón del ratón"""
+        if event.inaxes != self.axes or self.image is None:
+            return
+        
+        # Un clic dentro de un recorte guardado o propuesto lo selecciona tal cual
+        for x, y, w, h in self.regions:
+            if x <= event.xdata <= x + w and y <= event.ydata <= y + h:
+                self.set_crop_area((x, y, w, h))
+                return
+        
+        self.is_dragging = True
+        self.crop_start = (event.xdata, event.ydata)
+        
+        if self.crop_rect:
+            self.crop_rect.remove()
+        
+        self.crop_rect = self.axes.add_patch(
+            plt.Rectangle((event.xdata, event.ydata), 
+                         self.crop_size[0], self.crop_size[1],
+                         linewidth=2, edgecolor='r', facecolor='none')
+        )
+        self.draw_idle()
+    
+    def on_motion(self, event):
+        """Maneja el evento de mover el ratón"""
+        if not self.is_dragging or event.inaxes != self.axes or self.crop_rect is None:
+            return
+        
+        self.update_crop_rect(event.xdata, event.ydata)
+    
+    def on_release(self, event):
+        """Maneja el evento de soltar el botón del ratón"""
+        self.is_dragging = False
+    
+    def update_crop_rect(self, x, y):
+        """Actualiza la posición del rectángulo de recorte"""
+        if self.image is None or self.crop_rect is None:
+            return
+        
+        # Asegurar que el rectángulo esté dentro de los límites de la imagen
+        height, width = self.image_array.shape[:2]
+        
+        x = max(0, min(width - self.crop_size[0], x))
+        y = max(0, min(height - self.crop_size[1], y))
+        
+        self.crop_rect.set_xy((x, y))
+        self.draw_idle()
+    
+    def get_crop_area(self):
+        """Devuelve el área de recorte actual"""
+        if self.crop_rect is None:
+            return None
+        
+        x, y = self.crop_rect.get_xy()
+        return (int(x), int(y), int(self.crop_size[0]), int(self.crop_size[1]))
+    
+    def set_crop_area(self, crop_area):
+        """Establece el área de recorte desde coordenadas existentes"""
+        if self.image is None:
+            return
+        
+        x, y, width, height = crop_area
+        self.crop_size = (width, height)
+        
+        if self.crop_rect:
+            self.crop_rect.remove()
+        
+        self.crop_rect = self.axes.add_patch(
+            plt.Rectangle((x, y), width, height,
+                         linewidth=2, edgecolor='r', facecolor='none')
+        )
+        self.draw_idle()
+
+    def show_regions(self, saved=(), candidates=()):
+        """
+        Dibuja los recortes guardados de la imagen (saved: [(recorte, etiqueta)])
+        y las zonas uniformes propuestas (candidates: [recorte], numeradas).
+        """
+        if self.image is None:
+            return
+        for artist in self.region_artists:
+            artist.remove()
+        self.region_artists = []
+        self.regions = []
+        
+        items = [(area, label, 'yellow') for area, label in saved]
+        items += [(area, str(i), 'cyan') for i, area in enumerate(candidates, 1)]
+        for (x, y, w, h), label, color in items:
+            self.region_artists.append(self.axes.add_patch(
+                plt.Rectangle((x, y), w, h, linewidth=1.5, edgecolor=color,
+                              facecolor='none', linestyle='--')
+            ))
+            self.region_artists.append(self.axes.text(
+                x, y - 4, label, color=color, fontsize=8, va='bottom'
+            ))
+            self.regions.append((x, y, w, h))
+        self.draw_idle()
+
+# ----------------------------------------------------------------------
+# Curvas de calibración
+#
+# Cada figura se describe con una clase "vista" que crea sus artistas una vez
+# y después solo actualiza sus datos (set_data / set_offsets) con la curva
+# evaluada de forma vectorizada. Los canvases Qt usan las vistas con blitting;
+# export_figures las usa sobre figuras Agg fuera de pantalla.
+# ----------------------------------------------------------------------
+CHANNELS = (('red', 'Rojo'), ('green', 'Verde'), ('blue', 'Azul'))
+
+
+def calibration_data(model):
+    """Copia de los datos de CalibrationModel necesarios para dibujar (segura entre hilos)"""
+    params = None
+    if model.red_params is not None and model.green_params is not None and model.blue_params is not None:
+        params = np.vstack((model.red_params, model.green_params, model.blue_params))
+    return {
+        'doses': np.asarray(model.doses, dtype=float),
+        'pixels': np.column_stack((model.red_values, model.green_values, model.blue_values)).reshape(-1, 3),
+        'params': params,
+        'validation': getattr(model, 'validation', None),
+    }
+
+
+def curve_points(values, params, n=200, gap=1.0):
+    """Curva D = a + b / (x - c) en el rango de `values`; NaN junto al polo para cortar la línea"""
+    xs = np.linspace(np.min(values), np.max(values), n)
+    a, b, c = params
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ys = a + b / (xs - c)
+    ys[np.abs(xs - c) <= gap] = np.nan
+    return xs, ys
+
+
+def _set_limits(ax, xs, ys, margin=0.05):
+    """Ajusta los límites a los datos; devuelve True si han cambiado"""
+    xs = np.concatenate([np.ravel(x) for x in xs])
+    ys = np.concatenate([np.ravel(y) for y in ys])
+    xs, ys = xs[np.isfinite(xs)], ys[np.isfinite(ys)]
+    if not xs.size or not ys.size:
+        return False
+    limits = []
+    for lo, hi in ((xs.min(), xs.max()), (ys.min(), ys.max())):
+        pad = (hi - lo) * margin or 1.0
+        limits.append((lo - pad, hi + pad))
+    if np.allclose((ax.get_xlim(), ax.get_ylim()), limits):
+        return False
+    ax.set_xlim(limits[0])
+    ax.set_ylim(limits[1])
+    return True
+
+
+def _white_axes(fig, axes):
+    fig.patch.set_facecolor('white')
+    for ax in axes:
+        ax.set_facecolor('white')
+        ax.tick_params(colors='black')
+        ax.xaxis.label.set_color('black')
+        ax.yaxis.label.set_color('black')
+        ax.title.set_color('black')
+
+
+class ChannelCurveView:
+    """Puntos y curva ajustada de un canal sobre unos ejes"""
+    def __init__(self, ax, channel, label=''):
+        suffix = f' {label}' if label else ''
+        self.points = ax.scatter([], [], color=channel, alpha=0.7, label=f'Datos{suffix}')
+        self.curve, = ax.plot([], [], color=channel, linestyle='-', label=f'Ajuste{suffix}')
+        self.artists = [self.points, self.curve]
+
+    def update(self, values, doses, params):
+        """Actualiza los datos; devuelve los (x, y) dibujados para ajustar límites"""
+        self.points.set_offsets(np.column_stack((values, doses)))
+        if params is None or not len(values):
+            self.curve.set_data([], [])
+            return [values], [doses]
+        xs, ys = curve_points(values, params)
+        self.curve.set_data(xs, ys)
+        return [values, xs], [doses, ys]
+
+
+class CurvesView:
+    """Las tres curvas de calibración en unos mismos ejes"""
+    def __init__(self, fig, title='Curvas calibración'):
+        self.ax = fig.add_subplot(111)
+        _white_axes(fig, [self.ax])
+        self.ax.set_xlabel('Valor de Píxel')
+        self.ax.set_ylabel('Dosis (Gy)')
+        self.ax.set_title(title)
+        self.ax.grid(True, linestyle='--', alpha=0.5)
+        self.channels = [ChannelCurveView(self.ax, channel, f'Canal {label}') for channel, label in CHANNELS]
+        self.ax.legend()
+        self.artists = [a for view in self.channels for a in view.artists]
+
+    def update(self, data):
+        xs, ys = [], []
+        for j, view in enumerate(self.channels):
+            params = None if data['params'] is None else data['params'][j]
+            x, y = view.update(data['pixels'][:, j], data['doses'], params)
+            xs += x
+            ys += y
+        return _set_limits(self.ax, xs, ys)
+
+
+class SingleChannelView:
+    """Curva de calibración de un solo canal"""
+    def __init__(self, fig, channel, title):
+        self.ax = fig.add_subplot(111)
+        _white_axes(fig, [self.ax])
+        self.ax.set_xlabel('Valor de Píxel')
+        self.ax.set_ylabel('Dosis (Gy)')
+        self.ax.set_title(title)
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        self.index = [c for c, _ in CHANNELS].index(channel)
+        self.view = ChannelCurveView(self.ax, channel)
+        self.ax.legend()
+        self.artists = self.view.artists
+
+    def update(self, data):
+        params = None if data['params'] is None else data['params'][self.index]
+        xs, ys = self.view.update(data['pixels'][:, self.index], data['doses'], params)
+        return _set_limits(self.ax, xs, ys)
+
+
+class ResidualsView:
+    """Residuos de cada canal, con la banda bootstrap y los residuos LOO si hay validación"""
+    def __init__(self, fig):
+        from matplotlib.patches import Polygon
+
+        self.fig = fig
+        self.axes = fig.subplots(1, 3, sharey=True)
+        _white_axes(fig, self.axes)
+        self.titles = [f'Residuales {label}' for _, label in CHANNELS]
+        self.residuals, self.loo, self.bands, self.legends = [], [], [], []
+        for ax, (channel, _), title in zip(self.axes, CHANNELS, self.titles):
+            ax.set_xlabel('Valor de Píxel')
+            ax.set_title(title, fontsize=9)
+            ax.axhline(0, linestyle='--', color='gray', linewidth=1)
+            ax.grid(True, linestyle='--', alpha=0.5)
+            band = ax.add_patch(Polygon(np.zeros((0, 2)), closed=True, color=channel, alpha=0.15,
+                                        linewidth=0, label='IC bootstrap'))
+            loo = ax.scatter([], [], facecolors='none', edgecolors=channel, alpha=0.7, label='LOO')
+            res = ax.scatter([], [], color=channel, alpha=0.7, label='Ajuste')
+            legend = ax.legend(fontsize=7)
+            legend.set_visible(False)
+            self.bands.append(band)
+            self.loo.append(loo)
+            self.residuals.append(res)
+            self.legends.append(legend)
+        self.axes[0].set_ylabel('Residuos (Gy)')
+        fig.tight_layout()
+        self.artists = self.bands + self.loo + self.residuals + [ax.title for ax in self.axes]
+
+    def update(self, data):
+        validation = data['validation']
+        changed = False
+        all_x, all_y = [], []
+        for j, ax in enumerate(self.axes):
+            values = data['pixels'][:, j]
+            if data['params'] is None:
+                res = np.zeros(0)
+                values = values[:0]
+            else:
+                a, b, c = data['params'][j]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    res = data['doses'] - (a + b / (values - c))
+            self.residuals[j].set_offsets(np.column_stack((values, res)))
+            xs, ys = [values], [res, [0.0]]
+
+            show = validation is not None and len(validation['loo_residuals']) == len(values)
+            if show:
+                # Banda de confianza de la curva, centrada en el ajuste nominal
+                bx = validation['band_x'][j]
+                nominal = validation['band_nominal'][j]
+                low, high = validation['band_low'][j] - nominal, validation['band_high'][j] - nominal
+                self.bands[j].set_xy(np.column_stack((np.r_[bx, bx[::-1]], np.r_[high, low[::-1]])))
+                self.loo[j].set_offsets(np.column_stack((values, validation['loo_residuals'][:, j])))
+                stats = validation['stats'][j]
+                ax.set_title(f"{self.titles[j]}\nRMSE {stats['rmse']:.3f} Gy · LOO {stats['loo_rmse']:.3f} Gy",
+                             fontsize=9)
+                xs.append(bx)
+                ys += [low, high, validation['loo_residuals'][:, j]]
+            else:
+                self.bands[j].set_xy(np.zeros((0, 2)))
+                self.loo[j].set_offsets(np.zeros((0, 2)))
+                ax.set_title(self.titles[j], fontsize=9)
+
+            if self.legends[j].get_visible() != show:
+                self.legends[j].set_visible(show)
+                changed = True
+            all_x.append(xs)
+            all_y += ys
+
+        # sharey: el eje y es común a los tres canales
+        for ax, xs in zip(self.axes, all_x):
+            changed |= _set_limits(ax, xs, all_y)
+        return changed
+
+
+def export_figures(data, directory, dpi=300):
+    """
+    Guarda todas las gráficas de la calibración en `directory` sin pasar por
+    la pantalla (figuras Agg, se puede llamar desde un hilo de trabajo).
+    Devuelve la lista de archivos escritos.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figures = [
+        ("calibration_curves_combined.png", (8, 6), CurvesView),
+        ("residuals.png", (12, 4), ResidualsView),
+    ]
+    for channel, label in CHANNELS:
+        figures.append((f"calibration_curve_{channel}.png", (6, 5),
+                        lambda fig, channel=channel, label=label:
+                        SingleChannelView(fig, channel, f'Curva de Calibración - Canal {label}')))
+
+    written = []
+    for filename, size, view_class in figures:
+        fig = Figure(figsize=size, dpi=100)
+        FigureCanvasAgg(fig)
+        view_class(fig).update(data)
+        path = os.path.join(directory, filename)
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+        written.append(path)
+    return written
+
+
+class BlitCanvas(FigureCanvas):
+    """
+    Canvas que, mientras los ejes no cambian, solo redibuja sus artistas de
+    datos sobre el fondo guardado (blitting). Si cambian los límites o la
+    leyenda se redibuja la figura completa.
+    """
+    def __init__(self, view_factory, parent=None, width=8, height=6, dpi=100):
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        super().__init__(self.fig)
+        self.setParent(parent)
+        self.view = view_factory(self.fig)
+        for artist in self.view.artists:
+            artist.set_animated(True)
+        self._background = None
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.view.artists:
+            self.fig.draw_artist(artist)
+
+    def refresh(self, data):
+        """Actualiza los datos de la vista y redibuja lo mínimo"""
+        full = self.view.update(data)
+        if full or self._background is None:
+            self.draw_idle()
+        else:
+            self.restore_region(self._background)
+            self._draw_artists()
+            self.blit(self.fig.bbox)
+
+
+class SingleChannelCanvas(BlitCanvas):
+    """Canvas para mostrar la curva de calibración de un solo canal"""
+    def __init__(self, parent=None, width=6, height=5, dpi=100, channel='red', title='Canal Rojo'):
+        super().__init__(lambda fig: SingleChannelView(fig, channel, title), parent, width, height, dpi)
+        self.channel = channel
+
+    def plot_calibration(self, model):
+        """Dibuja la curva de calibración del canal"""
+        self.refresh(calibration_data(model))
+
+
+class CalibrationCurvesCanvas(BlitCanvas):
+    """Canvas para mostrar las curvas de calibración en una sola gráfica."""
+    def __init__(self, parent=None, width=8, height=6, dpi=100):
+        super().__init__(CurvesView, parent, width, height, dpi)
+
+    def plot_calibration(self, model):
+        self.refresh(calibration_data(model))
+
+
+class ResidualsCanvas(BlitCanvas):
+    """Canvas para mostrar residuos, cada canal en un subplot separado."""
+    def __init__(self, parent=None, width=12, height=4, dpi=100):
+        super().__init__(ResidualsView, parent, width, height, dpi)
+
+    def plot_residuals(self, model):
+        self.refresh(calibration_data(model))
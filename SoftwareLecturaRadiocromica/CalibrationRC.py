@@ -1,66 +1,27 @@
 import os
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QFileDialog, QLineEdit, 
                             QListWidget, QListWidgetItem, QMessageBox, QGroupBox, 
                             QFormLayout, QSpinBox, QTableWidget, QTableWidgetItem, 
-                            QHeaderView, QSplitter, QScrollArea, QTextEdit)
+                            QHeaderView, QSplitter, QScrollArea, QTextEdit, QComboBox,
+                            QInputDialog)
 from PyQt5.QtGui import QPixmap, QImage, QColor, QPalette, QIcon, QFont
-from PyQt5.QtCore import Qt, QRect, QSize, QThread, pyqtSignal, QObject
-from PIL import Image
-from scipy.optimize import curve_fit
+from PyQt5.QtCore import Qt, QRect, QSize
 import time
 
-# Clase para procesar imágenes en un hilo separado
-class ImageProcessor(QObject):
-    finished = pyqtSignal(dict)
-    error = pyqtSignal(str)
-    
-    def __init__(self, image_path, crop_area):
-        super().__init__()
-        self.image_path = image_path
-        self.crop_area = crop_area
-    
-    def process(self):
-        try:
-            # Abrir la imagen con PIL
-            img = np.array(Image.open(self.image_path))
-            
-            # Extraer el área recortada
-            x, y, width, height = self.crop_area
-            cut = img[y:y+height, x:x+width]
-            
-            # Separar canales
-            cut_R, cut_G, cut_B = cut[...,0], cut[...,1], cut[...,2]
-            
-            # Calcular medias y desviaciones estándar
-            red_mean, red_std = cut_R.mean(), cut_R.std()
-            green_mean, green_std = cut_G.mean(), cut_G.std()
-            blue_mean, blue_std = cut_B.mean(), cut_B.std()
-            
-            # Emitir resultados
-            self.finished.emit({
-                'red_mean': red_mean,
-                'red_std': red_std,
-                'green_mean': green_mean,
-                'green_std': green_std,
-                'blue_mean': blue_mean,
-                'blue_std': blue_std
-            })
-        except Exception as e:
-            self.error.emit(str(e))
+from JobQueue import JobQueue
+from ImageCache import IMAGE_CACHE
+from CalibrationBatch import channel_stats, process_folder, find_uniform_regions
+from CalibrationFit import LOSSES
 
-# Clase para ajustar curvas en un hilo separado
-class CurveFitter(QObject):
-    finished = pyqtSignal(dict)
-    error = pyqtSignal(str)
-    
-    def __init__(self, doses, red_values, green_values, blue_values, red_std, green_std, blue_std):
-        super().__init__()
+# matplotlib (CalibrationPlots), scipy y PIL se importan la primera vez que se
+# necesitan para que la ventana principal abra rápido. Ver ImportTiming.py.
+
+# Ajuste de las curvas de calibración (se ejecuta en el pool de trabajos)
+class CurveFitter:
+    def __init__(self, doses, red_values, green_values, blue_values, red_std, green_std, blue_std, loss="linear"):
         self.doses = doses
         self.red_values = red_values
         self.green_values = green_values
@@ -68,64 +29,38 @@ class CurveFitter(QObject):
         self.red_std = red_std
         self.green_std = green_std
         self.blue_std = blue_std
+        self.loss = loss
     
     def fit(self):
-        try:
-            # Función modelo: Dosis = a + b / (pixel - c)
-            def model(x, a, b, c):
-                return a + b / (x - c)
-            
-            # Estimaciones iniciales
-            def make_initial(pixels):
-                return [np.median(self.doses), 
-                       (max(self.doses)-min(self.doses))/(max(pixels)-min(pixels)), 
-                       min(pixels)-1]
-            
-            p0_R = make_initial(self.red_values)
-            p0_G = make_initial(self.green_values)
-            p0_B = make_initial(self.blue_values)
-            
-            # Ajuste robusto
-            def do_fit(x, y, p0):
-                mfes = [20000, 50000, 100000]
-                for mf in mfes:
-                    try:
-                        popt, pcov = curve_fit(model, x, y, p0=p0, maxfev=mf)
-                        return popt, pcov
-                    except RuntimeError:
-                        print(f"curve_fit falló con maxfev={mf}; reintentando...")
-                raise RuntimeError("El ajuste de calibración falló después de aumentar maxfev")
-            
-            # Ajustar canales
-            red_params, pcov_R = do_fit(self.red_values, self.doses, p0_R)
-            green_params, pcov_G = do_fit(self.green_values, self.doses, p0_G)
-            blue_params, pcov_B = do_fit(self.blue_values, self.doses, p0_B)
-            
-            # Calcular intervalos de confianza del 95%
-            from scipy.stats import t
-            tval = t.ppf(0.975, len(self.doses)-3)
-            red_ci = tval * np.sqrt(np.diag(pcov_R))
-            green_ci = tval * np.sqrt(np.diag(pcov_G))
-            blue_ci = tval * np.sqrt(np.diag(pcov_B))
-            
-            # Emitir resultados
-            self.finished.emit({
-                'red_params': red_params,
-                'green_params': green_params,
-                'blue_params': blue_params,
-                'red_ci': red_ci,
-                'green_ci': green_ci,
-                'blue_ci': blue_ci
-            })
-        except Exception as e:
-            self.error.emit(str(e))
-    
-    def closeEvent(self, event):
-        # Al cerrar la ventana, para bien el hilo:
-        if hasattr(self, 'worker_thread') and self.worker_thread.isRunning():
-            self.worker_thread.quit()
-            self.worker_thread.wait()   # espera a que termine
-        super().closeEvent(event)        
+        """Ajusta los tres canales y devuelve parámetros, intervalos y covarianzas"""
+        from scipy.stats import t
+        from CalibrationFit import fit_channels, initial_guess
+        
+        pixels = np.column_stack((self.red_values, self.green_values, self.blue_values))
+        stds = np.column_stack((self.red_std, self.green_std, self.blue_std))
+        
+        # Estimaciones iniciales por linealización de D (x - c) = a x - a c + b
+        p0 = [initial_guess(pixels[:, j], self.doses) for j in range(3)]
+        
+        # Ajuste ponderado de los tres canales en una sola llamada
+        params, cov, nfev = fit_channels(pixels, self.doses, p0, stds, loss=self.loss)
+        print(f"Ajuste de calibración: {nfev} evaluaciones")
+        
+        # Calcular intervalos de confianza del 95%
+        tval = t.ppf(0.975, len(self.doses)-3)
+        ci = tval * np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        
+        return {
+            'red_params': params[0],
+            'green_params': params[1],
+            'blue_params': params[2],
+            'red_ci': ci[0],
+            'green_ci': ci[1],
+            'blue_ci': ci[2],
+            'red_cov': cov[0],
+            'green_cov': cov[1],
+            'blue_cov': cov[2]
+        }
 
 class CalibrationModel:
     def __init__(self):
@@ -143,17 +78,24 @@ class CalibrationModel:
         self.red_ci = None
         self.green_ci = None
         self.blue_ci = None
+        self.red_cov = None
+        self.green_cov = None
+        self.blue_cov = None
+        self.model_selection = None
+        self.validation = None
+        self.saved_path = None
+        # Valor medio (R, G, B) de la película sin irradiar: referencia de la netOD
+        self.reference = None
+        # Familia elegida tras comparar modelos: {'family', 'params' (3, p), 'cov' (3, p, p)};
+        # None guarda el ajuste racional de "Realizar Calibración"
+        self.adopted = None
     
     def add_image(self, image_path, dose, crop_area, rgb_data=None):
         """Añade una imagen al modelo de calibración"""
         try:
             if rgb_data is None:
-                # Abrir la imagen con PIL
-                img = np.array(Image.open(image_path))
-                
-                # Extraer el área recortada
-                x, y, width, height = crop_area
-                cut = img[y:y+height, x:x+width]
+                # Recorte desde la caché compartida con el canvas (o solo esa zona del archivo)
+                cut = IMAGE_CACHE.crop(image_path, crop_area)
                 
                 # Separar canales
                 cut_R, cut_G, cut_B = cut[...,0], cut[...,1], cut[...,2]
@@ -189,6 +131,9 @@ class CalibrationModel:
             self.red_std.append(red_std)
             self.green_std.append(green_std)
             self.blue_std.append(blue_std)
+            self.validation = None
+            self.model_selection = None
+            self.adopted = None
             
             return True
         except Exception as e:
@@ -206,6 +151,9 @@ class CalibrationModel:
             self.red_std.pop(index)
             self.green_std.pop(index)
             self.blue_std.pop(index)
+            self.validation = None
+            self.model_selection = None
+            self.adopted = None
             return True
         return False
     
@@ -214,24 +162,105 @@ class CalibrationModel:
         if 0 <= index < len(self.images):
             self.images[index]['dose'] = dose
             self.doses[index] = dose
+            self.validation = None
+            self.model_selection = None
+            self.adopted = None
             return True
         return False
     
-    def get_image_index(self, image_path):
-        """Obtiene el índice de una imagen por su ruta"""
+    def set_reference(self, rgb_data):
+        """Guarda la respuesta (R, G, B) de la película sin irradiar"""
+        self.reference = np.array([rgb_data['red_mean'], rgb_data['green_mean'], rgb_data['blue_mean']])
+        # Los ajustes en netOD de la comparación usaban otra referencia
+        self.model_selection = None
+        self.adopted = None
+    
+    def adopt_family(self, name):
+        """
+        Usa para guardar la familia `name` con los parámetros de la comparación
+        de modelos; "rational" vuelve al ajuste ponderado de la calibración
+        """
+        if name == "rational" or not self.model_selection:
+            self.adopted = None
+            return
+        fits = [next(f for f in channel_fits if f["model"] == name) for channel_fits in self.model_selection]
+        self.adopted = {
+            'family': name,
+            'params': np.vstack([f["params"] for f in fits]),
+            'cov': np.stack([f["cov"] for f in fits]),
+        }
+    
+    def has_parameters(self):
+        """Hay una calibración que guardar (familia adoptada o ajuste racional)"""
+        return self.adopted is not None or (
+            self.red_params is not None and self.green_params is not None and self.blue_params is not None
+        )
+    
+    def get_image_index(self, image_path, crop_area=None):
+        """Obtiene el índice de una imagen por su ruta (y su recorte, si se da)"""
         for i, img in enumerate(self.images):
-            if img['path'] == image_path:
+            if img['path'] == image_path and (crop_area is None or tuple(img['crop_area']) == tuple(crop_area)):
                 return i
         return -1
     
-    def save_parameters(self, filename="CalibParameters.txt"):
-        """Guarda los parámetros de calibración en un archivo"""
-        if self.red_params is None or self.green_params is None or self.blue_params is None:
+    def get_regions(self, image_path):
+        """Recortes guardados de una imagen: [(índice, entrada)]"""
+        return [(i, img) for i, img in enumerate(self.images) if img['path'] == image_path]
+    
+    def save_parameters(self, filename="Calibracion.rccal", film_lot="", scanner=""):
+        """
+        Guarda la calibración (parámetros, covarianzas, ruido de píxel y puntos
+        de calibración) en un archivo .rccal
+        """
+        if not self.has_parameters():
             return False
         
         try:
-            params = np.vstack((self.red_params, self.green_params, self.blue_params)).T
-            np.savetxt(filename, params, fmt='% .7e', delimiter='  ')
+            from CalibrationFile import CalibrationFile
+            
+            if self.adopted is not None:
+                family, params, cov = self.adopted['family'], self.adopted['params'], self.adopted['cov']
+            else:
+                family = "rational"
+                params = np.vstack((self.red_params, self.green_params, self.blue_params))
+                cov = None
+                if self.red_cov is not None and self.green_cov is not None and self.blue_cov is not None:
+                    cov = np.stack((self.red_cov, self.green_cov, self.blue_cov))
+            pixels = np.column_stack((self.red_values, self.green_values, self.blue_values))
+            stds = np.column_stack((self.red_std, self.green_std, self.blue_std))
+            
+            # Resumen JSON de la comparación de modelos (si se hizo)
+            metadata = {}
+            if self.model_selection:
+                metadata["model_selection"] = {
+                    channel: [{"model": f["model"], "aic": float(f["aic"]), "bic": float(f["bic"])}
+                              for f in fits if "error" not in f]
+                    for channel, fits in zip("RGB", self.model_selection)
+                }
+            
+            calib = CalibrationFile(
+                family, params, cov, channels=["R", "G", "B"],
+                film_lot=film_lot, scanner=scanner,
+                stats={"n_points": len(self.doses)},
+                metadata=metadata,
+                arrays={
+                    "doses": np.asarray(self.doses, dtype=float),
+                    "pixels": pixels,
+                    "pixel_std": stds,
+                    # Ruido de píxel típico por canal (lo que antes se leía de DoseStd.txt)
+                    "pixel_noise": np.sqrt(np.mean(stds ** 2, axis=0)),
+                },
+            )
+            # Película sin irradiar (referencia de las familias en netOD)
+            if self.reference is not None:
+                calib.arrays["reference"] = self.reference
+            # Intervalos bootstrap y errores LOO (si se ha validado la calibración racional)
+            if self.validation is not None and family == "rational":
+                calib.arrays["boot_param_ci"] = np.asarray(self.validation["param_ci"])
+                calib.arrays["loo_residuals"] = np.asarray(self.validation["loo_residuals"])
+                calib.stats["loo_rmse"] = [s["loo_rmse"] for s in self.validation["stats"]]
+            
+            self.saved_path = calib.save(filename)
             return True
         except Exception as e:
             print(f"Error al guardar parámetros: {e}")
@@ -250,307 +279,6 @@ class CalibrationModel:
             print(f"Error al guardar desviaciones estándar: {e}")
             return False
 
-class ImageCanvas(FigureCanvas):
-    """Canvas para mostrar y seleccionar áreas en imágenes"""
-    def __init__(self, parent=None, width=8, height=6, dpi=100):
-        self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = self.fig.add_subplot(111)
-        
-        # Configurar estilo oscuro
-        self.fig.patch.set_facecolor('#2D2D30')
-        self.axes.set_facecolor('#1E1E1E')
-        self.axes.tick_params(colors='white')
-        
-        super(ImageCanvas, self).__init__(self.fig)
-        self.setParent(parent)
-        
-        self.image = None
-        self.image_array = None
-        self.crop_rect = None
-        self.crop_start = None
-        self.crop_size = (100, 100)
-        self.is_dragging = False
-        
-        self.mpl_connect('button_press_event', self.on_press)
-        self.mpl_connect('button_release_event', self.on_release)
-        self.mpl_connect('motion_notify_event', self.on_motion)
-    
-    def load_image(self, image_path):
-        """Carga una imagen en el canvas"""
-        try:
-            self.image_array = np.array(Image.open(image_path))
-            
-            # Limpiar ejes antes de mostrar nueva imagen
-            self.axes.clear()
-            
-            self.image = self.axes.imshow(self.image_array)
-            self.crop_rect = None
-            
-            # Ajustar límites de los ejes
-            self.axes.set_xlim(0, self.image_array.shape[1])
-            self.axes.set_ylim(self.image_array.shape[0], 0)
-            
-            self.fig.tight_layout()
-            self.draw_idle()  # Usar draw_idle en lugar de canvas.draw para mejor rendimiento
-            return True
-        except Exception as e:
-            print(f"Error al cargar la imagen: {e}")
-            return False
-    
-    def set_crop_size(self, width, height):
-        """Establece el tamaño del área de recorte"""
-        self.crop_size = (width, height)
-        if self.crop_rect:
-            self.update_crop_rect(self.crop_rect.get_x(), self.crop_rect.get_y())
-    
-    def on_press(self, event):
-        """Maneja el evento de presionar el botón del ratón"""
-        if event.inaxes != self.axes or self.image is None:
-            return
-        
-        self.is_dragging = True
-        self.crop_start = (event.xdata, event.ydata)
-        
-        if self.crop_rect:
-            self.crop_rect.remove()
-        
-        self.crop_rect = self.axes.add_patch(
-            plt.Rectangle((event.xdata, event.ydata), 
-                         self.crop_size[0], self.crop_size[1],
-                         linewidth=2, edgecolor='r', facecolor='none')
-        )
-        self.draw_idle()
-    
-    def on_motion(self, event):
-        """Maneja el evento de mover el ratón"""
-        if not self.is_dragging or event.inaxes != self.axes or self.crop_rect is None:
-            return
-        
-        self.update_crop_rect(event.xdata, event.ydata)
-    
-    def on_release(self, event):
-        """Maneja el evento de soltar el botón del ratón"""
-        self.is_dragging = False
-    
-    def update_crop_rect(self, x, y):
-        """Actualiza la posición del rectángulo de recorte"""
-        if self.image is None or self.crop_rect is None:
-            return
-        
-        # Asegurar que el rectángulo esté dentro de los límites de la imagen
-        height, width = self.image_array.shape[:2]
-        
-        x = max(0, min(width - self.crop_size[0], x))
-        y = max(0, min(height - self.crop_size[1], y))
-        
-        self.crop_rect.set_xy((x, y))
-        self.draw_idle()
-    
-    def get_crop_area(self):
-        """Devuelve el área de recorte actual"""
-        if self.crop_rect is None:
-            return None
-        
-        x, y = self.crop_rect.get_xy()
-        return (int(x), int(y), int(self.crop_size[0]), int(self.crop_size[1]))
-    
-    def set_crop_area(self, crop_area):
-        """Establece el área de recorte desde coordenadas existentes"""
-        if self.image is None:
-            return
-        
-        x, y, width, height = crop_area
-        
-        if self.crop_rect:
-            self.crop_rect.remove()
-        
-        self.crop_rect = self.axes.add_patch(
-            plt.Rectangle((x, y), width, height,
-                         linewidth=2, edgecolor='r', facecolor='none')
-        )
-        self.draw_idle()
-
-# Clase para crear un canvas individual para cada canal de color
-class SingleChannelCanvas(FigureCanvas):
-    """Canvas para mostrar la curva de calibración de un solo canal"""
-    def __init__(self, parent=None, width=6, height=5, dpi=100, channel='red', title='Canal Rojo'):
-        self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = self.fig.add_subplot(111)
-        super().__init__(self.fig)
-        self.setParent(parent)
-        
-        # Configurar estilo
-        self.fig.patch.set_facecolor('white')
-        self.axes.set_facecolor('white')
-        self.axes.tick_params(colors='black')
-        self.axes.xaxis.label.set_color('black')
-        self.axes.yaxis.label.set_color('black')
-        self.axes.title.set_color('black')
-        
-        # Configurar ejes
-        self.axes.set_xlabel('Valor de Píxel')
-        self.axes.set_ylabel('Dosis (Gy)')
-        self.axes.set_title(title)
-        self.axes.grid(True, linestyle='--', alpha=0.7)
-        
-        self.channel = channel
-        self.channel_color = channel
-    
-    def plot_calibration(self, model):
-        """Dibuja la curva de calibración para un canal específico"""
-        if self.channel == 'red' and model.red_params is None:
-            return
-        elif self.channel == 'green' and model.green_params is None:
-            return
-        elif self.channel == 'blue' and model.blue_params is None:
-            return
-        
-        self.axes.clear()
-        
-        # Configurar ejes
-        self.axes.set_xlabel('Valor de Píxel')
-        self.axes.set_ylabel('Dosis (Gy)')
-        
-        if self.channel == 'red':
-            self.axes.set_title('Curva de Calibración - Canal Rojo')
-            values = model.red_values
-            params = model.red_params
-        elif self.channel == 'green':
-            self.axes.set_title('Curva de Calibración - Canal Verde')
-            values = model.green_values
-            params = model.green_params
-        else:  # blue
-            self.axes.set_title('Curva de Calibración - Canal Azul')
-            values = model.blue_values
-            params = model.blue_params
-        
-        self.axes.grid(True, linestyle='--', alpha=0.7)
-        
-        # Función modelo
-        def model_func(x, a, b, c):
-            return a + b / (x - c)
-        
-        # Dibujar puntos de datos
-        self.axes.scatter(values, model.doses, color=self.channel_color, label='Datos', alpha=0.7)
-        
-        # Generar puntos para la curva
-        x_min, x_max = min(values), max(values)
-        x_range = np.linspace(x_min, x_max, 100)
-        
-        # Dibujar curva ajustada
-        try:
-            y_values = [model_func(x, *params) for x in x_range 
-                      if abs(x - params[2]) > 1]
-            x_values = [x for x in x_range if abs(x - params[2]) > 1]
-            self.axes.plot(x_values, y_values, color=self.channel_color, linestyle='-', label='Ajuste')
-        except Exception as e:
-            print(f"Error al dibujar curva: {e}")
-        
-        self.axes.legend()
-        self.fig.tight_layout()
-        self.draw_idle()
-
-class CalibrationCurvesCanvas(FigureCanvas):
-    """Canvas para mostrar las curvas de calibración en una sola gráfica."""
-    def __init__(self, parent=None, width=8, height=6, dpi=100):
-        self.fig, self.ax = plt.subplots(figsize=(width, height), dpi=dpi)
-        super().__init__(self.fig)
-        self.setParent(parent)
-
-        # Fondo blanco
-        self.fig.patch.set_facecolor('white')
-        self.ax.set_facecolor('white')
-        self.ax.tick_params(colors='black')
-        self.ax.xaxis.label.set_color('black')
-        self.ax.yaxis.label.set_color('black')
-        self.ax.title.set_color('black')
-
-        # Etiquetas
-        self.ax.set_xlabel('Valor de Píxel')
-        self.ax.set_ylabel('Dosis (Gy)')
-        self.ax.set_title('Curvas calibración')
-        self.ax.grid(True, linestyle='--', alpha=0.5)
-
-    def plot_calibration(self, model):
-        if (model.red_params is None or model.green_params is None or model.blue_params is None):
-            return
-
-        # Función de ajuste
-        def f(x, a, b, c): return a + b/(x-c)
-
-        data = [
-            (model.red_values, model.red_params, 'red', 'Canal Rojo'),
-            (model.green_values, model.green_params, 'green', 'Canal Verde'),
-            (model.blue_values, model.blue_params, 'blue', 'Canal Azul'),
-        ]
-
-        self.ax.clear()
-
-        for vals, params, color, label in data:
-            # puntos
-            self.ax.scatter(vals, model.doses, color=color, alpha=0.7, label=f'Datos {label}')
-            # curva ajustada
-            xs = np.linspace(min(vals), max(vals), 200)
-            xs = xs[np.abs(xs - params[2]) > 1]  # evitar singularidad
-            self.ax.plot(xs, f(xs, *params), color=color, linestyle='-', label=f'Ajuste {label}')
-
-        self.ax.set_xlabel('Valor de Píxel')
-        self.ax.set_ylabel('Dosis (Gy)')
-        self.ax.set_title('Curvas calibración')
-        self.ax.grid(True, linestyle='--', alpha=0.5)
-        self.ax.legend()
-
-        self.draw_idle()
-
-
-
-class ResidualsCanvas(FigureCanvas):
-    """Canvas para mostrar residuos, cada canal en un subplot separado."""
-    def __init__(self, parent=None, width=12, height=4, dpi=100):
-        self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = self.fig.subplots(1, 3, sharey=True)
-        super().__init__(self.fig)
-        self.setParent(parent)
-
-        # Fondo blanco
-        self.fig.patch.set_facecolor('white')
-        for ax in self.axes:
-            ax.set_facecolor('white')
-            ax.tick_params(colors='black')
-            ax.xaxis.label.set_color('black')
-            ax.yaxis.label.set_color('black')
-            ax.title.set_color('black')
-
-        # Etiquetas
-        colors = ['Rojo', 'Verde', 'Azul']
-        for ax, color in zip(self.axes, colors):
-            ax.set_xlabel('Valor de Píxel')
-            ax.set_title(f'Residuales {color}')
-        self.axes[0].set_ylabel('Residuos (Gy)')
-        self.fig.tight_layout()
-
-    def plot_residuals(self, model):
-        if (model.red_params is None or model.green_params is None or model.blue_params is None):
-            return
-
-        def f(x, a, b, c): return a + b/(x-c)
-
-        data = [
-            (model.red_values, model.red_params, 'red'),
-            (model.green_values, model.green_params, 'green'),
-            (model.blue_values, model.blue_params, 'blue'),
-        ]
-
-        # Calcular y dibujar residuos
-        for ax, (vals, params, color) in zip(self.axes, data):
-            ax.clear()
-            res = [model.doses[i] - f(x, *params) for i, x in enumerate(vals)]
-            ax.scatter(vals, res, color=color, alpha=0.7)
-            ax.axhline(0, linestyle='--', color='gray', linewidth=1)
-            ax.grid(True, linestyle='--', alpha=0.5)
-
-        self.draw_idle()
-
 class InstructionsDialog(QWidget):
     """Diálogo para mostrar instrucciones de uso"""
     def __init__(self, parent=None):
@@ -602,9 +330,12 @@ class InstructionsDialog(QWidget):
             ("", "   - Ingrese el ancho y alto de la selección en píxeles."),
             ("", "   - Haga clic en la imagen para posicionar la selección."),
             ("", "   - La selección se mostrará como un rectángulo rojo."),
+            ("", "   - 'Buscar Zonas Uniformes' propone la zona más uniforme de cada película (en cian); haga clic en una para seleccionarla."),
+            ("", "   - Una imagen puede tener varios recortes, cada uno con su dosis (en amarillo los ya guardados)."),
             ("4. Ingresar Dosis", "Para cada imagen:"),
             ("", "   - Ingrese la dosis correspondiente en el campo 'Dosis (Gy)', IMPORTANTE USAR NOTACIÓN DECIMAL CON PUNTO PARA TODOS LOS VALORES."),
             ("", "   - Haga clic en 'Ingresar Dosis' para guardar el valor."),
+            ("", "   - Seleccione un recorte de película sin irradiar y pulse 'Película sin Irradiar' para medir la referencia de 0 Gy (necesaria para comparar los modelos en netOD)."),
             ("5. Realizar Calibración", "Una vez que haya procesado todas las imágenes:"),
             ("", "   - Haga clic en 'Realizar Calibración' para iniciar el proceso de calibración."),
             ("", "   - La aplicación ajustará las curvas de calibración para los canales rojo, verde y azul."),
@@ -620,6 +351,7 @@ class InstructionsDialog(QWidget):
             ("8. Modelo de Calibración", "La aplicación utiliza el modelo:"),
             ("", "   - Dosis = a + b / (pixel - c)"),
             ("", "   - Donde a, b y c son los parámetros ajustados para cada canal."),
+            ("", "   - Con 'Comparar Modelos' puede elegir otra familia (por AIC); se guarda en el archivo .rccal y DoseAnalyzer la usa."),
             ("9. Consejos", "Para obtener mejores resultados:"),
             ("", "   - Use al menos 5 imágenes con diferentes dosis."),
             ("", "   - Seleccione áreas homogéneas en las imágenes."),
@@ -656,13 +388,17 @@ class MainWindow(QMainWindow):
         
         self.model = CalibrationModel()
         self.current_image_path = None
-        self.image_processor_thread = None
-        self.curve_fitter_thread = None
+        self.region_candidates = []
         
-        # Crear canvases individuales para cada canal
-        self.red_canvas = SingleChannelCanvas(channel='red', title='Canal Rojo')
-        self.green_canvas = SingleChannelCanvas(channel='green', title='Canal Verde')
-        self.blue_canvas = SingleChannelCanvas(channel='blue', title='Canal Azul')
+        # Pool de trabajos persistente (procesado de imágenes, ajustes, lotes)
+        self.jobs = JobQueue(parent=self)
+        self.jobs.progress.connect(self.on_jobs_progress)
+        self.jobs.idle.connect(lambda: self.statusBar().showMessage("Listo", 3000))
+        
+        # Los canvases de matplotlib se crean la primera vez que se usan
+        self._image_canvas = None
+        self._calibration_canvas = None
+        self._residuals_canvas = None
         
         self.init_ui()
         self.set_dark_theme()
@@ -723,6 +459,45 @@ class MainWindow(QMainWindow):
         self.setup_home_tab()
         self.setup_load_tab()
         self.setup_visualize_tab()
+        
+        # Crear las gráficas de cada pestaña al mostrarla por primera vez
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+    
+    def on_tab_changed(self, index):
+        """Crea los canvases de la pestaña seleccionada si aún no existen"""
+        # Acceder a la propiedad basta para crear el canvas
+        if index == 1:
+            _ = self.image_canvas
+        elif index == 2:
+            _ = self.calibration_canvas
+            _ = self.residuals_canvas
+    
+    @property
+    def image_canvas(self):
+        """Canvas de selección de áreas (se crea en el primer uso)"""
+        if self._image_canvas is None:
+            from CalibrationPlots import ImageCanvas
+            self._image_canvas = ImageCanvas(self.central_panel, width=8, height=6)
+            self.central_layout.addWidget(self._image_canvas)
+        return self._image_canvas
+    
+    @property
+    def calibration_canvas(self):
+        """Canvas con las tres curvas de calibración (se crea en el primer uso)"""
+        if self._calibration_canvas is None:
+            from CalibrationPlots import CalibrationCurvesCanvas
+            self._calibration_canvas = CalibrationCurvesCanvas(self.curves_tab, width=8, height=6)
+            self.curves_layout.insertWidget(0, self._calibration_canvas)
+        return self._calibration_canvas
+    
+    @property
+    def residuals_canvas(self):
+        """Canvas de residuos (se crea en el primer uso)"""
+        if self._residuals_canvas is None:
+            from CalibrationPlots import ResidualsCanvas
+            self._residuals_canvas = ResidualsCanvas(self.curves_tab, width=8, height=4)
+            self.curves_layout.addWidget(self._residuals_canvas)
+        return self._residuals_canvas
     
     def setup_home_tab(self):
         """Configura la pestaña de inicio"""
@@ -791,6 +566,14 @@ class MainWindow(QMainWindow):
         load_button.clicked.connect(self.load_images)
         load_layout.addWidget(load_button)
         
+        batch_button = QPushButton("Cargar Carpeta (lote)")
+        batch_button.clicked.connect(self.load_folder)
+        load_layout.addWidget(batch_button)
+        
+        cancel_button = QPushButton("Cancelar Trabajos")
+        cancel_button.clicked.connect(self.jobs.cancel)
+        load_layout.addWidget(cancel_button)
+        
         # Grupo de tamaño de selección
         size_group = QGroupBox("Tamaño de Selección")
         size_layout = QFormLayout(size_group)
@@ -808,6 +591,15 @@ class MainWindow(QMainWindow):
         size_layout.addRow("Ancho (px):", self.width_input)
         size_layout.addRow("Alto (px):", self.height_input)
         
+        # Varios recortes por imagen: zonas uniformes automáticas o manuales
+        find_regions_button = QPushButton("Buscar Zonas Uniformes")
+        find_regions_button.clicked.connect(self.find_regions)
+        size_layout.addRow(find_regions_button)
+        
+        remove_region_button = QPushButton("Quitar Recorte")
+        remove_region_button.clicked.connect(self.remove_region)
+        size_layout.addRow(remove_region_button)
+        
         # Grupo de dosis
         dose_group = QGroupBox("Dosis")
         dose_layout = QVBoxLayout(dose_group)
@@ -820,26 +612,53 @@ class MainWindow(QMainWindow):
         enter_dose_button = QPushButton("Ingresar Dosis")
         enter_dose_button.clicked.connect(self.enter_dose)
         
+        # Película sin irradiar (0 Gy): referencia de la netOD para comparar modelos
+        reference_button = QPushButton("Película sin Irradiar")
+        reference_button.clicked.connect(self.set_reference)
+        self.reference_label = QLabel("Referencia 0 Gy: sin medir")
+        
         dose_layout.addLayout(dose_form_layout)
         dose_layout.addWidget(enter_dose_button)
+        dose_layout.addWidget(reference_button)
+        dose_layout.addWidget(self.reference_label)
+        
+        # Grupo de metadatos (se guardan en el archivo de calibración)
+        film_group = QGroupBox("Película y Escáner")
+        film_layout = QFormLayout(film_group)
+        
+        self.film_lot_input = QLineEdit()
+        self.film_lot_input.setPlaceholderText("p. ej. EBT3 lote 03212201")
+        self.scanner_input = QLineEdit()
+        self.scanner_input.setPlaceholderText("p. ej. Epson 11000XL")
+        
+        film_layout.addRow("Lote:", self.film_lot_input)
+        film_layout.addRow("Escáner:", self.scanner_input)
         
         # Añadir grupos al panel izquierdo
         left_layout.addWidget(load_group)
         left_layout.addWidget(size_group)
         left_layout.addWidget(dose_group)
+        left_layout.addWidget(film_group)
         left_layout.addStretch()
         
+        # Función de pérdida del ajuste (los puntos se ponderan con su desviación)
+        loss_layout = QFormLayout()
+        self.loss_input = QComboBox()
+        for loss, label in LOSSES.items():
+            self.loss_input.addItem(label, loss)
+        loss_layout.addRow("Ajuste:", self.loss_input)
+        left_layout.addLayout(loss_layout)
+        
         # Botón de calibración en la esquina inferior izquierda
         calibrate_button = QPushButton("Realizar Calibración")
         calibrate_button.clicked.connect(self.perform_calibration)
         left_layout.addWidget(calibrate_button)
         
-        # Panel central (visualización de imagen)
+        # Panel central (visualización de imagen); el canvas se añade en el primer uso
         central_panel = QWidget()
         central_layout = QVBoxLayout(central_panel)
-        
-        self.image_canvas = ImageCanvas(central_panel, width=8, height=6)
-        central_layout.addWidget(self.image_canvas)
+        self.central_panel = central_panel
+        self.central_layout = central_layout
         
         # Panel inferior (lista de imágenes)
         bottom_panel = QWidget()
@@ -883,9 +702,17 @@ class MainWindow(QMainWindow):
         save_images_button = QPushButton("Guardar Imágenes")
         save_images_button.clicked.connect(self.save_calibration_images)
         
+        compare_button = QPushButton("Comparar Modelos")
+        compare_button.clicked.connect(self.compare_models)
+        
+        validate_button = QPushButton("Validar (Bootstrap/LOO)")
+        validate_button.clicked.connect(self.validate_calibration)
+        
         top_layout.addWidget(save_params_button)
         top_layout.addWidget(save_std_button)
         top_layout.addWidget(save_images_button)
+        top_layout.addWidget(compare_button)
+        top_layout.addWidget(validate_button)
         top_layout.addStretch()
         
         # Pestañas de visualización
@@ -895,11 +722,9 @@ class MainWindow(QMainWindow):
         curves_tab = QWidget()
         curves_layout = QVBoxLayout(curves_tab)
         
-        self.calibration_canvas = CalibrationCurvesCanvas(curves_tab, width=8, height=6)
-        self.residuals_canvas = ResidualsCanvas(curves_tab, width=8, height=4)
-        
-        curves_layout.addWidget(self.calibration_canvas)
-        curves_layout.addWidget(self.residuals_canvas)
+        # Los canvases de curvas y residuos se añaden en el primer uso
+        self.curves_tab = curves_tab
+        self.curves_layout = curves_layout
         
         # Pestaña de parámetros
         params_tab = QWidget()
@@ -909,8 +734,8 @@ class MainWindow(QMainWindow):
         params_label.setStyleSheet("font-weight: bold; font-size: 16px;")
         params_label.setAlignment(Qt.AlignCenter)
         
-        model_desc = QLabel("Modelo: Dosis = a + b / (pixel - c)")
-        model_desc.setAlignment(Qt.AlignCenter)
+        self.model_desc = QLabel("Modelo: Dosis = a + b / (pixel - c)")
+        self.model_desc.setAlignment(Qt.AlignCenter)
         
         self.params_table = QTableWidget(3, 5)
         self.params_table.setHorizontalHeaderLabels(["Canal", "a", "b", "c", "95% CI"])
@@ -931,7 +756,7 @@ class MainWindow(QMainWindow):
         self.params_table.setItem(2, 0, blue_item)
         
         params_layout.addWidget(params_label)
-        params_layout.addWidget(model_desc)
+        params_layout.addWidget(self.model_desc)
         params_layout.addWidget(self.params_table)
         
         # Pestaña de datos
@@ -961,6 +786,16 @@ class MainWindow(QMainWindow):
         layout.addLayout(top_layout)
         layout.addWidget(vis_tabs)
     
+    def on_jobs_progress(self, done, total):
+        """Progreso global de la cola de trabajos"""
+        if total:
+            self.statusBar().showMessage(f"Trabajos: {done}/{total}")
+    
+    def closeEvent(self, event):
+        """Cancela los trabajos pendientes y espera a los hilos antes de cerrar"""
+        self.jobs.shutdown()
+        super().closeEvent(event)
+    
     def show_instructions(self):
         """Muestra el diálogo de instrucciones"""
         instructions_dialog = InstructionsDialog(self)
@@ -986,6 +821,57 @@ class MainWindow(QMainWindow):
                 self.image_list.setCurrentRow(0)
                 self.select_image_from_list(self.image_list.item(0))
     
+    def load_folder(self):
+        """Carga por lotes una carpeta de escaneos con sus dosis (CSV o nombre de archivo)"""
+        folder = QFileDialog.getExistingDirectory(self, "Carpeta de imágenes de calibración")
+        if not folder:
+            return
+        
+        # Dosis desde un CSV (archivo, dosis) o, si no se elige, desde el nombre de cada archivo
+        manifest, _ = QFileDialog.getOpenFileName(
+            self, "Archivo de dosis (cancelar: dosis en el nombre)", folder, "CSV (*.csv *.txt)"
+        )
+        
+        # Estadísticas de todas las imágenes en un pool de procesos, sin diálogo bloqueante
+        self.jobs.submit(
+            process_folder, folder, self.width_input.value(), self.height_input.value(),
+            manifest or None, with_progress=True,
+            on_finished=self.on_batch_loaded, on_error=self.on_batch_error,
+            on_progress=self.on_batch_progress
+        )
+        self.statusBar().showMessage(f"Procesando {os.path.basename(folder)}...")
+    
+    def on_batch_progress(self, done, total):
+        """Progreso de la carga por lotes"""
+        self.statusBar().showMessage(f"Procesando imágenes: {done}/{total}")
+    
+    def on_batch_loaded(self, result):
+        """Añade al modelo todas las imágenes procesadas por lotes"""
+        results, errors = result
+        for image_path, dose, crop_area, rgb_data in results:
+            index = self.model.get_image_index(image_path)
+            if index >= 0:
+                self.model.remove_image(index)
+            self.model.add_image(image_path, dose, crop_area, rgb_data)
+            
+            # Actualizar lista de imágenes
+            self.update_image_item(image_path)
+        
+        self.update_calibration_view()
+        self.statusBar().showMessage(f"{len(results)} imágenes cargadas", 5000)
+        
+        if errors:
+            QMessageBox.warning(
+                self, 
+                "Advertencia", 
+                "Imágenes no añadidas:\n" + "\n".join(errors)
+            )
+    
+    def on_batch_error(self, error_msg):
+        """Callback cuando falla la carga por lotes"""
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Error", f"Error en la carga por lotes: {error_msg}")
+    
     def select_image_from_list(self, item):
         """Selecciona una imagen de la lista"""
         if item is None:
@@ -996,17 +882,78 @@ class MainWindow(QMainWindow):
         
         # Cargar imagen en el canvas
         self.image_canvas.load_image(image_path)
-        
-        # Buscar si ya existe dosis y área de recorte para esta imagen
-        for img in self.model.images:
-            if img['path'] == image_path:
-                self.dose_input.setText(str(img['dose']))
-                if 'crop_area' in img:
-                    self.image_canvas.set_crop_area(img['crop_area'])
+        self.region_candidates = []
+        self.show_image_regions()
+        
+        # Dosis y recorte del último recorte guardado de esta imagen
+        regions = self.model.get_regions(image_path)
+        if regions:
+            img = regions[-1][1]
+            self.dose_input.setText(str(img['dose']))
+            self.image_canvas.set_crop_area(img['crop_area'])
+        else:
+            # Si no existe, limpiar el campo de dosis
+            self.dose_input.clear()
+    
+    def show_image_regions(self):
+        """Dibuja los recortes guardados y las zonas propuestas de la imagen actual"""
+        saved = [(img['crop_area'], f"{img['dose']} Gy") for _, img in self.model.get_regions(self.current_image_path)]
+        self.image_canvas.show_regions(saved, self.region_candidates)
+    
+    def update_image_item(self, image_path):
+        """Texto de la imagen en la lista: nombre y dosis de sus recortes"""
+        doses = [img['dose'] for _, img in self.model.get_regions(image_path)]
+        text = os.path.basename(image_path)
+        if doses:
+            text += " - " + ", ".join(f"{dose} Gy" for dose in doses)
+        for i in range(self.image_list.count()):
+            item = self.image_list.item(i)
+            if item.data(Qt.UserRole) == image_path:
+                item.setText(text)
                 return
+        item = QListWidgetItem(text)
+        item.setData(Qt.UserRole, image_path)
+        self.image_list.addItem(item)
+    
+    def find_regions(self):
+        """Busca en el pool de trabajos la zona más uniforme de cada película de la imagen"""
+        if not self.current_image_path:
+            QMessageBox.warning(self, "Advertencia", "No hay imagen seleccionada.")
+            return
         
-        # Si no existe, limpiar el campo de dosis
-        self.dose_input.clear()
+        self.jobs.submit(
+            find_uniform_regions, IMAGE_CACHE.get(self.current_image_path),
+            self.width_input.value(), self.height_input.value(),
+            on_finished=lambda regions, path=self.current_image_path: self.on_regions_found(path, regions),
+            on_error=self.on_image_process_error
+        )
+        self.statusBar().showMessage("Buscando zonas uniformes...")
+    
+    def on_regions_found(self, image_path, regions):
+        """Muestra las zonas propuestas; un clic en una la selecciona para ingresar su dosis"""
+        if image_path != self.current_image_path:
+            return
+        self.region_candidates = regions
+        self.show_image_regions()
+        if regions:
+            self.image_canvas.set_crop_area(regions[0])
+            self.statusBar().showMessage(
+                f"{len(regions)} zonas encontradas: seleccione una e ingrese su dosis", 5000
+            )
+        else:
+            self.statusBar().showMessage("No se encontraron películas en la imagen", 5000)
+    
+    def remove_region(self):
+        """Quita el recorte seleccionado de la imagen actual"""
+        crop_area = self.image_canvas.get_crop_area()
+        index = -1 if crop_area is None else self.model.get_image_index(self.current_image_path, crop_area)
+        if index < 0:
+            QMessageBox.warning(self, "Advertencia", "Seleccione un recorte guardado de esta imagen.")
+            return
+        self.model.remove_image(index)
+        self.update_image_item(self.current_image_path)
+        self.show_image_regions()
+        self.refresh_plots()
     
     def update_crop_size(self):
         """Actualiza el tamaño del área de recorte"""
@@ -1038,58 +985,59 @@ class MainWindow(QMainWindow):
         # Procesar imagen en un hilo separado
         self.process_image_async(self.current_image_path, dose, crop_area)
     
+    def set_reference(self):
+        """Mide el recorte actual como película sin irradiar (no entra en el ajuste)"""
+        if not self.current_image_path:
+            QMessageBox.warning(self, "Advertencia", "No hay imagen seleccionada.")
+            return
+        
+        crop_area = self.image_canvas.get_crop_area()
+        if crop_area is None:
+            QMessageBox.warning(self, "Advertencia", "Seleccione un área en la imagen primero.")
+            return
+        
+        self.jobs.submit(
+            channel_stats, self.current_image_path, crop_area[2], crop_area[3], crop_area,
+            on_finished=lambda result: self.on_reference_measured(*result),
+            on_error=self.on_image_process_error
+        )
+    
+    def on_reference_measured(self, crop_area, rgb_data):
+        """Callback con la respuesta de la película sin irradiar"""
+        self.model.set_reference(rgb_data)
+        self.update_model_description()
+        r, g, b = self.model.reference
+        self.reference_label.setText(f"Referencia 0 Gy: R {r:.1f}, G {g:.1f}, B {b:.1f}")
+        self.statusBar().showMessage("Película sin irradiar medida", 5000)
+    
     def process_image_async(self, image_path, dose, crop_area):
-        """Procesa una imagen en un hilo separado"""
-        # Crear procesador de imágenes
-        self.image_processor = ImageProcessor(image_path, crop_area)
-        
-        # Crear hilo
-        self.image_processor_thread = QThread()
-        self.image_processor.moveToThread(self.image_processor_thread)
-        
-        # Conectar señales
-        self.image_processor_thread.started.connect(self.image_processor.process)
-        self.image_processor.finished.connect(self.on_image_processed)
-        self.image_processor.error.connect(self.on_image_process_error)
-        self.image_processor.finished.connect(self.image_processor_thread.quit)
-        self.image_processor.finished.connect(self.image_processor.deleteLater)
-        self.image_processor_thread.finished.connect(self.image_processor_thread.deleteLater)
-        
-        # Almacenar datos para usar en el callback
-        self.image_processor.image_path = image_path
-        self.image_processor.dose = dose
-        self.image_processor.crop_area = crop_area
-        
-        # Iniciar hilo
-        self.image_processor_thread.start()
-        
-        # Mostrar mensaje de procesamiento
-        QMessageBox.information(self, "Procesando", "Procesando imagen, por favor espere...")
+        """Procesa una imagen en el pool de trabajos"""
+        self.jobs.submit(
+            channel_stats, image_path, crop_area[2], crop_area[3], crop_area,
+            on_finished=lambda result: self.on_image_processed(image_path, dose, *result),
+            on_error=self.on_image_process_error
+        )
     
-    def on_image_processed(self, rgb_data):
+    def on_image_processed(self, image_path, dose, crop_area, rgb_data):
         """Callback cuando se completa el procesamiento de la imagen"""
-        # Obtener datos del procesador
-        image_path = self.image_processor.image_path
-        dose = self.image_processor.dose
-        crop_area = self.image_processor.crop_area
-        
-        # Añadir o actualizar imagen en el modelo
-        index = self.model.get_image_index(image_path)
+        # Añadir o actualizar el recorte en el modelo (una imagen puede tener varios)
+        index = self.model.get_image_index(image_path, crop_area)
         if index >= 0:
-            # Actualizar imagen existente
+            # Actualizar recorte existente
             self.model.remove_image(index)
         
-        # Añadir imagen con datos RGB
+        # Añadir recorte con datos RGB
         self.model.add_image(image_path, dose, crop_area, rgb_data)
         
-        # Actualizar lista de imágenes
-        for i in range(self.image_list.count()):
-            item = self.image_list.item(i)
-            if item.data(Qt.UserRole) == image_path:
-                item.setText(f"{os.path.basename(image_path)} - {dose} Gy")
-                break
+        # Actualizar lista de imágenes y recortes dibujados
+        self.update_image_item(image_path)
+        if image_path == self.current_image_path:
+            self.show_image_regions()
+        
+        self.refresh_plots()
         
-        QMessageBox.information(self, "Éxito", f"Dosis de {dose} Gy guardada para la imagen.")
+        # Sin diálogo: se pueden ir cargando imágenes una tras otra
+        self.statusBar().showMessage(f"Dosis de {dose} Gy guardada para {os.path.basename(image_path)}", 5000)
     
     def on_image_process_error(self, error_msg):
         """Callback cuando hay un error en el procesamiento de la imagen"""
@@ -1119,35 +1067,19 @@ class MainWindow(QMainWindow):
         self.fit_curves_async()
     
     def fit_curves_async(self):
-        """Ajusta las curvas de calibración en un hilo separado"""
-        # Crear ajustador de curvas
-        self.curve_fitter = CurveFitter(
-            self.model.doses,
-            self.model.red_values,
-            self.model.green_values,
-            self.model.blue_values,
-            self.model.red_std,
-            self.model.green_std,
-            self.model.blue_std
+        """Ajusta las curvas de calibración en el pool de trabajos"""
+        curve_fitter = CurveFitter(
+            list(self.model.doses),
+            list(self.model.red_values),
+            list(self.model.green_values),
+            list(self.model.blue_values),
+            list(self.model.red_std),
+            list(self.model.green_std),
+            list(self.model.blue_std),
+            self.loss_input.currentData()
         )
-        
-        # Crear hilo
-        self.curve_fitter_thread = QThread()
-        self.curve_fitter.moveToThread(self.curve_fitter_thread)
-        
-        # Conectar señales
-        self.curve_fitter_thread.started.connect(self.curve_fitter.fit)
-        self.curve_fitter.finished.connect(self.on_curves_fitted)
-        self.curve_fitter.error.connect(self.on_curve_fit_error)
-        self.curve_fitter.finished.connect(self.curve_fitter_thread.quit)
-        self.curve_fitter.finished.connect(self.curve_fitter.deleteLater)
-        self.curve_fitter_thread.finished.connect(self.curve_fitter_thread.deleteLater)
-        
-        # Iniciar hilo
-        self.curve_fitter_thread.start()
-        
-        # Mostrar mensaje de procesamiento
-        QMessageBox.information(self, "Procesando", "Ajustando curvas de calibración, por favor espere...")
+        self.jobs.submit(curve_fitter.fit, on_finished=self.on_curves_fitted, on_error=self.on_curve_fit_error)
+        self.statusBar().showMessage("Ajustando curvas de calibración...")
     
     def on_curves_fitted(self, fit_data):
         """Callback cuando se completa el ajuste de curvas"""
@@ -1158,15 +1090,15 @@ class MainWindow(QMainWindow):
         self.model.red_ci = fit_data['red_ci']
         self.model.green_ci = fit_data['green_ci']
         self.model.blue_ci = fit_data['blue_ci']
+        self.model.red_cov = fit_data['red_cov']
+        self.model.green_cov = fit_data['green_cov']
+        self.model.blue_cov = fit_data['blue_cov']
+        # La validación anterior corresponde a otros parámetros
+        self.model.validation = None
         
         # Actualizar visualizaciones
         self.update_calibration_view()
         
-        # Actualizar canvases individuales
-        self.red_canvas.plot_calibration(self.model)
-        self.green_canvas.plot_calibration(self.model)
-        self.blue_canvas.plot_calibration(self.model)
-        
         # Cambiar a la pestaña de visualización
         self.tabs.setCurrentIndex(2)
         
@@ -1180,6 +1112,133 @@ class MainWindow(QMainWindow):
         """Callback cuando hay un error en el ajuste de curvas"""
         QMessageBox.critical(self, "Error", f"Error al ajustar las curvas: {error_msg}")
     
+    def compare_models(self):
+        """Ajusta todas las familias de modelos a cada canal y las compara por AIC/BIC"""
+        if len(self.model.images) < 5:
+            QMessageBox.warning(self, "Advertencia", "Se necesitan al menos 5 imágenes para comparar modelos.")
+            return
+        
+        from CalibrationModels import select_model
+        
+        pixels = np.column_stack((self.model.red_values, self.model.green_values, self.model.blue_values))
+        # Sin película sin irradiar, select_model deja fuera las familias en netOD
+        self.jobs.submit(
+            select_model, pixels, list(self.model.doses), reference=self.model.reference,
+            on_finished=self.on_models_compared, on_error=self.on_curve_fit_error
+        )
+        self.statusBar().showMessage("Comparando modelos de calibración...")
+    
+    def on_models_compared(self, result):
+        """Muestra la tabla de AIC/BIC de cada canal"""
+        from CalibrationModels import MODELS
+        
+        best, fits = result
+        self.model.model_selection = fits
+        
+        lines = []
+        for channel, channel_fits in zip(("Rojo", "Verde", "Azul"), fits):
+            lines.append(f"Canal {channel}:")
+            for fit in channel_fits:
+                label = MODELS[fit["model"]].label
+                if "error" in fit:
+                    lines.append(f"   {label}: error ({fit['error']})")
+                else:
+                    lines.append(f"   {label}: AIC = {fit['aic']:.2f}, BIC = {fit['bic']:.2f}")
+            lines.append(f"   → Mejor: {MODELS[channel_fits[0]['model']].label}")
+        
+        if self.model.reference is None:
+            netod = [family.label for family in MODELS.values() if family.selectable and family.variable == "netod"]
+            lines.append("")
+            lines.append("Sin película sin irradiar (0 Gy) no se comparan las familias en netOD:")
+            lines.extend(f"   {label}" for label in netod)
+            lines.append("Mídala con «Película sin Irradiar» para incluirlas.")
+        
+        QMessageBox.information(self, "Comparación de modelos", "\n".join(lines))
+        
+        # Familias ajustadas en los tres canales, ordenadas por la suma del AIC
+        totals = {}
+        for channel_fits in fits:
+            for fit in channel_fits:
+                if "error" not in fit:
+                    totals.setdefault(fit["model"], []).append(fit["aic"])
+        names = sorted((name for name, aic in totals.items() if len(aic) == len(fits)),
+                       key=lambda name: sum(totals[name]))
+        if not names:
+            return
+        items = [MODELS[name].label for name in names]
+        choice, ok = QInputDialog.getItem(
+            self, "Modelo de calibración",
+            "Familia con la que guardar la calibración (ordenadas por AIC total):", items, 0, False
+        )
+        if ok:
+            self.model.adopt_family(names[items.index(choice)])
+            self.update_model_description()
+    
+    def update_model_description(self):
+        """Familia que se guardará en el archivo .rccal"""
+        if self.model.adopted is None:
+            self.model_desc.setText("Modelo: Dosis = a + b / (pixel - c)")
+        else:
+            from CalibrationModels import MODELS
+            label = MODELS[self.model.adopted['family']].label
+            self.model_desc.setText(f"Modelo guardado: {label} (la tabla muestra el ajuste racional)")
+    
+    def validate_calibration(self):
+        """Bootstrap y dejar-uno-fuera de la calibración en el pool de procesos"""
+        if self.model.red_params is None or self.model.green_params is None or self.model.blue_params is None:
+            QMessageBox.warning(self, "Advertencia", "Realice primero la calibración.")
+            return
+        if len(self.model.images) < 5:
+            QMessageBox.warning(self, "Advertencia", "Se necesitan al menos 5 imágenes para validar la calibración.")
+            return
+        
+        from CalibrationValidation import validate_calibration
+        
+        pixels = np.column_stack((self.model.red_values, self.model.green_values, self.model.blue_values))
+        stds = np.column_stack((self.model.red_std, self.model.green_std, self.model.blue_std))
+        params = np.vstack((self.model.red_params, self.model.green_params, self.model.blue_params))
+        self.jobs.submit(
+            validate_calibration, pixels, np.asarray(self.model.doses, dtype=float), params, stds,
+            self.loss_input.currentData(),
+            on_finished=self.on_calibration_validated, on_error=self.on_curve_fit_error,
+            on_progress=self.on_validation_progress, with_progress=True
+        )
+        self.statusBar().showMessage("Validando calibración...")
+    
+    def on_validation_progress(self, done, total):
+        self.statusBar().showMessage(f"Validando calibración: bloque {done}/{total}")
+    
+    def on_calibration_validated(self, validation):
+        """Muestra los intervalos bootstrap y el error LOO de cada canal"""
+        if validation is None:
+            return
+        self.model.validation = validation
+        self.residuals_canvas.plot_residuals(self.model)
+        
+        level = validation['level']
+        lines = []
+        for j, channel in enumerate(("Rojo", "Verde", "Azul")):
+            stats = validation['stats'][j]
+            ci = validation['param_ci'][j]
+            lines.append(f"Canal {channel}:")
+            for name, (low, high) in zip("abc", ci):
+                lines.append(f"   {name}: IC {level:.0%} [{low:.4f}, {high:.4f}]")
+            lines.append(f"   RMSE = {stats['rmse']:.4f} Gy, LOO = {stats['loo_rmse']:.4f} Gy "
+                         f"(máx. {stats['loo_max']:.4f} Gy)")
+            if stats['failed']:
+                lines.append(f"   {stats['failed']} reajustes no convergieron")
+        
+        self.statusBar().showMessage("Validación completada")
+        QMessageBox.information(self, "Validación de la calibración", "\n".join(lines))
+    
+    def refresh_plots(self):
+        """Actualiza las gráficas ya creadas (sin crear las que no se han mostrado)"""
+        self.update_model_description()
+        if self._calibration_canvas is not None:
+            self._calibration_canvas.plot_calibration(self.model)
+        if self._residuals_canvas is not None:
+            self._residuals_canvas.plot_residuals(self.model)
+    
     def update_calibration_view(self):
         """Actualiza la vista de calibración"""
         # Actualizar gráficos
@@ -1226,24 +1285,21 @@ class MainWindow(QMainWindow):
     
     def save_parameters(self):
         """Guarda los parámetros de calibración"""
-        if (
-            self.model.red_params is None or self.model.red_params.size == 0 or
-            self.model.green_params is None or self.model.green_params.size == 0 or
-            self.model.blue_params is None or self.model.blue_params.size == 0
-        ):
+        if not self.model.has_parameters():
             QMessageBox.warning(self, "Error", "Faltan parámetros de calibración para alguno de los canales.")
             return
         
         file_dialog = QFileDialog()
         file_dialog.setAcceptMode(QFileDialog.AcceptSave)
-        file_dialog.setNameFilter("Archivos de texto (*.txt)")
-        file_dialog.setDefaultSuffix("txt")
-        file_dialog.selectFile("CalibParameters.txt")
+        file_dialog.setNameFilter("Calibración (*.rccal)")
+        file_dialog.setDefaultSuffix("rccal")
+        file_dialog.selectFile("Calibracion.rccal")
         
         if file_dialog.exec_():
             filename = file_dialog.selectedFiles()[0]
-            if self.model.save_parameters(filename):
-                QMessageBox.information(self, "Éxito", f"Parámetros guardados en {filename}")
+            if self.model.save_parameters(filename, self.film_lot_input.text().strip(),
+                                          self.scanner_input.text().strip()):
+                QMessageBox.information(self, "Éxito", f"Calibración guardada en {self.model.saved_path}")
             else:
                 QMessageBox.critical(self, "Error", "Error al guardar los parámetros.")
     
@@ -1280,55 +1336,23 @@ class MainWindow(QMainWindow):
         if not directory:
             return
         
-        # Guardar imagen de curvas de calibración combinadas
-        self.calibration_canvas.fig.savefig(
-            os.path.join(directory, "calibration_curves_combined.png"), 
-            dpi=300, 
-            bbox_inches='tight'
-        )
-        
-        # Guardar imagen de residuos
-        self.residuals_canvas.fig.savefig(
-            os.path.join(directory, "residuals.png"), 
-            dpi=300, 
-            bbox_inches='tight'
-        )
-        
-        # Guardar imágenes individuales para cada canal
-        # Canal rojo
-        self.red_canvas.plot_calibration(self.model)
-        self.red_canvas.fig.savefig(
-            os.path.join(directory, "calibration_curve_red.png"),
-            dpi=300,
-            bbox_inches='tight'
-        )
-        
-        # Canal verde
-        self.green_canvas.plot_calibration(self.model)
-        self.green_canvas.fig.savefig(
-            os.path.join(directory, "calibration_curve_green.png"),
-            dpi=300,
-            bbox_inches='tight'
-        )
+        # Todas las figuras se dibujan fuera de pantalla en un solo trabajo
+        from CalibrationPlots import calibration_data, export_figures
         
-        # Canal azul
-        self.blue_canvas.plot_calibration(self.model)
-        self.blue_canvas.fig.savefig(
-            os.path.join(directory, "calibration_curve_blue.png"),
-            dpi=300,
-            bbox_inches='tight'
-        )
-        
-        QMessageBox.information(
-            self, 
-            "Éxito", 
-            f"Imágenes guardadas en {directory}:\n"
-            f"- calibration_curves_combined.png\n"
-            f"- residuals.png\n"
-            f"- calibration_curve_red.png\n"
-            f"- calibration_curve_green.png\n"
-            f"- calibration_curve_blue.png"
+        self.jobs.submit(
+            export_figures, calibration_data(self.model), directory,
+            on_finished=self.on_images_saved, on_error=self.on_images_save_error
         )
+        self.statusBar().showMessage("Guardando imágenes...")
+    
+    def on_images_saved(self, paths):
+        directory = os.path.dirname(paths[0])
+        names = "\n".join(f"- {os.path.basename(p)}" for p in paths)
+        self.statusBar().showMessage(f"Imágenes guardadas en {directory}", 5000)
+        QMessageBox.information(self, "Éxito", f"Imágenes guardadas en {directory}:\n{names}")
+    
+    def on_images_save_error(self, error_msg):
+        QMessageBox.critical(self, "Error", f"Error al guardar las imágenes: {error_msg}")
 
 def main():
     app = QApplication(sys.argv)
@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from CalibrationFit import rational, fit_channels
+
+
+# Validación de la calibración D = a + b / (P - c) por remuestreo: bootstrap
+# de los puntos de calibración y dejar-uno-fuera (LOO). Cada remuestreo es un
+# reajuste completo de los tres canales con fit_channels, arrancando en la
+# solución nominal (ya está cerca del óptimo y converge en pocas iteraciones).
+# Los reajustes se reparten por bloques en un pool de procesos.
+
+def _refit_chunk(pixels, doses, pixel_std, p0, loss, index_sets):
+    """Reajusta todos los canales para cada conjunto de índices; NaN si no converge"""
+    k = pixels.shape[1]
+    out = np.full((len(index_sets), k, 3), np.nan)
+    for i, idx in enumerate(index_sets):
+        std = None if pixel_std is None else pixel_std[idx]
+        try:
+            out[i], _, _ = fit_channels(pixels[idx], doses[idx], p0, std, loss=loss)
+        except (RuntimeError, ValueError, np.linalg.LinAlgError):
+            pass
+    return out
+
+
+def bootstrap_indices(doses, n_boot, rng, min_levels=4):
+    """
+    Remuestreos con reemplazo de los puntos. Se descartan los que tienen
+    menos de `min_levels` dosis distintas (el modelo tiene 3 parámetros).
+    ValueError si los datos no tienen tantas dosis distintas o si tras
+    100·n_boot intentos no se han reunido n_boot remuestreos válidos.
+    """
+    n = len(doses)
+    n_levels = len(np.unique(doses))
+    if n_levels < min_levels:
+        raise ValueError(f"Se necesitan al menos {min_levels} dosis distintas para el bootstrap "
+                         f"(hay {n_levels})")
+    sets = []
+    max_draws = 100 * n_boot
+    for _ in range(max_draws):
+        if len(sets) >= n_boot:
+            break
+        idx = rng.integers(0, n, n)
+        if len(np.unique(doses[idx])) >= min_levels:
+            sets.append(idx)
+    if len(sets) < n_boot:
+        raise ValueError(f"Solo {len(sets)} de {n_boot} remuestreos con {min_levels} dosis distintas "
+                         f"tras {max_draws} intentos")
+    return sets
+
+
+def loo_indices(n):
+    """Conjuntos de índices dejando fuera cada punto"""
+    return [np.delete(np.arange(n), i) for i in range(n)]
+
+
+def validate_calibration(pixels, doses, params, pixel_std=None, loss="linear", n_boot=500,
+                         level=0.95, n_grid=200, max_workers=None, seed=0,
+                         progress=None, cancelled=None):
+    """
+    Bootstrap y LOO de la calibración de todos los canales.
+
+    pixels: (n, k) valores de píxel; doses: (n,); params: (k, 3) ajuste nominal.
+    pixel_std y loss como en fit_channels. `progress(hechos, total)` se llama
+    al terminar cada bloque de reajustes; si `cancelled()` devuelve True se
+    descartan los pendientes y se devuelve None.
+
+    Devuelve un dict con:
+      boot_params (B, k, 3), param_ci (k, 3, 2), param_std (k, 3),
+      band_x, band_low, band_high (k, n_grid): banda de confianza de la curva,
+      residuals y loo_residuals (n, k): D medida - D predicha (nominal / sin el punto),
+      stats: por canal rmse, loo_rmse, loo_max, bias y fallos.
+    """
+    pixels = np.asarray(pixels, dtype=float)
+    doses = np.asarray(doses, dtype=float)
+    params = np.asarray(params, dtype=float)
+    if pixel_std is not None:
+        pixel_std = np.asarray(pixel_std, dtype=float)
+    n, k = pixels.shape
+
+    rng = np.random.default_rng(seed)
+    index_sets = bootstrap_indices(doses, n_boot, rng) + loo_indices(n)
+
+    # Pocos bloques grandes: cada proceso amortiza el arranque sobre muchos ajustes
+    workers = max_workers or os.cpu_count() or 1
+    n_chunks = min(len(index_sets), 4 * workers)
+    bounds = np.linspace(0, len(index_sets), n_chunks + 1).astype(int)
+    chunks = [(bounds[i], bounds[i + 1]) for i in range(n_chunks)]
+
+    refits = np.empty((len(index_sets), k, 3))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_refit_chunk, pixels, doses, pixel_std, params, loss, index_sets[lo:hi]): (lo, hi)
+            for lo, hi in chunks
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            if cancelled is not None and cancelled():
+                pool.shutdown(cancel_futures=True)
+                return None
+            lo, hi = futures[future]
+            refits[lo:hi] = future.result()
+            if progress is not None:
+                progress(done, len(chunks))
+
+    boot, loo = refits[:n_boot], refits[n_boot:]
+    alpha = (1 - level) / 2
+
+    # Banda de la curva: percentiles de la dosis predicha por cada remuestreo
+    band_x = np.stack([np.linspace(pixels[:, j].min(), pixels[:, j].max(), n_grid) for j in range(k)])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        curves = rational(band_x[None], boot[..., 0:1], boot[..., 1:2], boot[..., 2:3])  # (B, k, n_grid)
+        band_low, band_high = np.nanpercentile(curves, [100 * alpha, 100 * (1 - alpha)], axis=0)
+
+        residuals = doses[:, None] - rational(pixels, *params.T)
+        # Predicción de cada punto con el ajuste que no lo incluye (fila i de loo)
+        loo_residuals = doses[:, None] - rational(pixels, loo[..., 0], loo[..., 1], loo[..., 2])
+
+    stats = []
+    for j in range(k):
+        r, lr = residuals[:, j], loo_residuals[:, j]
+        stats.append({
+            "rmse": float(np.sqrt(np.mean(r ** 2))),
+            "loo_rmse": float(np.sqrt(np.nanmean(lr ** 2))),
+            "loo_max": float(np.nanmax(np.abs(lr))),
+            "bias": float(np.mean(r)),
+            "failed": int(np.isnan(boot[:, j, 0]).sum() + np.isnan(loo[:, j, 0]).sum()),
+        })
+
+    return {
+        "boot_params": boot,
+        "param_ci": np.moveaxis(np.nanpercentile(boot, [100 * alpha, 100 * (1 - alpha)], axis=0), 0, -1),
+        "param_std": np.nanstd(boot, axis=0),
+        "band_x": band_x,
+        "band_low": band_low,
+        "band_high": band_high,
+        "band_nominal": rational(band_x, params[:, 0:1], params[:, 1:2], params[:, 2:3]),
+        "residuals": residuals,
+        "loo_residuals": loo_residuals,
+        "loo_params": loo,
+        "level": level,
+        "stats": stats,
+    }
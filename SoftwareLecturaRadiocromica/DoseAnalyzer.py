@@ -1,27 +1,69 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, scrolledtext, messagebox
-from PIL import Image, ImageTk
 import numpy as np
-import cv2
 import os
-import csv
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from mpl_toolkits.mplot3d import Axes3D  # Importar antes de usar 3D
-import matplotlib.cm as cm
-import customtkinter as ctk
+import json
 from datetime import datetime
 
+from ResultStore import ResultStore
+from DoseEngine import DoseEngine, COMBINE_METHODS, block_mean
+
+# Las dependencias pesadas (cv2, PIL, matplotlib) se importan dentro de los
+# métodos que las usan, para que la ventana principal abra cuanto antes.
+# Ver ImportTiming.py para medir el tiempo de importación.
+
+# Calibración (se lee la primera vez que se calcula una dosis). Se usa el
+# archivo .rccal de CalibrationRC si existe; si no, los archivos de texto
+# anteriores (CalibParameters.txt, CalibCovariance.txt y DoseStd.txt).
+CALIB_FILE = 'Calibracion.rccal'
+LEGACY_CALIB_FILE = 'CalibParameters.txt'
+NOISE_FILE = 'DoseStd.txt'
+_calibration_file = None
+
+def get_calibration_path():
+    return CALIB_FILE if os.path.isfile(CALIB_FILE) else LEGACY_CALIB_FILE
+
+def get_calibration_file():
+    """Devuelve la calibración (CalibrationFile, ver CalibrationFile.py)"""
+    global _calibration_file
+    if _calibration_file is None:
+        from CalibrationFile import load_calibration
+        calib = load_calibration(get_calibration_path())
+        if len(calib.channels) != 3:
+            raise ValueError(f"'{get_calibration_path()}' no es una calibración RGB de película")
+        # Las familias en netOD necesitan la película sin irradiar (guardada por CalibrationRC)
+        if calib.model.variable == "netod" and "reference" not in calib.arrays:
+            raise ValueError(f"'{get_calibration_path()}' no incluye la respuesta de la película sin irradiar")
+        _calibration_file = calib
+    return _calibration_file
+
+def get_calibration():
+    """Devuelve la matriz de calibración (filas: parámetros, p. ej. a, b, c; columnas: rojo, verde, azul)"""
+    return np.asarray(get_calibration_file().params).T
+
+def get_calibration_covariance():
+    """Devuelve las covarianzas (3, p, p) de la calibración (canal, parámetro, parámetro) o None"""
+    cov = get_calibration_file().cov
+    return None if cov is None else np.asarray(cov)
+
+def get_pixel_noise():
+    """Ruido típico de un píxel por canal (guardado en la calibración o media cuadrática de DoseStd.txt) o None"""
+    calib = get_calibration_file()
+    if "pixel_noise" in calib.arrays:
+        return np.asarray(calib.arrays["pixel_noise"])
+    if not os.path.isfile(NOISE_FILE):
+        return None
+    stds = np.loadtxt(NOISE_FILE).reshape(-1, 3)
+    return np.sqrt(np.mean(stds ** 2, axis=0))
 
-# Parámetros de calibración
-pars = np.loadtxt('CalibParameters.txt').reshape(3, 3)
-redCali, greenCali, blueCali = pars[:, 0], pars[:, 1], pars[:, 2]
+# Base de datos local con todos los resultados guardados
+RESULTS_DB = 'Resultados.db'
 
-# Compatibilidad Pillow
-try:
-    RESAMPLING = Image.Resampling.LANCZOS
-except AttributeError:
-    RESAMPLING = Image.LANCZOS
+# Archivos de sesión (estado del análisis + mapas de dosis opcionales).
+# Versión 2: la clave de cada mapa incluye el método de combinación de canales
+# (las de la versión 1 tienen 5 campos y se calcularon con la media).
+SESSION_VERSION = 2
+SESSION_SUFFIX = '.session.npz'
 
 class DoseApp:
     def __init__(self, root):
@@ -39,6 +81,10 @@ class DoseApp:
         self.manual_circles = []  # Lista para almacenar círculos añadidos manualmente
         self.subcircles_data = []  # Para almacenar datos de los subcírculos
         self.selected_subcircle = None  # Para almacenar el subcírculo seleccionado
+        self.result_store = None  # Se abre al guardar el primer resultado
+        self.circle_dose_maps = {}  # Mapas de dosis por círculo ya calculados
+        self.circle_unc_maps = {}  # Mapas de incertidumbre, con las mismas claves
+        self.dose_engine = None  # Se crea al calcular la primera dosis
 
         # --- Paleta de colores ---
         fondo = "#1E1E2F"
@@ -89,6 +135,8 @@ class DoseApp:
         self.name_entry.pack(pady=(0, 5))
         styled_button(save_frame, "Guardar medición", self.save_measurement).pack(pady=3, fill="x")
         styled_button(save_frame, "Ver lista de dosis", self.show_dose_list).pack(pady=3, fill="x")
+        styled_button(save_frame, "Guardar sesión", self.save_session).pack(pady=3, fill="x")
+        styled_button(save_frame, "Abrir sesión", self.load_session).pack(pady=3, fill="x")
 
         # Recuadro para mostrar resultados
         self.result_frame = tk.Frame(self.info_frame, bg="#2C2F48", bd=1, relief="solid")
@@ -208,6 +256,17 @@ class DoseApp:
         
         styled_button(bg_frame, "Medir fondo", self.measure_background).pack(side="left", padx=5)
 
+        # Combinación de los canales R, G, B en la dosis
+        method_frame = tk.Frame(tools_panel, bg=fondo)
+        method_frame.pack(pady=5, fill="x")
+
+        tk.Label(method_frame, text="Combinación de canales:", bg=fondo, fg=texto).pack(anchor="w")
+        self.combine_method = tk.StringVar(value="weighted")
+        for value, label in COMBINE_METHODS.items():
+            tk.Radiobutton(method_frame, text=label, variable=self.combine_method,
+                           value=value, bg=fondo, fg=texto, selectcolor=boton_color,
+                           activebackground=fondo, activeforeground=texto).pack(anchor="w")
+
         # Canvas bindings
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
         self.canvas.bind_all("<Shift-MouseWheel>", self._on_mousewheel)
@@ -297,155 +356,79 @@ class DoseApp:
         self.results_text.tag_configure("subheader", font=("Segoe UI", 10, "bold"))
         self.results_text.tag_configure("normal", font=("Consolas", 10))
 
+    def get_result_store(self):
+        """Devuelve (abriéndolo la primera vez) el almacén SQLite de resultados"""
+        if self.result_store is None:
+            self.result_store = ResultStore(RESULTS_DB)
+        return self.result_store
+
+    def get_labeled_circles(self, area):
+        """Devuelve [(circle_id, circle), ...] en el orden A, B, C... del esquema"""
+        circles_with_positions = [(circle, i) for i, circle in enumerate(area["circles"])]
+        sorted_circles = self.sort_circles_by_position(circles_with_positions, area["coords"])
+
+        letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L']
+        labeled = []
+        for i, (circle, _) in enumerate(sorted_circles):
+            circle_id = f"{area['name']}_{letters[i % len(letters)]}"
+            # Marcar círculos manuales
+            if "manual" in circle and circle["manual"]:
+                circle_id += " (M)"
+            labeled.append((circle_id, circle))
+        return labeled
+
     def save_results_to_file(self):
-        """Guarda los resultados en un archivo de texto"""
+        """Guarda los resultados de todas las radiocromicas en la base de datos de resultados"""
         if not self.radiochromic_areas:
             print("⚠️ No hay datos para guardar.")
             return
-            
-        # Obtener la fecha y hora actual
-        now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-        
-        # Crear nombre de archivo
-        filename = f"Resultados_Dosis_{date_str}.txt"
-        
+
+        films = []
+        for area in self.radiochromic_areas:
+            circles = []
+            for circle_id, circle in self.get_labeled_circles(area):
+                row = dict(circle)
+                row["label"] = circle_id
+                circles.append(row)
+            films.append({
+                "name": area["name"],
+                "coords": area["coords"],
+                "background": self.get_area_background(area),
+                "circles": circles
+            })
+
         try:
-            with open(filename, "w", encoding="utf-8") as file:
-                # Información general
-                file.write("=== RESULTADOS DE ANÁLISIS DE DOSIS ===\n\n")
-                
-                if hasattr(self, 'image_path'):
-                    file.write(f"Imagen: {os.path.basename(self.image_path)}\n")
-                file.write(f"Fecha de análisis: {now.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                
-                # Contar círculos totales
-                total_circles = sum(len(area["circles"]) for area in self.radiochromic_areas)
-                file.write(f"Número de radiocromicas: {len(self.radiochromic_areas)}\n")
-                file.write(f"Número total de círculos: {total_circles}\n\n")
-                
-                # Detalles por radiocromica
-                for area in self.radiochromic_areas:
-                    file.write(f"=== {area['name']} ===\n")
-                    
-                    if not area["circles"]:
-                        file.write("  No hay círculos en esta área.\n\n")
-                        continue
-                    
-                    # Obtener el fondo del área
-                    background = self.get_area_background(area)
-                    file.write(f"  Fondo del área: {background:.4f} Gy\n")
-                    
-                    # Estadísticas del área
-                    doses = [circle["mean_dose"] for circle in area["circles"]]
-                    mean_dose = np.mean(doses)
-                    std_dose = np.std(doses, ddof=1) if len(doses) > 1 else 0
-                    
-                    file.write(f"  Círculos: {len(area['circles'])}\n")
-                    file.write(f"  Dosis promedio: {mean_dose:.4f} Gy\n")
-                    file.write(f"  Desviación: {std_dose:.4f} Gy\n\n")
-                    
-                    # Tabla de círculos
-                    file.write("  ID\tDosis (Gy)\tDosis-Fondo (Gy)\tσ (Gy)\n")
-                    file.write("  " + "-" * 50 + "\n")
-                    
-                    # Ordenar círculos según el esquema proporcionado (A, B, C en la primera fila, D, E, F en la segunda)
-                    circles_with_positions = []
-                    for i, circle in enumerate(area["circles"]):
-                        circles_with_positions.append((circle, i))
-                    
-                    # Ordenar círculos por posición (primero por fila, luego por columna de derecha a izquierda en la primera fila
-                    # y de izquierda a derecha en la segunda fila)
-                    sorted_circles = self.sort_circles_by_position(circles_with_positions, area["coords"])
-                    
-                    for i, (circle, _) in enumerate(sorted_circles):
-                        # Asignar letra según el esquema proporcionado
-                        letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L']
-                        circle_id = f"{area['name']}_{letters[i % len(letters)]}"
-                        
-                        # Marcar círculos manuales
-                        if "manual" in circle and circle["manual"]:
-                            circle_id += " (M)"
-                            
-                        dose = max(0, circle["mean_dose"])  # Asegurar que la dosis no sea negativa
-                        dose_bg_corrected = max(0, dose - background)  # Asegurar que la dosis corregida no sea negativa
-                        std = circle["std"]
-                        
-                        file.write(f"  {circle_id}\t{dose:.4f}\t{dose_bg_corrected:.4f}\t{std:.4f}\n")
-                    
-                    file.write("\n")
-                
-            print(f"✅ Resultados guardados en '{filename}'")
-            
+            # Una sola transacción por imagen
+            self.get_result_store().save_image_results(
+                getattr(self, 'image_path', ''), films, get_calibration(), get_calibration_path()
+            )
+            total_circles = sum(len(f["circles"]) for f in films)
+            print(f"✅ Resultados guardados en '{RESULTS_DB}' ({len(films)} radiocromicas, {total_circles} círculos)")
+
             # Mostrar mensaje en la ventana de resultados
             self.results_text.config(state="normal")
-            self.results_text.insert(tk.END, f"\n\n✅ Resultados guardados en '{filename}'", "header")
+            self.results_text.insert(tk.END, f"\n\n✅ Resultados guardados en '{RESULTS_DB}'", "header")
             self.results_text.config(state="disabled")
-            
+
         except Exception as e:
             print(f"❌ Error al guardar resultados: {e}")
 
     def save_subcircles_to_file(self):
-        """Guarda los resultados de los subcírculos en un archivo de texto"""
+        """Guarda los resultados de los subcírculos en la base de datos de resultados"""
         if not self.subcircles_data:
             print("⚠️ No hay datos de subcírculos para guardar.")
             return
-            
-        # Obtener la fecha y hora actual
-        now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-        
-        # Crear nombre de archivo
-        filename = f"Resultados_Pocillos_{date_str}.txt"
-        
+
         try:
-            with open(filename, "w", encoding="utf-8") as file:
-                # Información general
-                file.write("=== RESULTADOS DE ANÁLISIS DE POCILLOS ===\n\n")
-                
-                if hasattr(self, 'image_path'):
-                    file.write(f"Imagen: {os.path.basename(self.image_path)}\n")
-                file.write(f"Fecha de análisis: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                
-                # Información del círculo principal
-                if self.current_circle_data:
-                    circle_id = self.current_circle_data.get("id", "Desconocido")
-                    area_name = self.current_circle_data.get("area_name", "Desconocida")
-                    background = self.current_circle_data.get("background", 0)
-                    
-                    file.write(f"Círculo principal: {circle_id}\n")
-                    file.write(f"Área radiocrómica: {area_name}\n")
-                    file.write(f"Fondo: {background:.4f} Gy\n\n")
-                
-                # Tabla de subcírculos
-                file.write("Pocillo\tDosis (Gy)\tσ (Gy)\tError\n")
-                file.write("-" * 50 + "\n")
-                
-                for i, data in enumerate(self.subcircles_data):
-                    mean_dose = data.get("mean_dose", 0)
-                    std_dose = data.get("std_dose", 0)
-                    error = (std_dose / mean_dose) if mean_dose > 0 else 0
-                    
-                    file.write(f"{i+1}\t{mean_dose:.4f}\t{std_dose:.4f}\t{error:.4f}\n")
-                
-                # Estadísticas globales
-                if self.subcircles_data:
-                    doses = [data.get("mean_dose", 0) for data in self.subcircles_data]
-                    mean_global = np.mean(doses)
-                    std_global = np.std(doses, ddof=1) if len(doses) > 1 else 0
-                    cv_global = (std_global / mean_global) if mean_global > 0 else 0
-                    
-                    file.write("\nEstadísticas globales:\n")
-                    file.write(f"Dosis promedio: {mean_global:.4f} Gy\n")
-                    file.write(f"Desviación estándar: {std_global:.4f} Gy\n")
-                    file.write(f"Coeficiente de variación: {cv_global:.4f}\n")
-                
-            print(f"✅ Resultados de pocillos guardados en '{filename}'")
-            
+            self.get_result_store().save_wells(
+                getattr(self, 'image_path', ''), self.current_circle_data, self.subcircles_data, get_calibration()
+            )
+            print(f"✅ Resultados de pocillos guardados en '{RESULTS_DB}'")
+
             # Mostrar mensaje en la ventana de subcírculos si está abierta
             if self.subcircles_window and self.subcircles_window.winfo_exists():
-                messagebox.showinfo("Guardado", f"Resultados guardados en '{filename}'")
-            
+                messagebox.showinfo("Guardado", f"Resultados guardados en '{RESULTS_DB}'")
+
         except Exception as e:
             print(f"❌ Error al guardar resultados de pocillos: {e}")
             if self.subcircles_window and self.subcircles_window.winfo_exists():
@@ -587,28 +570,38 @@ class DoseApp:
         except ValueError:
             print("Error: valores inválidos.")
 
+    def get_dose_engine(self):
+        """Motor de dosis multicanal con la calibración actual"""
+        if self.dose_engine is None:
+            calib = get_calibration_file()
+            self.dose_engine = DoseEngine(get_calibration(), get_pixel_noise(), get_calibration_covariance(),
+                                          family=calib.family, reference=calib.arrays.get("reference"))
+        return self.dose_engine
+
     def calcular_dosis_promedio(self, bloque_rgb):
-        R, G, B = bloque_rgb[:, :, 0], bloque_rgb[:, :, 1], bloque_rgb[:, :, 2]
-        try:
-            doses = [
-                redCali[0] + (redCali[1] / (np.mean(R[R > 0]) - redCali[2])),
-                greenCali[0] + (greenCali[1] / (np.mean(G[G > 0]) - greenCali[2])),
-                blueCali[0] + (blueCali[1] / (np.mean(B[B > 0]) - blueCali[2]))
-            ]
-            return max(0, np.mean(doses))  # Asegurar que la dosis no sea negativa
-        except:
-            return 0    
+        # Media de los píxeles no nulos de cada canal y combinación de los tres canales
+        pixels = block_mean(bloque_rgb, max(bloque_rgb.shape[:2]))[0, 0]
+        dose, _ = self.get_dose_engine().combine(pixels, self.combine_method.get())
+        return max(0, dose) if np.isfinite(dose) else 0  # Asegurar que la dosis no sea negativa
 
     def load_image(self):
-        self.image_path = filedialog.askopenfilename(filetypes=[("TIFF files", "*.tiff")])
-        if not self.image_path:
+        image_path = filedialog.askopenfilename(filetypes=[("TIFF files", "*.tiff")])
+        if not image_path:
             print("No se seleccionó imagen.")
             return
 
+        self.open_image(image_path)
+
+    def open_image(self, image_path):
+        """Carga la imagen en el canvas y reinicia el análisis"""
+        from PIL import Image, ImageTk
+        import cv2
+        
+        self.image_path = image_path
         self.original_img = cv2.imread(self.image_path)
         if self.original_img is None:
             print("Error al cargar la imagen.")
-            return
+            return False
 
         if self.original_img.dtype != np.uint8:
             self.original_img = cv2.convertScaleAbs(self.original_img)
@@ -618,7 +611,7 @@ class DoseApp:
 
         max_size = 800
         if self.pil_img.width > max_size or self.pil_img.height > max_size:
-            self.pil_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            self.pil_img.thumbnail((max_size, max_size), getattr(Image, 'Resampling', Image).LANCZOS)
 
         self.tk_image = ImageTk.PhotoImage(self.pil_img)
         self.canvas.config(scrollregion=(0, 0, self.pil_img.width, self.pil_img.height))
@@ -631,9 +624,154 @@ class DoseApp:
         self.radiochromic_areas = []
         self.detected_circles = []
         self.manual_circles = []
+        self.circle_dose_maps = {}
+        self.circle_unc_maps = {}
         self.update_dose_results_display()
 
         print(f"✅ Imagen cargada: {os.path.basename(self.image_path)}")
+        return True
+
+    def save_session(self):
+        """Guarda el estado del análisis (áreas, círculos, fondo...) en un archivo .npz"""
+        if self.pil_img is None or not self.radiochromic_areas:
+            print("⚠️ No hay análisis que guardar.")
+            return
+
+        default_name = os.path.splitext(os.path.basename(self.image_path))[0] + SESSION_SUFFIX
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".npz", initialfile=default_name,
+            filetypes=[("Sesión DoseAnalyzer", "*.npz")]
+        )
+        if not filename:
+            return
+
+        include_maps = messagebox.askyesno(
+            "Guardar sesión", "¿Incluir los mapas de dosis calculados? (archivo más grande)"
+        )
+
+        state = {
+            "version": SESSION_VERSION,
+            "image_path": os.path.abspath(self.image_path),
+            "display_size": [self.pil_img.width, self.pil_img.height],
+            "calibration_file": os.path.abspath(get_calibration_path()),
+            "background": self.background_var.get(),
+            "combine_method": self.combine_method.get(),
+            "default_circle_radius": self.default_circle_radius,
+            "next_area_id": self.next_area_id,
+            "radiochromic_areas": self.radiochromic_areas,
+            "manual_circles": self.manual_circles,
+            "detected_circles": self.detected_circles,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+        arrays = {
+            # Los valores de numpy (coordenadas de Hough, estadísticas) se guardan como escalares
+            "state": np.array(json.dumps(state, default=lambda o: o.item() if hasattr(o, "item") else str(o))),
+            "calibration": get_calibration(),
+        }
+        if include_maps:
+            for i, (key, dose_map) in enumerate(self.circle_dose_maps.items()):
+                arrays[f"map_{i}"] = dose_map.astype(np.float32)
+                arrays[f"map_{i}_key"] = np.array(key, dtype=float)
+
+        try:
+            np.savez_compressed(filename, **arrays)
+            print(f"✅ Sesión guardada en '{filename}'")
+        except Exception as e:
+            print(f"❌ Error al guardar la sesión: {e}")
+
+    def load_session(self):
+        """Restaura un análisis guardado con save_session sin recalcular nada"""
+        filename = filedialog.askopenfilename(filetypes=[("Sesión DoseAnalyzer", "*.npz")])
+        if not filename:
+            return
+
+        try:
+            with np.load(filename, allow_pickle=False) as data:
+                state = json.loads(str(data["state"]))
+                saved_pars = data["calibration"]
+                dose_maps = {}
+                for name in data.files:
+                    if name.startswith("map_") and not name.endswith("_key"):
+                        key = tuple(data[f"{name}_key"].tolist())
+                        if len(key) == 5:
+                            # Sesión de la versión 1: mapas calculados con la media de canales
+                            key += (float(list(COMBINE_METHODS).index("mean")),)
+                        dose_maps[key] = data[name].astype(float)
+        except Exception as e:
+            print(f"❌ Error al leer la sesión: {e}")
+            return
+
+        if state.get("version", 1) > SESSION_VERSION:
+            print(f"⚠️ La sesión es de una versión más reciente ({state['version']}); "
+                  "puede que algunos datos no se restauren.")
+
+        image_path = state["image_path"]
+        if not os.path.isfile(image_path):
+            # Buscar la imagen junto al archivo de sesión
+            candidate = os.path.join(os.path.dirname(filename), os.path.basename(image_path))
+            if not os.path.isfile(candidate):
+                print(f"⚠️ No se encuentra la imagen de la sesión: {image_path}")
+                return
+            image_path = candidate
+
+        if not self.open_image(image_path):
+            return
+
+        if [self.pil_img.width, self.pil_img.height] != state["display_size"]:
+            print("⚠️ La imagen ha cambiado de tamaño desde que se guardó la sesión.")
+
+        current_pars = get_calibration()
+        if saved_pars.shape != current_pars.shape or not np.allclose(saved_pars, current_pars):
+            print("⚠️ La sesión se calculó con otra calibración; las dosis guardadas no corresponden "
+                  f"a '{get_calibration_path()}'. Vuelva a detectar los círculos para recalcularlas.")
+
+        self.background_var.set(state["background"])
+        self.combine_method.set(state.get("combine_method", "mean"))
+        self.default_circle_radius = state["default_circle_radius"]
+        self.next_area_id = state["next_area_id"]
+        self.radiochromic_areas = state["radiochromic_areas"]
+        for area in self.radiochromic_areas:
+            area["coords"] = tuple(area["coords"])
+        self.manual_circles = [tuple(c) for c in state["manual_circles"]]
+        self.detected_circles = [tuple(c) for c in state["detected_circles"]]
+        self.circle_dose_maps = dose_maps
+        self.circle_unc_maps = {}
+
+        self.redraw_session_overlays()
+        self.update_dose_results_display()
+
+        print(f"✅ Sesión restaurada desde '{filename}' (guardada el {state['saved_at']})")
+
+    def redraw_session_overlays(self):
+        """Redibuja áreas, círculos y etiquetas a partir del estado actual"""
+        for area in self.radiochromic_areas:
+            x1, y1, x2, y2 = area["coords"]
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline='blue', width=2, tags="radiochromic")
+            self.canvas.create_text(x1+5, y1+5, text=area["name"], anchor="nw",
+                                    fill="white", tags="radiochromic")
+
+            for circle_id, circle in self.get_labeled_circles(area):
+                x, y, r = circle["x"], circle["y"], circle["r"]
+                if circle.get("manual"):
+                    continue
+                self.canvas.create_oval(x - r, y - r, x + r, y + r,
+                                        outline='green', width=2, tags="circle_detect")
+                self.canvas.create_text(x, y - r - 10, text=circle_id, fill="white", tags="circle_detect")
+                self.canvas.create_text(x, y, text=f"{circle['mean_dose']:.2f}",
+                                        fill="yellow", tags="circle_detect")
+
+        for x, y, r, area_idx in self.manual_circles:
+            self.canvas.create_oval(x - r, y - r, x + r, y + r,
+                                    outline='yellow', width=2, tags="manual_circle")
+            for circle in self.radiochromic_areas[area_idx]["circles"]:
+                if circle.get("manual") and circle["x"] == x and circle["y"] == y:
+                    self.canvas.create_text(x, y, text=f"{circle['mean_dose']:.2f} Gy",
+                                            fill="yellow", tags="manual_circle")
+                    break
+
+        if self.detected_circles:
+            self.canvas.bind("<Button-3>", self.on_circle_click)
 
     def on_resize(self, event):
         # Manejar el redimensionamiento del canvas
@@ -721,6 +859,8 @@ class DoseApp:
         self.results_text.config(state="disabled")
 
     def detectar_areas_radiocromicas(self):
+        import cv2
+        
         if self.pil_img is None:
             print("⚠️ No hay imagen cargada.")
             return
@@ -965,6 +1105,8 @@ class DoseApp:
         return None
 
     def on_click(self, event):
+        import cv2
+        
         if self.pil_img is None:
             return
 
@@ -1032,15 +1174,18 @@ class DoseApp:
         if area_idx is not None:
             background = self.get_area_background(self.radiochromic_areas[area_idx])
         
-        R, G, B = cut[:, :, 0], cut[:, :, 1], cut[:, :, 2]
         try:
-            dose = [
-                redCali[0] + (redCali[1] / (np.mean(R[R > 0]) - redCali[2])),
-                greenCali[0] + (greenCali[1] / (np.mean(G[G > 0]) - greenCali[2])),
-                blueCali[0] + (blueCali[1] / (np.mean(B[B > 0]) - blueCali[2]))
-            ]
-            avg_dose = max(0, np.mean(dose))  # Asegurar que la dosis no sea negativa
-            std_dose = np.std(dose, ddof=1)
+            # Media y dispersión de cada canal en la región (píxeles no nulos)
+            valid = np.all(cut > 0, axis=-1)
+            if not valid.any():
+                raise ValueError("no hay píxeles válidos en la región")
+            channels = cut[valid].astype(float)
+            pixels = channels.mean(axis=0)
+            pixel_std = channels.std(axis=0, ddof=1) if len(channels) > 1 else None
+
+            dose, sigma = self.get_dose_engine().combine(pixels, self.combine_method.get(), pixel_std)
+            avg_dose = max(0, dose)  # Asegurar que la dosis no sea negativa
+            std_dose = float(sigma)
             
             # Restar fondo si es necesario
             avg_dose_corrected = max(0, avg_dose - background)  # Asegurar que la dosis corregida no sea negativa
@@ -1065,9 +1210,6 @@ class DoseApp:
             print("No hay medición lista para guardar.")
             return
 
-        filename = "Mediciones.csv"
-        file_exists = os.path.isfile(filename)
-
         # Leer el nombre escrito
         name = self.name_entry.get().strip()
         if not name:
@@ -1081,20 +1223,14 @@ class DoseApp:
         
         corrected_dose = max(0, self.last_avg_dose - background)  # Asegurar que la dosis corregida no sea negativa
 
-        with open(filename, mode="a", newline="") as file:
-            writer = csv.writer(file, delimiter='\t')
-
-            if not file_exists:
-                writer.writerow(["Imagen", "Nombre_Medicion", "Dosis_Promedio", "Dosis_Neta", "Desviacion_Estandar", "Fondo"])
-
-            writer.writerow([
-                os.path.basename(self.image_path),
-                name,
-                f"{self.last_avg_dose:.4f}",
-                f"{corrected_dose:.4f}",
-                f"{self.last_std_dose:.4f}",
-                f"{background:.4f}"
-            ])
+        try:
+            self.get_result_store().save_measurement(
+                self.image_path, name, self.last_x, self.last_y,
+                self.last_avg_dose, corrected_dose, self.last_std_dose, background, get_calibration()
+            )
+        except Exception as e:
+            print(f"❌ Error al guardar la medición: {e}")
+            return
 
         # Limpiar nombre luego de guardar
         self.name_entry.delete(0, tk.END)
@@ -1108,6 +1244,10 @@ class DoseApp:
         print(f"Medición '{name}' guardada exitosamente.")
 
     def generate_dose_map_3d(self):
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import Axes3D  # Registra la proyección 3D
+        import matplotlib.cm as cm
+        
         if self.pil_img is None:
             print("No hay imagen cargada.")
             return
@@ -1118,7 +1258,6 @@ class DoseApp:
         # Definir resolución del grid (más alto = menos detalle, más rápido)
         step = 5  # píxeles por bloque
         h, w, _ = img_array.shape
-        dose_map = []
 
         # Crear un mapa de fondos por píxel
         background_map = np.zeros((h, w))
@@ -1129,22 +1268,9 @@ class DoseApp:
             background = self.get_area_background(area)
             background_map[y1:y2, x1:x2] = background
 
-        for y in range(0, h, step):
-            row = []
-            for x in range(0, w, step):
-                block = img_array[y:y+step, x:x+step]
-                if block.size == 0:
-                    row.append(0)
-                    continue
-                avg_dose = self.calcular_dosis_promedio(block)
-                # Restar fondo correspondiente a la posición
-                background = background_map[y, x]
-                avg_dose = max(0, avg_dose - background)  # Asegurar que la dosis no sea negativa
-                row.append(avg_dose)
-            if row:  # Asegurarse de que la fila no esté vacía
-                dose_map.append(row)
-
-        dose_map = np.array(dose_map)
+        # Dosis media por bloque y resta del fondo de la posición de cada bloque
+        dose_map = self.get_dose_engine().dose_map(img_array, self.combine_method.get(), step)
+        dose_map = np.maximum(0, dose_map - background_map[::step, ::step])  # Asegurar que la dosis no sea negativa
 
         # Crear malla de coordenadas
         X = np.arange(0, dose_map.shape[1])
@@ -1179,6 +1305,8 @@ class DoseApp:
         plt.show()    
 
     def detectar_circulos_y_calcular_dosis(self):
+        import cv2
+        
         if self.pil_img is None:
             print("⚠️ No hay imagen cargada.")
             return
@@ -1340,6 +1468,8 @@ class DoseApp:
 
     def procesar_circulo_con_mascara(self, img_rgb, x, y, r, clean_mask, x_offset, y_offset):
         """Procesa un círculo usando una máscara que excluye intersecciones"""
+        import cv2
+        
         h, w, _ = img_rgb.shape
         
         # Recorte de la imagen completa
@@ -1381,43 +1511,31 @@ class DoseApp:
         if area_idx is not None:
             background = self.get_area_background(self.radiochromic_areas[area_idx])
         
-        # Calcular dosis en bloques pequeños
-        step = 1
-        dose_map = []
-        for j in range(0, cut.shape[0], step):
-            row = []
-            for i in range(0, cut.shape[1], step):
-                block = cut[j:j+step, i:i+step]
-                if block.size == 0 or np.all(block == 0):
-                    row.append(0)
-                    continue
-                dose = self.calcular_dosis_promedio(block)
-                # Restar fondo
-                dose = max(0, dose - background)  # Asegurar que la dosis no sea negativa
-                row.append(dose)
-            if row:  # Asegurarse de que la fila no esté vacía
-                dose_map.append(row)
+        # Mapas de dosis e incertidumbre píxel a píxel (fondo restado) en una sola pasada
+        dose_map, unc_map = self.get_dose_engine().dose_map(
+            cut, self.combine_method.get(), 1, background, with_uncertainty=True
+        )
                 
-        if not dose_map:
+        if dose_map.size == 0:
             return {
                 "x": x,
                 "y": y,
                 "r": r,
                 "mean_dose": 0,
                 "std": 0,
+                "unc": 0,
                 "min": 0,
                 "max": 0,
                 "homo_std": 0,
                 "homo_range": 0
             }
-                
-        dose_map = np.array(dose_map)
-        
+
         # Estadísticas de homogeneidad
         valores_validos = dose_map[dose_map > 0]
         if len(valores_validos) == 0:
             mean_dose = 0
             std_dose = 0
+            unc_dose = 0
             min_dose = 0
             max_dose = 0
             homogeneity_std = 0
@@ -1425,6 +1543,7 @@ class DoseApp:
         else:
             mean_dose = np.mean(valores_validos)
             std_dose = np.std(valores_validos, ddof=1)
+            unc_dose = np.mean(unc_map[dose_map > 0])  # Incertidumbre típica de un píxel
             min_dose = np.min(valores_validos)
             max_dose = np.max(valores_validos)
             
@@ -1440,6 +1559,7 @@ class DoseApp:
             "r": r,
             "mean_dose": raw_dose,  # Dosis bruta
             "std": std_dose,
+            "unc": unc_dose,
             "min": min_dose,
             "max": max_dose,
             "homo_std": homogeneity_std,
@@ -1472,6 +1592,9 @@ class DoseApp:
 
     def create_subcircles_window(self, circle_data, dose_map):
         """Crea una ventana para mostrar los subcírculos en patrón 2-4-4-2"""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
         if self.subcircles_window and self.subcircles_window.winfo_exists():
             self.subcircles_window.destroy()
         
@@ -1695,6 +1818,8 @@ class DoseApp:
                 break
 
     def procesar_circulo(self, img_rgb, x, y, r, step=1, factor_radio=0.9, graficar=False):
+        import cv2
+        
         h, w, _ = img_rgb.shape
         radio_seguro = int(r * factor_radio)
 
@@ -1748,23 +1873,21 @@ class DoseApp:
                     
                     break
 
-        # Mapa por bloques
-        dose_map = []
-        for j in range(0, cut.shape[0], step):
-            row = []
-            for i in range(0, cut.shape[1], step):
-                block = cut[j:j+step, i:i+step]
-                if block.size == 0 or np.all(block == 0):
-                    row.append(0)
-                    continue
-                dose = self.calcular_dosis_promedio(block)
-                # Restar fondo
-                dose = max(0, dose - background)  # Asegurar que la dosis no sea negativa
-                row.append(dose)
-            if row:  # Asegurarse de que la fila no esté vacía
-                dose_map.append(row)
-
-        if not dose_map:
+        # Mapas de dosis e incertidumbre por bloques, en una sola pasada
+        # (reutilizados si ya se calcularon; una sesión restaura solo la dosis)
+        method = self.combine_method.get()
+        cache_key = (float(x), float(y), float(radio_seguro), float(step), float(background),
+                     float(list(COMBINE_METHODS).index(method)))
+        dose_map = self.circle_dose_maps.get(cache_key)
+        unc_map = self.circle_unc_maps.get(cache_key)
+        if dose_map is None or (graficar and unc_map is None):
+            dose_map, unc_map = self.get_dose_engine().dose_map(cut, method, step, background,
+                                                                with_uncertainty=True)
+            if dose_map.size:
+                self.circle_dose_maps[cache_key] = dose_map
+                self.circle_unc_maps[cache_key] = unc_map
+
+        if dose_map.size == 0:
             return {
                 "x": x,
                 "y": y,
@@ -1798,9 +1921,13 @@ class DoseApp:
             homogeneity_range = 100 * (1 - ((max_dose - min_dose) / mean_dose)) if mean_dose > 0 else 0
 
         if graficar and len(valores_validos) > 0:
-            from mpl_toolkits.mplot3d import Axes3D
+            import matplotlib.pyplot as plt
+            from mpl_toolkits.mplot3d import Axes3D  # Registra la proyección 3D
             import matplotlib.cm as cm
 
+            # Incertidumbre típica por bloque (calibración + ruido de píxel)
+            unc_dose = np.mean(np.asarray(unc_map)[dose_map > 0])
+
             # Guardar datos del círculo actual para uso posterior
             self.current_circle_data = {
                 "id": circle_id,
@@ -1808,6 +1935,7 @@ class DoseApp:
                 "background": background,
                 "mean_dose": mean_dose,
                 "std_dose": std_dose,
+                "unc_dose": unc_dose,
                 "min_dose": min_dose,
                 "max_dose": max_dose
             }
@@ -1841,6 +1969,7 @@ class DoseApp:
                 f"Promedio: {mean_dose:.3f} Gy\n"
                 f"Desviación estándar: {std_dose:.3f} Gy\n"
                 f"Error: {(std_dose/mean_dose):.4f}\n"
+                f"Incertidumbre por bloque: {unc_dose:.3f} Gy\n"
                 f"Mínimo: {min_dose:.3f} Gy\n"
                 f"Máximo: {max_dose:.3f} Gy\n"
                 f"Fondo: {background:.3f} Gy\n"
@@ -0,0 +1,187 @@
+import numpy as np
+
+from CalibrationModels import MODELS, net_od
+
+
+# Métodos de combinación de los tres canales
+COMBINE_METHODS = {
+    "mean": "Media de canales",
+    "weighted": "Ponderada (incertidumbre)",
+    "triple": "Triple canal (Micke/Mayer)",
+}
+
+
+def block_mean(img, step, return_counts=False):
+    """
+    Media por bloques de `step` x `step` píxeles, canal a canal, ignorando los
+    píxeles a cero (fuera de máscara). Devuelve un array (h/step, w/step, 3) con
+    NaN en los bloques sin píxeles válidos y, si se pide, el número de píxeles
+    promediados en cada bloque y canal.
+    """
+    img = np.asarray(img, dtype=float)
+    h, w = img.shape[:2]
+    if step == 1:
+        out = img.copy()
+        counts = (out > 0).astype(int)
+        out[out <= 0] = np.nan
+        return (out, counts) if return_counts else out
+
+    hb, wb = -(-h // step), -(-w // step)
+    padded = np.zeros((hb * step, wb * step, img.shape[2]))
+    padded[:h, :w] = img
+    blocks = padded.reshape(hb, step, wb, step, -1)
+    sums = blocks.sum(axis=(1, 3))
+    counts = (blocks > 0).sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(counts > 0, sums / counts, np.nan)
+    return (out, counts) if return_counts else out
+
+
+class DoseEngine:
+    """
+    Cálculo de dosis multicanal vectorizado para cualquier familia del
+    registro de CalibrationModels (por defecto la racional D = a + b / (P - c)).
+
+    `pars` es la matriz (parámetros x 3) de la calibración (p. ej. filas a, b,
+    c de CalibParameters.txt; columnas rojo, verde, azul). Las familias en
+    netOD necesitan `reference`, el valor (R, G, B) de la película sin
+    irradiar. Todas las operaciones trabajan sobre arrays (..., 3) de valores
+    de píxel, de modo que un mapa completo se calcula en una sola pasada.
+    """
+    def __init__(self, pars, pixel_std=None, param_cov=None, pixel_max=255.0, family="rational",
+                 reference=None):
+        self.family = MODELS[family]
+        pars = np.asarray(pars, dtype=float).reshape(self.family.n_params, 3)
+        # Parámetros por canal: (3, p)
+        self.params = pars.T
+        self.reference = None
+        if self.family.variable == "netod":
+            if reference is None:
+                raise ValueError(f"El modelo '{family}' necesita la respuesta de la película sin irradiar")
+            self.reference = np.asarray(reference, dtype=float).reshape(3)
+        # Ruido de lectura por canal (en unidades de píxel)
+        self.pixel_std = np.ones(3) if pixel_std is None else np.asarray(pixel_std, dtype=float)
+        # Covarianzas de los parámetros por canal: array (3, p, p) o None
+        self.param_cov = None if param_cov is None else np.asarray(param_cov, dtype=float)
+        self.pixel_max = float(pixel_max)
+
+    # ------------------------------------------------------------------
+    # Dosis y derivadas por canal
+    # ------------------------------------------------------------------
+    def model_input(self, pixels):
+        """Variable del modelo (píxel o netOD) y su derivada respecto al valor de píxel"""
+        pixels = np.asarray(pixels, dtype=float)
+        if self.reference is None:
+            return pixels, 1.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return net_od(pixels, self.reference), -1.0 / (pixels * np.log(10))
+
+    def channel_doses(self, pixels):
+        """Dosis de cada canal; `pixels` (..., 3) -> (..., 3)"""
+        x, _ = self.model_input(pixels)
+        return np.stack([self.family.dose(x[..., k], self.params[k]) for k in range(3)], axis=-1)
+
+    def sensitivity(self, pixels):
+        """Derivada local dD/dP de cada canal (-b / (P - c)^2 en el modelo racional)"""
+        x, dx = self.model_input(pixels)
+        slope = np.stack([self.family.dose_slope(x[..., k], self.params[k]) for k in range(3)], axis=-1)
+        return slope * dx
+
+    def calibration_variance(self, pixels):
+        """Varianza de la dosis por canal debida a la incertidumbre de los parámetros"""
+        x, _ = self.model_input(pixels)
+        if self.param_cov is None:
+            return np.zeros(x.shape)
+        # Jacobiano respecto a los parámetros de cada canal: (..., 3, p)
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            jac = np.stack([self.family.jacobian(x[..., k], *self.params[k]) for k in range(3)], axis=-2)
+        return np.einsum("...ki,kij,...kj->...k", jac, self.param_cov, jac)
+
+    def channel_variance(self, pixels, pixel_std=None):
+        """Varianza total de la dosis de cada canal (ruido de píxel + calibración)"""
+        pixel_std = self.pixel_std if pixel_std is None else np.asarray(pixel_std, dtype=float)
+        noise = (self.sensitivity(pixels) * pixel_std) ** 2
+        return noise + self.calibration_variance(pixels)
+
+    def thickness_slope(self, pixels):
+        """dD/dΔ en Δ = 1 si la densidad óptica se escala por Δ (grosor de la capa activa)"""
+        pixels = np.asarray(pixels, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dP = pixels * np.log(pixels / self.pixel_max)
+        return self.sensitivity(pixels) * dP
+
+    # ------------------------------------------------------------------
+    # Combinación de canales
+    # ------------------------------------------------------------------
+    def combine(self, pixels, method="weighted", pixel_std=None, propagate=False):
+        """
+        Combina los tres canales en un único valor de dosis por píxel.
+
+        Devuelve (dosis, sigma) con la forma de `pixels` sin el último eje. Para
+        "mean" sigma es la dispersión entre canales (o la incertidumbre propagada
+        si `propagate`); para "weighted" y "triple" es siempre la incertidumbre
+        propagada de la combinación.
+        """
+        doses = self.channel_doses(pixels)
+
+        if method == "mean" and not propagate:
+            dose = doses.mean(axis=-1)
+            return dose, doses.std(axis=-1, ddof=1)
+
+        var = self.channel_variance(pixels, pixel_std)
+
+        if method == "mean":
+            return doses.mean(axis=-1), np.sqrt(var.sum(axis=-1)) / 3
+        with np.errstate(invalid="ignore", divide="ignore"):
+            w = 1.0 / var
+        w = np.where(np.isfinite(w), w, 0.0)
+        w_sum = w.sum(axis=-1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dose = (w * doses).sum(axis=-1) / w_sum
+            sigma = np.sqrt(1.0 / w_sum)
+
+        if method == "triple":
+            # Micke et al. (2011) linealizado como en Mayer et al. (2012):
+            # D_k(Δ) ≈ D_k + s_k (Δ - 1); se minimiza Σ w_k (D_k + s_k ε - D)^2
+            # en (D, ε), que es una regresión ponderada de D_k frente a s_k
+            # cuya ordenada en el origen es la dosis libre de la perturbación.
+            s = self.thickness_slope(pixels)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                s_mean = (w * s).sum(axis=-1) / w_sum
+                ds = s - s_mean[..., None]
+                dd = doses - dose[..., None]
+                sxx = (w * ds ** 2).sum(axis=-1)
+                eps = -(w * ds * dd).sum(axis=-1) / sxx
+                eps = np.where(np.isfinite(eps), eps, 0.0)
+                dose = dose + eps * s_mean
+                # Incertidumbre de la ordenada de una regresión ponderada
+                sigma = np.sqrt(1.0 / w_sum + s_mean ** 2 / sxx)
+        elif method != "weighted":
+            raise ValueError(f"Método de combinación desconocido: {method}")
+
+        return dose, sigma
+
+    def dose_map(self, rgb, method="weighted", step=1, background=0.0, with_uncertainty=False):
+        """
+        Mapa de dosis neta (fondo restado, >= 0) de una imagen RGB en una sola
+        pasada. Los píxeles a cero (fuera de máscara) quedan a 0, como en los
+        mapas calculados bloque a bloque.
+
+        Con `with_uncertainty` devuelve además el mapa de incertidumbre típica
+        (ruido de píxel reducido por el tamaño de cada bloque + covarianza de
+        la calibración), evaluado con el mismo jacobiano que la dosis.
+        """
+        pixels, counts = block_mean(rgb, step, return_counts=True)
+        if with_uncertainty:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                pixel_std = self.pixel_std / np.sqrt(counts)
+            dose, sigma = self.combine(pixels, method, pixel_std, propagate=True)
+        else:
+            dose, _ = self.combine(pixels, method)
+        dose = dose - background
+        valid = np.isfinite(dose) & (dose > 0)
+        dose = np.where(valid, dose, 0.0)
+        if with_uncertainty:
+            return dose, np.where(valid & np.isfinite(sigma), sigma, 0.0)
+        return dose
@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Caché de imágenes decodificadas compartida por el canvas de CalibrationRC y
+# los trabajos que calculan estadísticas de los recortes. Las entradas se
+# identifican por ruta + fecha de modificación + tamaño (si el archivo cambia
+# se vuelve a leer) y se descartan las menos usadas al superar `max_bytes`.
+#
+# Si la imagen no está en caché, crop() lee solo las filas del recorte cuando
+# el archivo no está comprimido (TIFF/BMP sin compresión); en los demás casos
+# decodifica la imagen completa y la guarda para los recortes siguientes.
+
+# Modos "raw" de PIL que se pueden leer directamente (dtype, canales)
+_RAW_MODES = {
+    "L": ("u1", 1),
+    "RGB": ("u1", 3),
+    "RGBA": ("u1", 4),
+    "I;16": ("<u2", 1),
+    "I;16B": (">u2", 1),
+}
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _read_rows(path, box):
+    """
+    Lee el recorte box = (x, y, ancho, alto) de una imagen sin comprimir
+    leyendo solo las filas necesarias. Devuelve None si el formato no lo permite.
+    """
+    from PIL import Image
+
+    x, y, w, h = box
+    with Image.open(path) as img:
+        tiles = img.tile
+        mode = img.mode
+        width, height = img.size
+        if not tiles or any(t[0] != "raw" for t in tiles):
+            return None
+        # Recorte limitado a la imagen (como al indexar el array completo)
+        x, y = min(max(x, 0), width), min(max(y, 0), height)
+        w, h = min(w, width - x), min(h, height - y)
+        out = None
+        with open(path, "rb") as f:
+            for tile in tiles:
+                _, (x0, y0, x1, y1), offset, args = tile
+                rawmode = args[0] if isinstance(args, tuple) else args
+                stride = args[1] if isinstance(args, tuple) and len(args) > 1 else 0
+                orientation = args[2] if isinstance(args, tuple) and len(args) > 2 else 1
+                if rawmode != mode or rawmode not in _RAW_MODES or orientation != 1 \
+                        or (x0, x1) != (0, width):
+                    return None
+                dtype, channels = _RAW_MODES[rawmode]
+                itemsize = np.dtype(dtype).itemsize
+                row_bytes = stride or width * channels * itemsize
+                if out is None:
+                    out = np.empty((h, w, channels), dtype=dtype)
+                # Filas de esta franja que caen dentro del recorte
+                r0, r1 = max(y, y0), min(y + h, y1)
+                if r0 >= r1:
+                    continue
+                f.seek(offset + (r0 - y0) * row_bytes)
+                rows = np.frombuffer(f.read((r1 - r0) * row_bytes), dtype=np.uint8)
+                rows = rows.reshape(r1 - r0, row_bytes)[:, :width * channels * itemsize]
+                rows = rows.view(dtype).reshape(r1 - r0, width, channels)
+                out[r0 - y:r1 - y] = rows[:, x:x + w]
+        if out is None:
+            return None
+    out = out.astype(out.dtype.newbyteorder("="))
+    return out[..., 0] if out.shape[-1] == 1 else out
+
+
+class ImageCache:
+    """Caché LRU de imágenes decodificadas (arrays de numpy), segura entre hilos"""
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        try:
+            return _file_key(path) in self._images
+        except OSError:
+            return False
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _lookup(self, key):
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+            return img
+
+    def _store(self, key, img):
+        with self._lock:
+            if key in self._images or img.nbytes > self.max_bytes:
+                return
+            self._images[key] = img
+            self._bytes += img.nbytes
+            while self._bytes > self.max_bytes:
+                _, old = self._images.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def get(self, path):
+        """Imagen completa (de la caché o decodificada y guardada)"""
+        from PIL import Image
+
+        key = _file_key(path)
+        img = self._lookup(key)
+        if img is None:
+            img = np.array(Image.open(path))
+            # Solo lectura: la misma imagen la comparten el canvas y los trabajos
+            img.setflags(write=False)
+            self._store(key, img)
+        return img
+
+    def crop(self, path, crop_area):
+        """Recorte (x, y, ancho, alto) sin decodificar la imagen entera si se puede"""
+        x, y, w, h = crop_area
+        img = self._lookup(_file_key(path))
+        if img is None:
+            cut = _read_rows(path, crop_area)
+            if cut is not None:
+                return cut
+            img = self.get(path)
+        return img[y:y+h, x:x+w]
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+
+# Caché común del proceso
+IMAGE_CACHE = ImageCache()
@@ -0,0 +1,77 @@
+"""
+Mide el tiempo de arranque (importación) de DoseAnalyzer y CalibrationRC.
+
+Ejecuta cada módulo en un intérprete nuevo con `python -X importtime`, de
+modo que las cachés de módulos no falsean la medida, y muestra el tiempo
+total y los paquetes que más tardan en importarse.
+
+Uso:
+    python ImportTiming.py                 # ambos programas, 5 repeticiones
+    python ImportTiming.py DoseAnalyzer -n 10 --top 20
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+TOOLS = ["DoseAnalyzer", "CalibrationRC"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile(module):
+    """Devuelve {paquete: tiempo acumulado en µs} para un `import module` en frío"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        # Formato: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.rstrip()[1:]
+        # El módulo medido (sin sangría) y sus importaciones directas (2 espacios)
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            times[name.strip()] = times.get(name.strip(), 0) + int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de las herramientas")
+    parser.add_argument("modules", nargs="*", default=TOOLS)
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="repeticiones por módulo")
+    parser.add_argument("--top", type=int, default=10, help="paquetes más lentos a mostrar")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        runs = []
+        for _ in range(args.repeat):
+            try:
+                runs.append(import_profile(module))
+            except RuntimeError as e:
+                print(f"❌ {module}: {e}")
+                break
+        if not runs:
+            continue
+
+        # Mediana por paquete entre repeticiones
+        names = set().union(*runs)
+        median = {}
+        for name in names:
+            values = sorted(r.get(name, 0) for r in runs)
+            median[name] = values[len(values) // 2]
+
+        print(f"\n=== {module} ({len(runs)} repeticiones) ===")
+        print(f"Total: {median.get(module, 0) / 1000:.1f} ms")
+        slowest = sorted((n for n in names if n != module), key=median.get, reverse=True)
+        for name in slowest[:args.top]:
+            print(f"  {median[name] / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
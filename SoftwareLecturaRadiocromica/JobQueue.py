@@ -0,0 +1,107 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+# Trabajos en segundo plano sobre un QThreadPool persistente: los hilos se
+# reutilizan entre operaciones en lugar de crear un QThread por cada una.
+
+class JobSignals(QObject):
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    cancelled = pyqtSignal()
+
+
+class Job(QRunnable):
+    """
+    Ejecuta fn(*args, **kwargs) en el pool. Con `with_progress` la función
+    recibe además progress(hechos, total) y cancelled() para informar de su
+    avance y detenerse si se cancela.
+    """
+    def __init__(self, fn, args=(), kwargs=None, with_progress=False):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = dict(kwargs or {})
+        self.signals = JobSignals()
+        self._cancelled = False
+        if with_progress:
+            self.kwargs['progress'] = self.signals.progress.emit
+            self.kwargs['cancelled'] = self.is_cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        if self._cancelled:
+            self.signals.cancelled.emit()
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            print(f"Error en trabajo en segundo plano: {e}")
+            self.signals.error.emit(str(e))
+            return
+        if self._cancelled:
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
+
+
+class JobQueue(QObject):
+    """Cola de trabajos con progreso global, cancelación y cierre ordenado"""
+    # Trabajos terminados y total desde que la cola estuvo vacía por última vez
+    progress = pyqtSignal(int, int)
+    idle = pyqtSignal()
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.jobs = []
+        self.done = 0
+
+    def submit(self, fn, *args, on_finished=None, on_error=None, on_progress=None,
+               with_progress=False, **kwargs):
+        """Encola fn(*args, **kwargs) y devuelve el Job"""
+        job = Job(fn, args, kwargs, with_progress)
+        if on_finished is not None:
+            job.signals.finished.connect(on_finished)
+        if on_error is not None:
+            job.signals.error.connect(on_error)
+        if on_progress is not None:
+            job.signals.progress.connect(on_progress)
+        for signal in (job.signals.finished, job.signals.error, job.signals.cancelled):
+            signal.connect(lambda *_, job=job: self._job_done(job))
+
+        self.jobs.append(job)
+        self.progress.emit(self.done, self.done + len(self.jobs))
+        self.pool.start(job)
+        return job
+
+    def _job_done(self, job):
+        if job not in self.jobs:
+            return
+        self.jobs.remove(job)
+        self.done += 1
+        self.progress.emit(self.done, self.done + len(self.jobs))
+        if not self.jobs:
+            self.done = 0
+            self.idle.emit()
+
+    def is_busy(self):
+        return bool(self.jobs)
+
+    def cancel(self):
+        """Cancela los trabajos pendientes y pide a los que corren que paren"""
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self, timeout_ms=-1):
+        """Cancela todo y espera a que terminen los hilos (al cerrar la ventana)"""
+        self.cancel()
+        return self.pool.waitForDone(timeout_ms)
@@ -0,0 +1,297 @@
+import numpy as np
+
+
+# Suma de picos Lorentzianos para los espectros de absorción de las
+# películas (scripts de Lorentz/). Los parámetros van en el orden de
+# curve_fit: [amp1, cen1, wid1, amp2, cen2, wid2, ...].
+#
+# Dos formas de pico:
+#   "area":   L = (2a/π) · w / (4(x - c)² + w²)   a = área, w = anchura a media altura
+#             (calibracionLorentz2, lecturas_dosisLorentz)
+#   "height": L = a · w² / ((x - c)² + w²)        a = altura, w = semianchura
+#             (ImagenLorentz)
+#
+# Todos los picos se evalúan a la vez por broadcasting sobre una matriz
+# (puntos, picos) y el Jacobiano es analítico, así que curve_fit no tiene
+# que hacer diferencias finitas (3n evaluaciones extra del modelo por paso).
+
+def _peaks(p):
+    a, c, w = np.asarray(p, dtype=float).reshape(-1, 3).T
+    return a, c, w
+
+
+def multi_lorentzian(x, *p):
+    """Suma de Lorentzianas en forma de área"""
+    a, c, w = _peaks(p)
+    u = np.asarray(x, dtype=float)[..., None] - c
+    return ((2 / np.pi) * a * w / (4 * u * u + w * w)).sum(axis=-1)
+
+
+def multi_lorentzian_jac(x, *p):
+    """Jacobiano (len(x), 3n) de multi_lorentzian respecto a los parámetros"""
+    a, c, w = _peaks(p)
+    u = np.asarray(x, dtype=float)[:, None] - c
+    d = 4 * u * u + w * w
+    k = (2 / np.pi) / (d * d)
+    jac = np.empty(u.shape + (3,))
+    jac[..., 0] = (2 / np.pi) * w / d
+    jac[..., 1] = k * a * w * 8 * u
+    jac[..., 2] = k * a * (4 * u * u - w * w)
+    return jac.reshape(len(u), -1)
+
+
+def multi_lorentzian_height(x, *p):
+    """Suma de Lorentzianas en forma de altura"""
+    a, c, w = _peaks(p)
+    u = np.asarray(x, dtype=float)[..., None] - c
+    return (a * w * w / (u * u + w * w)).sum(axis=-1)
+
+
+def multi_lorentzian_height_jac(x, *p):
+    """Jacobiano (len(x), 3n) de multi_lorentzian_height"""
+    a, c, w = _peaks(p)
+    u = np.asarray(x, dtype=float)[:, None] - c
+    e = u * u + w * w
+    jac = np.empty(u.shape + (3,))
+    jac[..., 0] = w * w / e
+    jac[..., 1] = 2 * a * w * w * u / (e * e)
+    jac[..., 2] = 2 * a * w * u * u / (e * e)
+    return jac.reshape(len(u), -1)
+
+
+MODELS = {
+    "area": (multi_lorentzian, multi_lorentzian_jac),
+    "height": (multi_lorentzian_height, multi_lorentzian_height_jac),
+}
+
+
+def initial_guess(x, y, n_peaks):
+    """Centros equiespaciados en la ventana, amplitud max(y)/n y anchura ventana/(4n)"""
+    a0 = y.max() / n_peaks
+    c0 = np.linspace(x.min(), x.max(), n_peaks + 2)[1:-1]
+    w0 = (x.max() - x.min()) / (4 * n_peaks)
+    return np.ravel([[a0, c, w0] for c in c0])
+
+
+def lorentz_bounds(x, n_peaks, center_margin=None, max_width=None):
+    """
+    Límites: amplitudes >= 0, centros dentro de la ventana ampliada en
+    `center_margin` por cada lado (por defecto 1/6 de la ventana, como los
+    640-720 nm de ImagenLorentz para 650-710 nm: así un pico justo fuera del
+    borde sigue pudiendo ajustarse) y anchuras positivas hasta `max_width`
+    (por defecto 10 veces la ventana).
+    """
+    span = x.max() - x.min()
+    center_margin = span / 6 if center_margin is None else center_margin
+    max_width = 10 * span if max_width is None else max_width
+    lower = np.tile([0.0, x.min() - center_margin, 1e-6 * span], n_peaks)
+    upper = np.tile([np.inf, x.max() + center_margin, max_width], n_peaks)
+    return lower, upper
+
+
+def _fit(x, y, p0, bounds, form, max_nfev, sigma):
+    """curve_fit acotado con Jacobiano analítico; devuelve (popt, pcov, nfev)"""
+    from scipy.optimize import curve_fit
+
+    model, jac = MODELS[form]
+    lower, upper = lorentz_bounds(x, len(p0) // 3) if bounds is None else map(np.asarray, bounds)
+    lower = np.broadcast_to(np.asarray(lower, dtype=float), p0.shape)
+    upper = np.broadcast_to(np.asarray(upper, dtype=float), p0.shape)
+    # curve_fit exige un punto inicial estrictamente dentro de los límites
+    margin = 1e-9 * np.maximum(np.abs(p0), 1.0)
+    p0 = np.clip(p0, lower + margin, np.where(np.isfinite(upper), upper - margin, np.inf))
+
+    popt, pcov, info, _, _ = curve_fit(model, x, y, p0=p0, sigma=sigma, jac=jac, bounds=(lower, upper),
+                                       method="trf", max_nfev=max_nfev or 200 * (len(p0) + 1),
+                                       full_output=True)
+    return popt, pcov, info["nfev"]
+
+
+def fit_lorentzians(x, y, n_peaks=5, p0=None, bounds=None, form="area", max_nfev=None, sigma=None):
+    """
+    Ajusta n_peaks Lorentzianas con curve_fit (método 'trf', Jacobiano
+    analítico y parámetros acotados). Devuelve (popt, pcov).
+    p0: por defecto initial_guess; se recorta a los límites si se sale.
+    bounds: (inferiores, superiores); por defecto lorentz_bounds.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    p0 = initial_guess(x, y, n_peaks) if p0 is None else np.asarray(p0, dtype=float)
+    popt, pcov, _ = _fit(x, y, p0, bounds, form, max_nfev, sigma)
+    return popt, pcov
+
+
+def fit_series(curves, n_peaks=5, keys=None, bounds=None, form="area", max_nfev=None):
+    """
+    Ajusta una serie de espectros que cambian poco de uno a otro (p. ej. una
+    calibración en dosis). Se recorren ordenados por `keys` (la dosis) y cada
+    ajuste arranca en la solución del anterior, con las amplitudes escaladas
+    por el cociente de máximos; solo si ese ajuste falla (no converge o la
+    covarianza no es finita) se repite desde initial_guess.
+
+    curves: lista de (x, y). Devuelve una lista, en el orden de entrada, de
+    dicts con popt, pcov, nfev (evaluaciones totales) y warm (si sirvió el
+    arranque en caliente); None para los espectros que no se pudieron ajustar.
+    """
+    order = np.argsort(keys, kind="stable") if keys is not None else np.arange(len(curves))
+    results = [None] * len(curves)
+    previous = None  # (popt, max(y)) del último ajuste válido
+
+    for i in order:
+        x, y = (np.asarray(v, dtype=float) for v in curves[i])
+        nfev = 0
+        if previous is not None:
+            p0 = previous[0].copy()
+            if previous[1] != 0:
+                p0[0::3] *= y.max() / previous[1]
+            try:
+                popt, pcov, n = _fit(x, y, p0, bounds, form, max_nfev, None)
+                nfev += n
+                if np.all(np.isfinite(pcov)):
+                    results[i] = {"popt": popt, "pcov": pcov, "nfev": nfev, "warm": True}
+            except (RuntimeError, ValueError):
+                pass
+        if results[i] is None:
+            try:
+                popt, pcov, n = _fit(x, y, initial_guess(x, y, n_peaks), bounds, form, max_nfev, None)
+            except (RuntimeError, ValueError):
+                continue
+            results[i] = {"popt": popt, "pcov": pcov, "nfev": nfev + n, "warm": False}
+        previous = (results[i]["popt"], y.max())
+    return results
+
+
+# ----------------------------------------------------------------------
+# Ajuste conjunto de una serie (centros y anchuras compartidos)
+# ----------------------------------------------------------------------
+# Las bandas de absorción de la película están en las mismas posiciones y
+# con las mismas anchuras en todos los espectros; la dosis solo cambia las
+# amplitudes. El ajuste conjunto tiene 2n parámetros compartidos
+# [c1, w1, ..., cn, wn] más n amplitudes por espectro, y todos los puntos de
+# todos los espectros van en un único vector de residuos.
+#
+# Cada fila del Jacobiano depende solo de los 2n parámetros compartidos y de
+# las n amplitudes de su espectro: 3n elementos no nulos por fila, así que
+# se construye directamente en CSR y least_squares lo resuelve con LSMR sin
+# formar nunca la matriz densa (puntos × (2n + n·N)).
+
+def _global_terms(x, idx, p, n_curves, n_peaks):
+    """Modelo (M,), derivadas respecto a los compartidos (M, 2n) y a las amplitudes (M, n)"""
+    c, w = p[:2 * n_peaks].reshape(-1, 2).T
+    a = p[2 * n_peaks:].reshape(n_curves, n_peaks)[idx]
+    u = x[:, None] - c
+    d = 4 * u * u + w * w
+    d_amp = (2 / np.pi) * w / d
+    k = (2 / np.pi) / (d * d)
+    d_shared = np.empty((len(x), n_peaks, 2))
+    d_shared[..., 0] = k * a * w * 8 * u
+    d_shared[..., 1] = k * a * (4 * u * u - w * w)
+    return (a * d_amp).sum(axis=1), d_shared.reshape(len(x), -1), d_amp
+
+
+def fit_global(curves, n_peaks=2, p0=None, max_nfev=None):
+    """
+    Ajuste conjunto (forma de área) de todos los espectros de `curves`,
+    lista de (x, y), con centros y anchuras comunes y amplitudes propias.
+
+    p0: [a1, c1, w1, ...] de partida para centros y anchuras; por defecto,
+    el ajuste independiente del espectro de mayor señal. Las amplitudes
+    iniciales de cada espectro salen por mínimos cuadrados lineales con esas
+    formas fijas.
+
+    Devuelve una lista, en el orden de entrada, de dicts con popt y pcov en
+    el mismo formato que fit_lorentzians (así lorentz_sum vale igual) y nfev;
+    pcov incluye la incertidumbre de los parámetros compartidos, con la
+    varianza del ruido estimada con los residuos de todos los espectros.
+    """
+    from scipy import sparse
+    from scipy.optimize import least_squares
+
+    curves = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float)) for x, y in curves]
+    n_curves = len(curves)
+    x = np.concatenate([cx for cx, _ in curves])
+    y = np.concatenate([cy for _, cy in curves])
+    sizes = np.array([len(cx) for cx, _ in curves])
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    idx = np.repeat(np.arange(n_curves), sizes)
+    n_shared = 2 * n_peaks
+    n_params = n_shared + n_peaks * n_curves
+
+    # Centros y anchuras de partida; amplitudes por mínimos cuadrados lineales
+    if p0 is None:
+        bx, by = max(curves, key=lambda cv: cv[1].max())
+        p0, _ = fit_lorentzians(bx, by, n_peaks)
+    shared0 = np.asarray(p0, dtype=float).reshape(-1, 3)[:, 1:].ravel()
+    amps0 = np.empty((n_curves, n_peaks))
+    for i, (cx, cy) in enumerate(curves):
+        _, _, basis = _global_terms(cx, np.zeros(len(cx), int), np.concatenate((shared0, np.ones(n_peaks))), 1, n_peaks)
+        amps0[i] = np.linalg.lstsq(basis, cy, rcond=None)[0]
+
+    lower, upper = lorentz_bounds(x, n_peaks)
+    lower = np.concatenate((lower.reshape(-1, 3)[:, 1:].ravel(), np.zeros(n_peaks * n_curves)))
+    upper = np.concatenate((upper.reshape(-1, 3)[:, 1:].ravel(), np.full(n_peaks * n_curves, np.inf)))
+    margin = 1e-9 * np.maximum(np.abs(np.concatenate((shared0, amps0.ravel()))), 1.0)
+    start = np.clip(np.concatenate((shared0, amps0.ravel())), lower + margin,
+                    np.where(np.isfinite(upper), upper - margin, np.inf))
+
+    # Estructura CSR fija: por fila, los 2n compartidos y las n amplitudes de su espectro
+    indices = np.concatenate((np.broadcast_to(np.arange(n_shared), (len(x), n_shared)),
+                              n_shared + idx[:, None] * n_peaks + np.arange(n_peaks)), axis=1).ravel()
+    indptr = np.arange(len(x) + 1) * 3 * n_peaks
+
+    def residuals(p):
+        return _global_terms(x, idx, p, n_curves, n_peaks)[0] - y
+
+    def jacobian(p):
+        _, d_shared, d_amp = _global_terms(x, idx, p, n_curves, n_peaks)
+        data = np.concatenate((d_shared, d_amp), axis=1).ravel()
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(x), n_params))
+
+    res = least_squares(residuals, start, jac=jacobian, bounds=(lower, upper), method="trf",
+                        x_scale="jac", max_nfev=max_nfev or 200 * (n_shared + n_peaks + 1))
+    if not res.success:
+        raise RuntimeError("Ajuste conjunto sin convergencia: " + res.message)
+
+    # Covarianza por bloques: JᵀJ = [[S, B], [Bᵀ, D]] con D diagonal por
+    # bloques (n × n por espectro). Con el complemento de Schur solo se
+    # invierten matrices 2n × 2n y n × n, no la de (2n + n·N)².
+    _, g, h = _global_terms(x, idx, res.x, n_curves, n_peaks)
+    D = np.add.reduceat(h[:, :, None] * h[:, None, :], starts, axis=0)
+    B = np.add.reduceat(g[:, :, None] * h[:, None, :], starts, axis=0)
+    D_inv = np.linalg.pinv(D)
+    BD = B @ D_inv
+    cov_shared = np.linalg.pinv(g.T @ g - np.einsum("kij,klj->il", BD, B))
+    cov_cross = -cov_shared @ BD
+    cov_amps = D_inv + np.transpose(BD, (0, 2, 1)) @ cov_shared @ BD
+    dof = len(x) - n_params
+    s2 = 2 * res.cost / dof if dof > 0 else np.inf
+
+    c, w = res.x[:n_shared].reshape(-1, 2).T
+    amps = res.x[n_shared:].reshape(n_curves, n_peaks)
+    results = []
+    for i in range(n_curves):
+        popt = np.ravel(np.column_stack((amps[i], c, w)))
+        cov = np.empty((n_peaks, 3, n_peaks, 3))
+        cov[:, 0, :, 0] = cov_amps[i]
+        cov[:, 1:, :, 1:] = cov_shared.reshape(n_peaks, 2, n_peaks, 2)
+        cov[:, 0, :, 1:] = cov_cross[i].T.reshape(n_peaks, n_peaks, 2)
+        cov[:, 1:, :, 0] = cov_cross[i].reshape(n_peaks, 2, n_peaks)
+        results.append({"popt": popt, "pcov": s2 * cov.reshape(3 * n_peaks, 3 * n_peaks), "nfev": res.nfev})
+    return results
+
+
+def lorentz_sum(x, popt, pcov=None, form="area"):
+    """
+    S = Σ_i modelo(x_i; popt) y su incertidumbre σ_S = sqrt(gradᵀ·pcov·grad).
+    El gradiente de S es la suma por filas del Jacobiano analítico, así que
+    todo sale de una sola evaluación vectorizada (sin diferencias finitas).
+    Devuelve (S, σ_S, grad); σ_S es NaN sin covarianza o si la varianza no es positiva.
+    """
+    model, jac = MODELS[form]
+    S = float(model(x, *popt).sum())
+    grad = jac(np.asarray(x, dtype=float), *popt).sum(axis=0)
+    sigma_S = np.nan
+    if pcov is not None:
+        var_S = grad @ np.asarray(pcov, dtype=float) @ grad
+        sigma_S = float(np.sqrt(var_S)) if var_S > 0 else np.nan
+    return S, sigma_S, grad
@@ -0,0 +1,276 @@
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+
+# Esquema de la base de datos de resultados.
+# Una fila en `images` por cada análisis guardado; las radiocromicas (films),
+# círculos, pocillos y mediciones puntuales cuelgan de ella.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calibrations (
+    id          INTEGER PRIMARY KEY,
+    digest      TEXT UNIQUE NOT NULL,
+    source      TEXT,
+    params      TEXT NOT NULL,
+    created_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id              INTEGER PRIMARY KEY,
+    path            TEXT NOT NULL,
+    name            TEXT NOT NULL,
+    analyzed_at     TEXT NOT NULL,
+    calibration_id  INTEGER REFERENCES calibrations(id)
+);
+CREATE TABLE IF NOT EXISTS films (
+    id          INTEGER PRIMARY KEY,
+    image_id    INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    name        TEXT NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    background  REAL
+);
+CREATE TABLE IF NOT EXISTS circles (
+    id          INTEGER PRIMARY KEY,
+    film_id     INTEGER NOT NULL REFERENCES films(id) ON DELETE CASCADE,
+    label       TEXT NOT NULL,
+    x REAL, y REAL, r REAL,
+    manual      INTEGER NOT NULL DEFAULT 0,
+    mean_dose   REAL,
+    net_dose    REAL,
+    std         REAL,
+    min_dose    REAL,
+    max_dose    REAL,
+    homo_std    REAL,
+    homo_range  REAL
+);
+CREATE TABLE IF NOT EXISTS wells (
+    id          INTEGER PRIMARY KEY,
+    image_id    INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    circle      TEXT NOT NULL,
+    film        TEXT,
+    well        INTEGER NOT NULL,
+    x REAL, y REAL, r REAL,
+    mean_dose   REAL,
+    std_dose    REAL,
+    background  REAL
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    id          INTEGER PRIMARY KEY,
+    image_id    INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    name        TEXT NOT NULL,
+    x REAL, y REAL,
+    mean_dose   REAL,
+    net_dose    REAL,
+    std         REAL,
+    background  REAL,
+    created_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_date ON images(analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_images_name ON images(name);
+CREATE INDEX IF NOT EXISTS idx_films_image ON films(image_id);
+CREATE INDEX IF NOT EXISTS idx_films_name ON films(name);
+CREATE INDEX IF NOT EXISTS idx_circles_film ON circles(film_id);
+CREATE INDEX IF NOT EXISTS idx_circles_dose ON circles(mean_dose);
+CREATE INDEX IF NOT EXISTS idx_wells_image ON wells(image_id);
+CREATE INDEX IF NOT EXISTS idx_measurements_image ON measurements(image_id);
+CREATE INDEX IF NOT EXISTS idx_measurements_date ON measurements(created_at);
+"""
+
+
+class ResultStore:
+    """Almacén local (SQLite) de los resultados de DoseAnalyzer"""
+    def __init__(self, path="Resultados.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Inserción
+    # ------------------------------------------------------------------
+    def _calibration_id(self, calibration, source=None):
+        """Registra la calibración (una sola vez por contenido) y devuelve su id"""
+        if calibration is None:
+            return None
+        params = json.dumps(np.asarray(calibration, dtype=float).tolist())
+        digest = hashlib.sha1(params.encode("utf-8")).hexdigest()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO calibrations (digest, source, params, created_at) VALUES (?, ?, ?, ?)",
+            (digest, source, params, datetime.now().isoformat(timespec="seconds"))
+        )
+        row = self.conn.execute("SELECT id FROM calibrations WHERE digest = ?", (digest,)).fetchone()
+        return row["id"]
+
+    def _insert_image(self, image_path, calibration_id=None, analyzed_at=None):
+        analyzed_at = analyzed_at or datetime.now()
+        cur = self.conn.execute(
+            "INSERT INTO images (path, name, analyzed_at, calibration_id) VALUES (?, ?, ?, ?)",
+            (image_path, os.path.basename(image_path),
+             analyzed_at.isoformat(timespec="seconds"), calibration_id)
+        )
+        return cur.lastrowid
+
+    def _image_id(self, image_path, calibration=None, calibration_source=None):
+        """
+        Último análisis registrado para la imagen con la misma calibración, o
+        uno nuevo si no existe (p. ej. tras cambiar de calibración)
+        """
+        calibration_id = self._calibration_id(calibration, calibration_source)
+        row = self.conn.execute(
+            "SELECT id FROM images WHERE path = ? AND calibration_id IS ? ORDER BY id DESC LIMIT 1",
+            (image_path, calibration_id)
+        ).fetchone()
+        if row is not None:
+            return row["id"]
+        return self._insert_image(image_path, calibration_id)
+
+    def save_image_results(self, image_path, films, calibration=None, calibration_source=None):
+        """
+        Guarda todas las radiocromicas y círculos de una imagen en una única transacción.
+
+        `films` es una lista de dicts con las claves "name", "coords", "background"
+        y "circles"; cada círculo lleva "label" además de los campos devueltos
+        por procesar_circulo ("x", "y", "r", "mean_dose", "std", ...).
+        Devuelve el id de la imagen.
+        """
+        with self.conn:
+            image_id = self._insert_image(image_path, self._calibration_id(calibration, calibration_source))
+            for film in films:
+                x1, y1, x2, y2 = (int(v) for v in film["coords"])
+                background = float(film.get("background", 0.0))
+                film_id = self.conn.execute(
+                    "INSERT INTO films (image_id, name, x1, y1, x2, y2, background) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (image_id, film["name"], x1, y1, x2, y2, background)
+                ).lastrowid
+                self.conn.executemany(
+                    "INSERT INTO circles (film_id, label, x, y, r, manual, mean_dose, net_dose, std, "
+                    "min_dose, max_dose, homo_std, homo_range) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (film_id, c["label"], float(c["x"]), float(c["y"]), float(c["r"]),
+                         int(bool(c.get("manual", False))),
+                         max(0.0, float(c["mean_dose"])),
+                         max(0.0, float(c["mean_dose"]) - background),
+                         float(c.get("std", 0.0)), float(c.get("min", 0.0)), float(c.get("max", 0.0)),
+                         float(c.get("homo_std", 0.0)), float(c.get("homo_range", 0.0)))
+                        for c in film["circles"]
+                    ]
+                )
+        return image_id
+
+    def save_wells(self, image_path, circle_data, wells, calibration=None):
+        """Guarda los pocillos de un círculo (análisis 2-4-4-2) en una transacción"""
+        circle_data = circle_data or {}
+        with self.conn:
+            image_id = self._image_id(image_path, calibration)
+            self.conn.executemany(
+                "INSERT INTO wells (image_id, circle, film, well, x, y, r, mean_dose, std_dose, background) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (image_id, circle_data.get("id", "Desconocido"), circle_data.get("area_name"),
+                     int(w["id"]), float(w["x"]), float(w["y"]), float(w["r"]),
+                     float(w["mean_dose"]), float(w["std_dose"]),
+                     float(circle_data.get("background", 0.0)))
+                    for w in wells
+                ]
+            )
+        return image_id
+
+    def save_measurement(self, image_path, name, x, y, mean_dose, net_dose, std, background, calibration=None):
+        """Guarda una medición puntual (botón 'Guardar medición')"""
+        with self.conn:
+            image_id = self._image_id(image_path, calibration)
+            cur = self.conn.execute(
+                "INSERT INTO measurements (image_id, name, x, y, mean_dose, net_dose, std, background, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_id, name, float(x), float(y), float(mean_dose), float(net_dose),
+                 float(std), float(background), datetime.now().isoformat(timespec="seconds"))
+            )
+        return cur.lastrowid
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _date_filters(column, date_from, date_to, clauses, args):
+        """
+        Las fechas se guardan como 'AAAA-MM-DDTHH:MM:SS'. Un `date_to` sin hora
+        (date o 'AAAA-MM-DD') incluye todo ese día: se compara con < día siguiente.
+        """
+        if date_from is not None:
+            clauses.append(f"{column} >= ?")
+            args.append(date_from.isoformat() if hasattr(date_from, "isoformat") else str(date_from))
+        if date_to is not None:
+            if isinstance(date_to, str) and len(date_to) == 10:
+                date_to = date.fromisoformat(date_to)
+            if isinstance(date_to, date) and not isinstance(date_to, datetime):
+                clauses.append(f"{column} < ?")
+                args.append((date_to + timedelta(days=1)).isoformat())
+            else:
+                clauses.append(f"{column} <= ?")
+                args.append(date_to.isoformat() if hasattr(date_to, "isoformat") else str(date_to))
+
+    def query_circles(self, film=None, image=None, date_from=None, date_to=None, dose_min=None, dose_max=None):
+        """Círculos filtrados por radiocromica, imagen, fecha de análisis y/o rango de dosis"""
+        clauses, args = [], []
+        if film is not None:
+            clauses.append("f.name = ?")
+            args.append(film)
+        if image is not None:
+            clauses.append("i.name = ?")
+            args.append(os.path.basename(image))
+        self._date_filters("i.analyzed_at", date_from, date_to, clauses, args)
+        if dose_min is not None:
+            clauses.append("c.mean_dose >= ?")
+            args.append(dose_min)
+        if dose_max is not None:
+            clauses.append("c.mean_dose <= ?")
+            args.append(dose_max)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return self.conn.execute(
+            "SELECT i.name AS image, i.analyzed_at, f.name AS film, f.background, c.* "
+            "FROM circles c JOIN films f ON c.film_id = f.id JOIN images i ON f.image_id = i.id "
+            f"{where} ORDER BY i.analyzed_at, f.name, c.label",
+            args
+        ).fetchall()
+
+    def query_measurements(self, name=None, image=None, date_from=None, date_to=None):
+        """Mediciones puntuales filtradas por nombre, imagen y/o fecha"""
+        clauses, args = [], []
+        if name is not None:
+            clauses.append("m.name = ?")
+            args.append(name)
+        if image is not None:
+            clauses.append("i.name = ?")
+            args.append(os.path.basename(image))
+        self._date_filters("m.created_at", date_from, date_to, clauses, args)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return self.conn.execute(
+            "SELECT i.name AS image, m.* FROM measurements m JOIN images i ON m.image_id = i.id "
+            f"{where} ORDER BY m.created_at",
+            args
+        ).fetchall()
+
+    def query_wells(self, circle=None, image=None):
+        """Pocillos guardados, opcionalmente de un círculo o imagen concretos"""
+        clauses, args = [], []
+        if circle is not None:
+            clauses.append("w.circle = ?")
+            args.append(circle)
+        if image is not None:
+            clauses.append("i.name = ?")
+            args.append(os.path.basename(image))
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return self.conn.execute(
+            "SELECT i.name AS image, w.* FROM wells w JOIN images i ON w.image_id = i.id "
+            f"{where} ORDER BY w.id",
+            args
+        ).fetchall()
@@ -0,0 +1,379 @@
+import io
+import os
+import re
+import json
+import fnmatch
+import hashlib
+import tarfile
+import zipfile
+from collections import deque, namedtuple
+from itertools import chain, islice
+
+import numpy as np
+
+
+# Lectura de espectros en texto, común a todos los scripts de espectroscopía
+# (LongitudOnda, Integral, Lorentz y los de la raíz). Reconoce:
+#   - SpectraSuite (Ocean Optics): cabecera "Clave: valor" y datos entre
+#     ">>>>>Begin Processed Spectral Data<<<<<" y ">>>>>End ...<<<<<".
+#   - JASCO: cabecera "CLAVE<tab>valor" y datos tras la línea "XYDATA".
+#   - Texto sin cabecera conocida: datos desde la primera línea numérica.
+# El bloque de datos se convierte de una vez (split + np.array en C), en
+# lugar de línea a línea, y se aceptan decimales con coma.
+#
+# read_folder guarda los espectros ya leídos en una caché binaria por carpeta
+# (SPECTRA_CACHE: float32 concatenados + índice JSON en un .npz). Cada archivo
+# se identifica por nombre, tamaño y fecha de modificación; solo se vuelven a
+# leer los archivos nuevos o modificados y la caché se reescribe sola.
+#
+# read_archive lee los espectros directamente de un .zip o .tar(.gz) sin
+# extraerlo (también los .zip anidados, como Datos19mayo.zip dentro de la
+# copia de seguridad del espectrofotómetro) en flujo: cada miembro se analiza
+# según se lee, o se envía por bloques a un pool de procesos. read_folder
+# acepta también la ruta de un archivo (por defecto sin procesos, ver
+# read_folder).
+
+Spectrum = namedtuple("Spectrum", ["wavelength", "values", "metadata"])
+
+SPECTRA_CACHE = ".spectra_cache.npz"
+SPECTRA_CACHE_VERSION = 1
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# Por debajo de este número de espectros no compensa arrancar procesos
+PARALLEL_MIN_FILES = 200
+# Miembros por bloque enviado a cada proceso
+ARCHIVE_BATCH = 64
+
+_BEGIN = ">>>>>Begin"
+_END = ">>>>>End"
+_DECIMAL_COMMA = re.compile(r"\d,\d")
+_NUMERIC_LINE = re.compile(r"^\s*[-+]?(\d+[.,]?\d*|[.,]\d+)([eE][-+]?\d+)?[\s;,]+[-+]?[\d.,]")
+
+
+def natural_key(text):
+    """Orden tipo humano: archivo2.txt < archivo10.txt"""
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', text)]
+
+
+def _parse_header(lines, separator):
+    meta = {}
+    for line in lines:
+        key, sep, value = line.partition(separator)
+        if sep and key.strip():
+            meta[key.strip()] = value.strip()
+    return meta
+
+
+def _parse_block(block):
+    """Convierte un bloque de columnas numéricas en un array (filas, columnas)"""
+    block = block.strip()
+    if not block:
+        return np.empty((0, 2))
+    first = block.split("\n", 1)[0].strip()
+    if "," in first:
+        if _DECIMAL_COMMA.search(first) and ("\t" in first or " " in first or ";" in first):
+            # Coma decimal entre cifras (el separador de columnas es tabulador, espacio o ;)
+            block = block.replace(",", ".")
+        else:
+            # CSV: la coma separa columnas
+            block = block.replace(",", " ")
+    block = block.replace(";", " ")
+    n_cols = len(block.split("\n", 1)[0].split())
+    tokens = block.split()
+    try:
+        return np.array(tokens, dtype=float).reshape(-1, n_cols)
+    except ValueError:
+        # Líneas no numéricas al final (comentarios, pies de página): cortar en la primera
+        rows = []
+        for line in block.splitlines():
+            parts = line.split()
+            try:
+                rows.append([float(p) for p in parts[:n_cols]])
+            except ValueError:
+                break
+            if len(rows[-1]) < n_cols:
+                rows.pop()
+                break
+        return np.array(rows, dtype=float).reshape(-1, n_cols)
+
+
+def parse_spectrum(text, source=""):
+    """Analiza el contenido de un archivo de espectro y devuelve un Spectrum"""
+    if isinstance(text, bytes):
+        text = text.decode("latin-1")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    begin = text.find(_BEGIN)
+    if begin >= 0:
+        header = text[:begin]
+        start = text.find("\n", begin) + 1
+        end = text.find(_END, start)
+        block = text[start:end if end >= 0 else len(text)]
+        meta = _parse_header(header.splitlines(), ":")
+        meta["format"] = "spectrasuite"
+    else:
+        m = re.search(r"^XYDATA\s*$", text, re.MULTILINE)
+        if m:
+            header = text[:m.start()]
+            block = text[m.end():]
+            # Algunos archivos JASCO añaden información extendida tras los datos
+            extended = block.find("#")
+            if extended >= 0:
+                block = block[:extended]
+            meta = _parse_header(header.splitlines(), "\t")
+            meta["format"] = "jasco"
+        else:
+            lines = text.split("\n")
+            first = next((i for i, line in enumerate(lines) if _NUMERIC_LINE.match(line)), len(lines))
+            meta = {"format": "text", "header": "\n".join(lines[:first]).strip()}
+            block = "\n".join(lines[first:])
+
+    data = _parse_block(block)
+    meta["source"] = source
+    meta["n_points"] = len(data)
+    if data.shape[1] < 2:
+        raise ValueError(f"{source or 'espectro'}: no se encontraron dos columnas de datos")
+    if len(data) < 2:
+        raise ValueError(f"{source or 'espectro'}: no se encontraron datos numéricos")
+    return Spectrum(data[:, 0], data[:, 1], meta)
+
+
+def _crop(spectrum, x_min, x_max):
+    if x_min is None and x_max is None:
+        return spectrum
+    wl = spectrum.wavelength
+    mask = np.ones(wl.shape, bool)
+    if x_min is not None:
+        mask &= wl >= x_min
+    if x_max is not None:
+        mask &= wl <= x_max
+    return Spectrum(wl[mask], spectrum.values[mask], spectrum.metadata)
+
+
+def read_spectrum(path, x_min=None, x_max=None):
+    """
+    Lee un espectro (SpectraSuite, JASCO o texto en dos columnas).
+    Devuelve Spectrum(wavelength, values, metadata), opcionalmente
+    limitado a [x_min, x_max]; se puede desempaquetar como wl, y, meta.
+    """
+    with open(path, "rb") as f:
+        spectrum = parse_spectrum(f.read(), os.path.basename(path))
+    return _crop(spectrum, x_min, x_max)
+
+
+def list_spectra(folder, pattern="*.txt"):
+    """Archivos de la carpeta que cumplen el patrón, en orden natural"""
+    names = [f for f in os.listdir(folder)
+             if fnmatch.fnmatch(f.lower(), pattern.lower()) and f != SPECTRA_CACHE
+             and os.path.isfile(os.path.join(folder, f))]
+    return sorted(names, key=natural_key)
+
+
+def _cache_path(folder):
+    """Caché dentro de la carpeta; si no se puede escribir, en ~/.cache/radiocromicas"""
+    folder = os.path.abspath(folder)
+    if os.access(folder, os.W_OK):
+        return os.path.join(folder, SPECTRA_CACHE)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(base, "radiocromicas", f"{digest}.npz")
+
+
+def _load_cache(path):
+    """{nombre: ((tamaño, mtime_ns), Spectrum float32)}; vacío si no hay caché válida"""
+    try:
+        with np.load(path) as data:
+            index = json.loads(bytes(data["index"]).decode("utf-8"))
+            if index.get("version") != SPECTRA_CACHE_VERSION:
+                return {}
+            wl, values = data["wavelength"], data["values"]
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # Caché vacía, truncada o ajena (p. ej. un marcador de sincronización): se reconstruye
+        return {}
+    entries = {}
+    for e in index["files"]:
+        lo, hi = e["offset"], e["offset"] + e["n"]
+        entries[e["name"]] = ((e["size"], e["mtime_ns"]), Spectrum(wl[lo:hi], values[lo:hi], e["metadata"]))
+    return entries
+
+
+def _save_cache(path, entries):
+    """Escribe la caché de forma atómica (archivo temporal + os.replace)"""
+    files, offset = [], 0
+    for name, ((size, mtime_ns), spectrum) in entries.items():
+        n = len(spectrum.wavelength)
+        files.append({"name": name, "size": size, "mtime_ns": mtime_ns,
+                      "offset": offset, "n": n, "metadata": spectrum.metadata})
+        offset += n
+    index = json.dumps({"version": SPECTRA_CACHE_VERSION, "files": files}, ensure_ascii=False)
+    spectra = [spectrum for _, spectrum in entries.values()]
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             index=np.frombuffer(index.encode("utf-8"), dtype=np.uint8),
+             wavelength=np.concatenate([s.wavelength for s in spectra] or [np.empty(0, np.float32)]),
+             values=np.concatenate([s.values for s in spectra] or [np.empty(0, np.float32)]))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp, path)
+
+
+def read_folder(folder, pattern="*.txt", x_min=None, x_max=None, cache=True, parallel=False):
+    """
+    Lee todos los espectros de una carpeta. Devuelve {nombre: Spectrum} en
+    orden natural; los archivos que no se pueden leer se avisan y se omiten.
+    Con `cache` se reutilizan los espectros de la caché de la carpeta (los
+    valores se guardan en float32, con o sin caché, para que den lo mismo).
+    Si `folder` es un .zip o .tar(.gz) se lee con read_archive (sin caché),
+    en un solo proceso salvo que se pida `parallel`: los scripts que llaman
+    aquí no tienen guarda `if __name__ == "__main__"` y en Windows cada
+    proceso hijo volvería a ejecutar el script.
+    """
+    if is_archive(folder):
+        return read_archive(folder, pattern, x_min, x_max, parallel=parallel)
+
+    path = _cache_path(folder) if cache else None
+    entries = _load_cache(path) if cache else {}
+    changed = False
+
+    spectra = {}
+    for name in list_spectra(folder, pattern):
+        file_path = os.path.join(folder, name)
+        try:
+            st = os.stat(file_path)
+            key = (st.st_size, st.st_mtime_ns)
+            hit = entries.get(name)
+            if hit is None or hit[0] != key:
+                s = read_spectrum(file_path)
+                hit = (key, Spectrum(s.wavelength.astype(np.float32), s.values.astype(np.float32), s.metadata))
+                entries[name] = hit
+                changed = True
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Error al leer {name}: {e}")
+            continue
+        s = hit[1]
+        spectra[name] = _crop(Spectrum(s.wavelength.astype(float), s.values.astype(float), s.metadata),
+                              x_min, x_max)
+
+    if cache:
+        # Olvidar archivos borrados (los de otros patrones se conservan)
+        for name in [n for n in entries if not os.path.isfile(os.path.join(folder, n))]:
+            del entries[name]
+            changed = True
+        if changed:
+            try:
+                _save_cache(path, entries)
+            except OSError as e:
+                print(f"⚠️ No se pudo guardar la caché de espectros: {e}")
+    return spectra
+
+
+# ----------------------------------------------------------------------
+# Archivos comprimidos
+# ----------------------------------------------------------------------
+def is_archive(path):
+    return os.path.isfile(path) and str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _iter_zip(fileobj, prefix, pattern):
+    with zipfile.ZipFile(fileobj) as z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            name = prefix + info.filename
+            if info.filename.lower().endswith(".zip"):
+                # Zip anidado: se abre en memoria
+                yield from _iter_zip(io.BytesIO(z.read(info)), name + "/", pattern)
+            elif fnmatch.fnmatch(name.lower(), pattern):
+                yield name, z.read(info)
+
+
+def _iter_tar(path, pattern):
+    with tarfile.open(path, "r:*") as tar:
+        # Lectura en flujo: los miembros se recorren en orden, sin saltos hacia atrás
+        for info in tar:
+            if not info.isfile():
+                continue
+            if info.name.lower().endswith(".zip"):
+                yield from _iter_zip(io.BytesIO(tar.extractfile(info).read()), info.name + "/", pattern)
+            elif fnmatch.fnmatch(info.name.lower(), pattern):
+                yield info.name, tar.extractfile(info).read()
+
+
+def iter_archive(path, pattern="*.txt"):
+    """
+    Recorre los miembros de un .zip o .tar(.gz) que cumplen el patrón (glob
+    sobre la ruta dentro del archivo, p. ej. "*/RC2*/*.txt") y devuelve
+    (ruta, bytes). Los .zip anidados se recorren como carpetas.
+    """
+    pattern = pattern.lower()
+    if zipfile.is_zipfile(path):
+        yield from _iter_zip(path, "", pattern)
+    else:
+        yield from _iter_tar(path, pattern)
+
+
+def _parse_member(name, raw):
+    """Analiza un miembro (ruta, bytes); los errores se devuelven como texto"""
+    try:
+        return name, parse_spectrum(raw, name)
+    except ValueError as e:
+        return name, str(e)
+
+
+def _parse_members(members):
+    """Analiza una lista de (ruta, bytes) en un proceso del pool"""
+    return [_parse_member(name, raw) for name, raw in members]
+
+
+def _parse_parallel(members, max_workers=None):
+    """
+    Reparte los miembros en bloques de ARCHIVE_BATCH según se leen del
+    archivo; como mucho dos bloques por proceso esperan en el pool, así que
+    la memoria no depende del tamaño del archivo.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = max_workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(members, ARCHIVE_BATCH))
+            if not batch:
+                break
+            pending.append(pool.submit(_parse_members, batch))
+            while len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def read_archive(path, pattern="*.txt", x_min=None, x_max=None, parallel=None, max_workers=None):
+    """
+    Lee los espectros de un .zip o .tar(.gz) sin extraerlo. Devuelve
+    {ruta dentro del archivo: Spectrum} en orden natural. Cada miembro se
+    analiza según se lee; con `parallel` (por defecto, si el archivo tiene al
+    menos PARALLEL_MIN_FILES espectros) se envían por bloques a un pool de
+    procesos.
+    """
+    members = iter_archive(path, pattern)
+    if parallel is None:
+        # Se decide con los primeros PARALLEL_MIN_FILES miembros; el resto sigue en flujo
+        head = list(islice(members, PARALLEL_MIN_FILES))
+        parallel = len(head) >= PARALLEL_MIN_FILES
+        members = chain(head, members)
+
+    if parallel:
+        parsed = _parse_parallel(members, max_workers)
+    else:
+        parsed = (_parse_member(name, raw) for name, raw in members)
+
+    results = []
+    archive = os.path.basename(path)
+    for name, spectrum in parsed:
+        if isinstance(spectrum, str):
+            print(f"⚠️ Error al leer {name}: {spectrum}")
+            continue
+        spectrum.metadata["archive"] = archive
+        results.append((name, _crop(spectrum, x_min, x_max)))
+    return dict(sorted(results, key=lambda item: natural_key(item[0])))
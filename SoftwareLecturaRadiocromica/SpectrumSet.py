@@ -0,0 +1,199 @@
+import re
+
+import numpy as np
+
+from SpectrumIO import Spectrum, read_folder
+
+
+# Conjunto de espectros sobre una rejilla común de longitudes de onda: un
+# vector `wavelength` (m,) compartido y una matriz `values` (n, m) float32
+# contigua, una fila por espectro, con sus metadatos (dosis, película,
+# fecha...). Las operaciones (OD a una longitud de onda, recortes,
+# suavizado) se hacen sobre la matriz entera en lugar de archivo a archivo.
+#
+# Todos los espectros salen del mismo espectrómetro, así que normalmente las
+# rejillas coinciden y no se interpola; si no, se remuestrean por
+# interpolación lineal a la rejilla del espectro con más puntos dentro del
+# rango común.
+
+def dose_from_name(name):
+    """Dosis del nombre del archivo: entre #...# o, si no, la primera cifra"""
+    base = name.replace("\\", "/").rsplit("/", 1)[-1]
+    m = re.search(r'#\s*(\d+(?:[.,]\d+)?)\s*#', base)
+    if m is None:
+        m = re.search(r'(\d+(?:[.,]\d+)?)', base)
+    return float(m.group(1).replace(",", ".")) if m else None
+
+
+def film_from_name(name):
+    """Identificador de la película (RC2, RC15...) si aparece en el nombre"""
+    m = re.search(r'(RC\d+)', name, re.IGNORECASE)
+    return m.group(1).upper() if m else None
+
+
+def _spectrum_info(name, metadata, dose_parser):
+    info = {
+        "name": name,
+        "dose": dose_parser(name) if dose_parser is not None else None,
+        "film": film_from_name(name),
+        "date": metadata.get("Date") or metadata.get("DATE"),
+        "header": metadata,
+    }
+    return info
+
+
+class SpectrumSet:
+    """
+    n espectros sobre una rejilla común.
+
+    wavelength: (m,) creciente; values: (n, m) float32; info: lista de dicts
+    con al menos name, dose, film y date (y la cabecera del archivo en header).
+    """
+    def __init__(self, wavelength, values, info=None):
+        self.wavelength = np.asarray(wavelength, dtype=float)
+        self.values = np.ascontiguousarray(values, dtype=np.float32).reshape(-1, len(self.wavelength))
+        self.info = list(info or [{"name": str(i), "dose": None} for i in range(len(self.values))])
+
+    @classmethod
+    def from_spectra(cls, spectra, grid=None, dose_parser=dose_from_name):
+        """
+        A partir de {nombre: Spectrum} (read_folder / read_archive). Con
+        `grid` se remuestrea a esa rejilla; si no, se usa la común. Los
+        espectros con menos de dos puntos se omiten con un aviso; ValueError
+        si no queda ninguno.
+        """
+        names = []
+        curves = []
+        for name, (wl, y, _) in spectra.items():
+            if len(wl) < 2:
+                print(f"⚠️ '{name}' tiene {len(wl)} puntos, se omite.")
+                continue
+            order = np.argsort(wl, kind="stable")  # JASCO guarda de mayor a menor
+            names.append(name)
+            curves.append((np.asarray(wl)[order], np.asarray(y)[order]))
+        if not curves:
+            raise ValueError("Ningún espectro con datos suficientes (al menos dos puntos)")
+
+        if grid is None:
+            first = curves[0][0]
+            if all(len(wl) == len(first) and np.allclose(wl, first, rtol=0, atol=1e-6) for wl, _ in curves):
+                grid = first
+            else:
+                lo = max(wl[0] for wl, _ in curves)
+                hi = min(wl[-1] for wl, _ in curves)
+                grid = max((wl[(wl >= lo) & (wl <= hi)] for wl, _ in curves), key=len)
+        grid = np.asarray(grid, dtype=float)
+
+        values = np.empty((len(curves), len(grid)), dtype=np.float32)
+        for i, (wl, y) in enumerate(curves):
+            if len(wl) == len(grid) and np.array_equal(wl, grid):
+                values[i] = y
+            else:
+                values[i] = np.interp(grid, wl, y, left=np.nan, right=np.nan)
+        info = [_spectrum_info(name, spectra[name].metadata, dose_parser) for name in names]
+        return cls(grid, values, info)
+
+    @classmethod
+    def from_folder(cls, folder, pattern="*.txt", grid=None, dose_parser=dose_from_name, **kwargs):
+        """Lee una carpeta (o un .zip/.tar) con read_folder y construye el conjunto"""
+        return cls.from_spectra(read_folder(folder, pattern, **kwargs), grid, dose_parser)
+
+    # ------------------------------------------------------------------
+    # Acceso
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        """Un espectro (por índice o nombre) como Spectrum"""
+        i = self.index(key) if isinstance(key, str) else key
+        return Spectrum(self.wavelength, self.values[i], self.info[i])
+
+    def index(self, name):
+        return self.names.index(name)
+
+    @property
+    def names(self):
+        return [d["name"] for d in self.info]
+
+    @property
+    def doses(self):
+        """Dosis de cada espectro (NaN si no se conoce)"""
+        return np.array([np.nan if d.get("dose") is None else d["dose"] for d in self.info], dtype=float)
+
+    @doses.setter
+    def doses(self, values):
+        for d, dose in zip(self.info, values):
+            d["dose"] = None if dose is None or np.isnan(dose) else float(dose)
+
+    # ------------------------------------------------------------------
+    # Subconjuntos
+    # ------------------------------------------------------------------
+    def subset(self, selection):
+        """Espectros seleccionados por máscara booleana o índices"""
+        idx = np.arange(len(self))[selection]
+        return SpectrumSet(self.wavelength, self.values[idx], [self.info[i] for i in idx])
+
+    def with_dose(self):
+        """Solo los espectros con dosis conocida"""
+        return self.subset(~np.isnan(self.doses))
+
+    def sort_by_dose(self):
+        return self.subset(np.argsort(self.doses, kind="stable"))
+
+    def crop(self, x_min=None, x_max=None):
+        """Recorte en longitud de onda [x_min, x_max]"""
+        lo = 0 if x_min is None else np.searchsorted(self.wavelength, x_min, side="left")
+        hi = len(self.wavelength) if x_max is None else np.searchsorted(self.wavelength, x_max, side="right")
+        return SpectrumSet(self.wavelength[lo:hi], self.values[:, lo:hi], self.info)
+
+    def resample(self, grid):
+        """Remuestrea todos los espectros a otra rejilla (interpolación lineal)"""
+        grid = np.asarray(grid, dtype=float)
+        values = np.empty((len(self), len(grid)), dtype=np.float32)
+        for i, y in enumerate(self.values):
+            values[i] = np.interp(grid, self.wavelength, y, left=np.nan, right=np.nan)
+        return SpectrumSet(grid, values, self.info)
+
+    # ------------------------------------------------------------------
+    # Operaciones sobre la matriz
+    # ------------------------------------------------------------------
+    def at(self, target, tol=0.5):
+        """
+        Media y desviación típica de cada espectro en target ± tol (n,) y (n,).
+        NaN si la rejilla no tiene puntos en ese intervalo.
+        """
+        mask = np.abs(self.wavelength - target) <= tol
+        if not mask.any():
+            nan = np.full(len(self), np.nan)
+            return nan, nan
+        window = self.values[:, mask].astype(float)
+        std = window.std(axis=1, ddof=1) if window.shape[1] > 1 else np.zeros(len(self))
+        return window.mean(axis=1), std
+
+    def integrate(self, windows):
+        """
+        Áreas por trapecios de todos los espectros en las bandas (x_min, x_max):
+        (n, k) para k bandas, o (n,) para una sola banda (ver BandIntegration).
+        """
+        from BandIntegration import BandIntegrator
+
+        areas = BandIntegrator(self.wavelength, windows)(self.values)
+        return areas[:, 0] if np.ndim(windows) == 1 else areas
+
+    def smooth(self, window=11, polyorder=3):
+        """Suavizado Savitzky-Golay de todos los espectros a la vez"""
+        from scipy.signal import savgol_filter
+
+        values = savgol_filter(self.values, window, polyorder, axis=1)
+        return SpectrumSet(self.wavelength, values, self.info)
+
+    def optical_density(self, reference):
+        """OD = -log10(I / I0) de todos los espectros frente a la referencia I0 (misma rejilla)"""
+        reference = np.asarray(reference.values if isinstance(reference, Spectrum) else reference, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return SpectrumSet(self.wavelength, -np.log10(self.values / reference), self.info)
@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+
+from ResultStore import ResultStore
+
+
+def _store_with_measurement(tmp_path):
+    store = ResultStore(str(tmp_path / "Resultados.db"))
+    store.save_measurement("scan.tif", "P1", 10, 20, 2.5, 2.0, 0.1, 0.5)
+    return store
+
+
+def test_query_up_to_today_includes_today(tmp_path):
+    store = _store_with_measurement(tmp_path)
+    today = date.today()
+    assert len(store.query_measurements(date_to=today)) == 1
+    assert len(store.query_measurements(date_to=today.isoformat())) == 1
+    assert len(store.query_measurements(date_from=today, date_to=today)) == 1
+    store.close()
+
+
+def test_query_up_to_yesterday_excludes_today(tmp_path):
+    store = _store_with_measurement(tmp_path)
+    assert store.query_measurements(date_to=date.today() - timedelta(days=1)) == []
+    store.close()
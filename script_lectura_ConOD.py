@@ -1,34 +1,20 @@
 #Este codigo es para leer los archivos de espectros y graficarlos, asumiendo que ya tenemos la densidad óptica calculada.
 #Este codigo solo lee los archivos .txt y grafica la densidad óptica calculada.
 #El formato de los archivos .txt es el siguiente:
-#El primer bloque de 19 líneas es el encabezado, que no se necesita leer.
-#A partir de la línea 20 se encuentran los datos, que son dos columnas: la primera es el número de honda y la segunda es la densidad óptica.
-import os
-import numpy as np
+#Primero viene el encabezado (SpectraSuite o JASCO), que lee SpectrumIO.
+#Después los datos, que son dos columnas: la primera es el número de honda y la segunda es la densidad óptica.
+import sys
+from pathlib import Path
 import matplotlib.pyplot as plt
-import re
 
-def leer_archivos_txt(carpeta):
-    archivos = [f for f in os.listdir(carpeta) if f.endswith('.txt')]
-    datos = {}
-    
-    for archivo in archivos:
-        ruta = os.path.join(carpeta, archivo)
-        try:
-            data = np.loadtxt(ruta, skiprows=19,max_rows=1000)
-            datos[archivo] = data
-        except Exception as e:
-            print(f"Error al leer {archivo}: {e}")
-    
-    return datos
+# Lector de espectros compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'SoftwareLecturaRadiocromica'))
+from SpectrumSet import SpectrumSet
 
-def extract_dose_from_filename(filename):
-    # Busca #dosis# o la primera cifra
-    m = re.search(r'#(\d+\.?\d*)#', filename)
-    if m:
-        return float(m.group(1))
-    m2 = re.search(r'(\d+\.?\d*)', filename)
-    return float(m2.group(1)) if m2 else None
+def leer_archivos_txt(carpeta):
+    # Todos los espectros en una matriz sobre la misma rejilla; la dosis sale
+    # del nombre (#dosis# o la primera cifra)
+    return SpectrumSet.from_folder(carpeta)
 
 def graficar_datos(datos):
     # --- Configuración de estilo científico con LaTeX ---
@@ -42,21 +28,10 @@ def graficar_datos(datos):
     # --- Graficado ---
     fig, ax = plt.subplots(figsize=(6.6, 4.4))  # proporción 3:2
 
-    for archivo, data in datos.items():
-        if data.ndim == 1:
-            ax.plot(
-                data,
-                lw=1.2,
-                label=fr"{extract_dose_from_filename(archivo)}\,Gy"
-            )
-        elif data.ndim == 2 and data.shape[1] >= 2:
-            ax.plot(
-                data[:, 0], data[:, 1],
-                lw=1.2,
-                label=fr"{extract_dose_from_filename(archivo)}\,Gy"
-            )
-        else:
-            print(f"Formato desconocido en {archivo}, no se grafica.")     
+    # Una sola llamada para todas las curvas (columnas de values.T)
+    ax.plot(datos.wavelength, datos.values.T, lw=1.2)
+    for line, info in zip(ax.get_lines(), datos.info):
+        line.set_label(fr"{info['dose']}\,Gy")
 
     # Ejes y etiquetas
     ax.set_xlabel(r'Longitud de onda (nm)')
@@ -1,17 +1,22 @@
 #Este codigo: es para cuando NO tenemos la densidad optica y toca sacarla, apartir de la referencia.
 #Este codigo: crea una carpeta OD_resultados y guarda los resultados de la densidad optica en ella.
 import os
+import sys
+from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 
+# Lector de espectros compartido con el software de radiocromicas
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'SoftwareLecturaRadiocromica'))
+from SpectrumIO import read_spectrum
+
 # Ruta base
 base_path = r'C:\Users\luis-\Downloads\TFM\DatosEspectrometria\Datos19mayo\RC3'
 archivo_referencia = 'RC3_ref.txt'  # Cambia esto por el nombre de tu archivo de referencia
 # Leer I0 (referencia)
 i0_file = os.path.join(base_path, 'referencias', archivo_referencia)
-i0_data = np.loadtxt(i0_file, skiprows=19,max_rows=1000)
-i0 = i0_data[:, 1]  # segunda columna
+_, i0, _ = read_spectrum(i0_file)  # segunda columna
 
 # Buscar todos los archivos de espectros menos la referencia
 spectra_files = [f for f in os.listdir(base_path) if f.endswith('.txt') and archivo_referencia not in f]
@@ -25,14 +30,13 @@ plt.figure(figsize=(10, 6))
 
 for filename in spectra_files:
     filepath = os.path.join(base_path, filename)
-    data = np.loadtxt(filepath, skiprows=19,max_rows=1000)
-    if data.ndim == 1:
+    try:
+        # Primera columna: longitud de onda; segunda: I(l)
+        wavelength, intensity, _ = read_spectrum(filepath)
+    except ValueError:
         print(f"Formato desconocido en {filename}, omitiendo...")
         continue
     
-    wavelength = data[:, 0]  # Asumimos que la primera columna es longitud de onda
-    intensity = data[:, 1]   # Segunda columna es I(l)
-    
     # Asegurarse de que tengan misma longitud
     if len(i0) != len(intensity):
         print(f"Longitudes diferentes en {filename}, omitiendo...")